@@ -0,0 +1,236 @@
+import hashlib
+import json
+import os
+import tempfile
+import time
+
+import bpy
+import numpy
+
+from . import caching_utilities as cache
+
+MANIFEST_NAME = "bake_manifest.json"
+MANIFEST_VERSION = 4 # Increase this when the hashed content changes, so every texture is rebaked once
+
+class BakeManifest():
+    """Keeps track of the content hash of every texture that was baked into a directory.
+    The manifest is stored as a JSON file next to the textures: {"version": 1, "textures": {"BakedTexture_BaseColor.png" : "<sha1>"}}
+    Farm workers can bake into the same directory at the same time, so save() merges the textures recorded by this bake into the manifest on disk under a lock.
+    """
+    LOCK_TIMEOUT = 60.0 # Seconds to wait for another process to finish saving, a lock older than this is assumed to be left behind by a crashed process
+
+    def __init__(self, directory):
+        self.path = os.path.join(directory, MANIFEST_NAME)
+        self.lock_path = self.path + ".lock"
+        self.textures = self.load()
+        self.recorded_textures = {} # The textures recorded by this bake, they're the only ones written back to the manifest
+
+    def load(self):
+        """Read the textures from the manifest on disk: {file name : hash}"""
+        try:
+            with open(self.path) as manifest_file:
+                manifest = json.load(manifest_file)
+            if manifest.get("version") == MANIFEST_VERSION:
+                return manifest.get("textures", {})
+        except (OSError, ValueError, AttributeError):
+            pass # There is no manifest yet, or it can't be read, so every texture will be baked
+        return {}
+
+    def is_up_to_date(self, output_file, content_hash):
+        """Check if the texture was baked from the same content, and it still exists"""
+        return self.textures.get(os.path.basename(output_file)) == content_hash and os.path.isfile(output_file)
+
+    def record(self, output_file, content_hash):
+        self.textures[os.path.basename(output_file)] = content_hash
+        self.recorded_textures[os.path.basename(output_file)] = content_hash
+
+    def acquire_lock(self):
+        start_time = time.monotonic()
+        while True:
+            try:
+                os.close(os.open(self.lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)) # Creating the file fails if another process holds the lock
+                return
+            except FileExistsError:
+                try:
+                    if time.time() - os.path.getmtime(self.lock_path) > self.LOCK_TIMEOUT:
+                        os.remove(self.lock_path) # Left behind by a process that crashed while saving
+                        continue
+                except OSError:
+                    continue # The lock was released in the meantime
+                if time.monotonic() - start_time > self.LOCK_TIMEOUT:
+                    raise OSError("Timed out waiting for {p}".format(p = self.lock_path))
+                time.sleep(0.05)
+
+    def save(self):
+        """Merge the textures recorded by this bake into the manifest on disk, the records written by other processes are kept"""
+        self.acquire_lock()
+        try:
+            self.textures = self.load()
+            self.textures.update(self.recorded_textures)
+            # Write to a temporary file first so that an interrupted save doesn't leave a broken manifest behind, the name is unique to this process
+            file_descriptor, temporary_path = tempfile.mkstemp(prefix = MANIFEST_NAME + ".", suffix = ".tmp", dir = os.path.dirname(self.path))
+            try:
+                with os.fdopen(file_descriptor, "w") as manifest_file:
+                    json.dump({"version": MANIFEST_VERSION, "textures": self.textures}, manifest_file, indent = 4, sort_keys = True)
+                os.replace(temporary_path, self.path)
+            except BaseException:
+                if os.path.exists(temporary_path):
+                    os.remove(temporary_path)
+                raise
+        finally:
+            os.remove(self.lock_path)
+
+class BakeHasher():
+    """Builds the content hash for each baked texture.
+    The hash covers everything that affects the baked pixels: the material node trees, the mesh and UV data, the baking pass, and the bake settings.
+    Material and object hashes are kept for the whole bake, since they are shared by every pass.
+    """
+    # Node properties that only affect how the node is displayed in the node editor
+    ignored_node_properties = {"location", "width", "width_hidden", "height", "dimensions", "select", "hide", "mute_input", "show_options", "show_preview",
+                               "show_texture", "label", "color", "use_custom_color", "parent", "bl_width_default", "bl_width_min", "bl_width_max",
+                               "bl_height_default", "bl_height_min", "bl_height_max", "bl_icon", "bl_description", "bl_label"}
+
+    def __init__(self):
+        self.node_tree_hashes = {} # {node tree : hex digest}
+        self.object_hashes = {}    # {object : hex digest}
+
+    def hash_value(self, hasher, value):
+        """Add a property value to the hash"""
+        if isinstance(value, bpy.types.NodeTree):
+            hasher.update(self.hash_node_tree(value).encode()) # Node groups are hashed by their contents, not their name
+        elif isinstance(value, bpy.types.Image):
+            hasher.update(repr((value.name_full, value.source, value.filepath_raw, tuple(value.size), value.colorspace_settings.name)).encode())
+            image_path = bpy.path.abspath(value.filepath_raw)
+            if value.packed_file:
+                hasher.update(str(value.packed_file.size).encode())
+            elif os.path.isfile(image_path):
+                hasher.update(str(os.path.getmtime(image_path)).encode()) # The image file was edited since the last bake
+        elif isinstance(value, bpy.types.ID):
+            hasher.update(value.name_full.encode())
+        else:
+            hasher.update(repr(value).encode())
+
+    def hash_properties(self, hasher, struct, ignored_properties = ()):
+        """Add the RNA property values of a bpy_struct to the hash"""
+        schema = cache.PropertySchema.get_schema(struct)
+        for entry in schema.entries:
+            if entry.identifier in ignored_properties:
+                continue
+            hasher.update(entry.path.encode())
+            self.hash_value(hasher, entry.read_value(struct))
+
+    def hash_socket_values(self, hasher, sockets):
+        """Add the default values of node sockets to the hash, Value and RGB nodes keep their value in their output socket"""
+        for socket in sockets:
+            hasher.update(socket.identifier.encode())
+            if hasattr(socket, "default_value"):
+                default_value = socket.default_value
+                self.hash_value(hasher, default_value if isinstance(default_value, (bpy.types.ID, str, int, float, bool)) else tuple(default_value))
+
+    def hash_node_collections(self, hasher, node):
+        """Add the collections of a node to the hash, the property schema skips collections so they have to be walked here.
+        ColorRamp nodes keep their stops in color_ramp.elements, and the RGB, Vector, and Float Curves nodes keep their points in mapping.curves.
+        """
+        color_ramp = getattr(node, "color_ramp", None)
+        if color_ramp is not None:
+            hasher.update(repr([(element.position, tuple(element.color)) for element in color_ramp.elements]).encode())
+        mapping = getattr(node, "mapping", None)
+        if mapping is not None and hasattr(mapping, "curves"):
+            for curve in mapping.curves:
+                hasher.update(repr([(tuple(point.location), point.handle_type) for point in curve.points]).encode())
+
+    def hash_node_tree(self, node_tree):
+        if node_tree in self.node_tree_hashes:
+            return self.node_tree_hashes[node_tree]
+
+        hasher = hashlib.sha1()
+        for node in sorted(node_tree.nodes, key = lambda node: node.name):
+            hasher.update(node.bl_idname.encode())
+            self.hash_properties(hasher, node, self.ignored_node_properties)
+            self.hash_node_collections(hasher, node)
+            self.hash_socket_values(hasher, node.inputs)
+            self.hash_socket_values(hasher, node.outputs)
+
+        links = sorted((link.from_node.name, link.from_socket.identifier, link.to_node.name, link.to_socket.identifier, link.is_muted) for link in node_tree.links)
+        hasher.update(repr(links).encode())
+
+        self.node_tree_hashes[node_tree] = hasher.hexdigest()
+        return self.node_tree_hashes[node_tree]
+
+    def hash_object(self, object):
+        """Hash the geometry, UVs, material slots, transform, and modifiers of an object. Returns None for object types that can't be hashed."""
+        if object in self.object_hashes:
+            return self.object_hashes[object]
+
+        content_hash = None
+        if object.type == 'MESH':
+            mesh = object.data
+            hasher = hashlib.sha1()
+            hasher.update(numpy.array(object.matrix_world, dtype = numpy.float32).tobytes()) # Selected to Active bakes depend on where the objects are relative to each other
+
+            # Read the mesh data in bulk
+            # The slot of each face decides which material lands where, now that every material slot is baked
+            for collection, attribute, dtype, size in ((mesh.vertices, "co",             numpy.float32, 3),
+                                                       (mesh.loops,    "vertex_index",   numpy.int32,   1),
+                                                       (mesh.polygons, "loop_start",     numpy.int32,   1),
+                                                       (mesh.polygons, "use_smooth",     numpy.bool_,   1),
+                                                       (mesh.polygons, "material_index", numpy.int32,   1)):
+                values = numpy.empty(len(collection) * size, dtype = dtype)
+                collection.foreach_get(attribute, values)
+                hasher.update(values.tobytes())
+
+            hasher.update(repr([material_slot.material.name_full if material_slot.material else "" for material_slot in object.material_slots]).encode()) # The material in each slot, in slot order
+
+            uv_layer = mesh.uv_layers.active
+            if uv_layer:
+                uvs = numpy.empty(len(uv_layer.data) * 2, dtype = numpy.float32)
+                uv_layer.data.foreach_get("uv", uvs)
+                hasher.update(uvs.tobytes())
+
+            # Color attributes can be read by Attribute and Color Attribute nodes
+            color_attributes = getattr(mesh, "color_attributes", None) # Blender 3.2 and newer
+            if color_attributes is None:
+                color_attributes = mesh.vertex_colors
+            else:
+                hasher.update(repr((getattr(color_attributes, "active_color_name", None), color_attributes.render_color_index)).encode()) # active_color_name is Blender 3.5 and newer
+            for color_attribute in color_attributes:
+                hasher.update(repr((color_attribute.name, getattr(color_attribute, "domain", 'CORNER'), getattr(color_attribute, "data_type", 'BYTE_COLOR'))).encode())
+                colors = numpy.empty(len(color_attribute.data) * 4, dtype = numpy.float32)
+                color_attribute.data.foreach_get("color", colors)
+                hasher.update(colors.tobytes())
+
+            for modifier in object.modifiers:
+                hasher.update(modifier.type.encode())
+                self.hash_properties(hasher, modifier)
+
+            content_hash = hasher.hexdigest()
+
+        self.object_hashes[object] = content_hash
+        return content_hash
+
+    def hash_output(self, bake_job, baking_pass, settings, image_settings, bake_settings):
+        """Hash everything that goes into a single baked texture. Returns None if part of the content can't be hashed, so the texture should always be baked."""
+        hasher = hashlib.sha1()
+        hasher.update(str(MANIFEST_VERSION).encode())
+
+        # Baking pass and texture settings
+        pass_fields = ("name", "suffix", "file_format", "color_depth", "texture_node_color_space", "use_channel_packing", "channel_red", "channel_green", "channel_blue")
+        hasher.update(repr([getattr(baking_pass, field) for field in pass_fields]).encode())
+        hasher.update(repr((bake_job.texture_size, bake_job.use_selected_to_active, settings.skip_constant_passes, settings.constant_texture_size)).encode())
+
+        # Image settings, and the render and cycles settings that were overridden for the bake
+        for cached_properties in [image_settings] + bake_settings:
+            hasher.update(repr(sorted((entry.path, repr(value)) for entry, value in cached_properties.get_assigned_entries())).encode())
+
+        # Materials and objects
+        for material in bake_job.materials_to_bake_to + bake_job.materials_to_bake_from:
+            hasher.update(material.name_full.encode())
+            hasher.update(self.hash_node_tree(material.node_tree).encode())
+        for object in [bake_job.object_to_bake_to] + bake_job.objects_to_bake_from:
+            object_hash = self.hash_object(object)
+            if object_hash is None:
+                return None
+            hasher.update(object.name_full.encode())
+            hasher.update(object_hash.encode())
+
+        return hasher.hexdigest()
@@ -0,0 +1,73 @@
+import json
+import os
+import zlib
+
+# A bake preset holds the render settings and cycles settings that are overridden for a bake, so they can be shared between artists and farm workers
+# The file is JSON, or the same JSON compressed with zlib behind a short header for the binary form:
+# {"format": "bakery_preset", "version": 1, "settings": {"render": {"type": "RenderSettings", "properties": {...}}, "cycles": {"type": "CyclesRenderSettings", "properties": {...}}}}
+PRESET_FORMAT = "bakery_preset"
+PRESET_VERSION = 1
+BINARY_HEADER = b"BAKERYPRESET\x00"
+BINARY_EXTENSION = ".bkpreset"
+PRESET_SETTINGS = ("render", "cycles") # The scene attributes that a preset can override
+
+loaded_presets = {} # Presets that have already been read, they're read again if the file changes: {path : ((modified time, size), settings)}
+
+def encode_preset(cached_settings, binary = False):
+    """Encode CachedProperties into the contents of a preset file: {"render" : CachedProperties, "cycles" : CachedProperties}"""
+    preset = {"format":   PRESET_FORMAT,
+              "version":  PRESET_VERSION,
+              "settings": {name : cached_properties.to_dict() for name, cached_properties in cached_settings.items()}}
+    if binary:
+        return BINARY_HEADER + zlib.compress(json.dumps(preset, separators = (",", ":")).encode(), 9)
+    return json.dumps(preset, indent = 4).encode()
+
+def decode_preset(data):
+    """Decode the contents of a preset file, the binary form is recognized by its header. Returns the values of each of the scene's settings: {"render" : {...}, "cycles" : {...}}"""
+    try:
+        if data.startswith(BINARY_HEADER):
+            data = zlib.decompress(data[len(BINARY_HEADER):])
+        preset = json.loads(data)
+    except (zlib.error, ValueError) as e:
+        raise ValueError("Not a valid bake preset: {e}".format(e = e))
+
+    if not isinstance(preset, dict) or preset.get("format") != PRESET_FORMAT:
+        raise ValueError("Not a bake preset")
+    if preset.get("version") != PRESET_VERSION:
+        raise ValueError("Bake preset version {v} is not supported, expected version {e}".format(v = preset.get("version"), e = PRESET_VERSION))
+    settings = preset.get("settings", {})
+    if not isinstance(settings, dict):
+        raise ValueError("The settings of a bake preset must be a JSON object")
+    unknown_settings = set(settings) - set(PRESET_SETTINGS)
+    if unknown_settings:
+        raise ValueError("Bake presets can only override {s}, not {u}".format(s = list(PRESET_SETTINGS), u = sorted(unknown_settings)))
+    for name, values in settings.items():
+        # Each of the settings is the output of CachedProperties.to_dict(): {"type": "RenderSettings", "properties": {...}}
+        if not isinstance(values, dict) or not isinstance(values.get("type"), str) or not isinstance(values.get("properties", {}), dict):
+            raise ValueError("The \"{n}\" settings of the bake preset must be an object with a \"type\" and a \"properties\" object".format(n = name))
+    return settings
+
+def save_preset(path, cached_settings, binary = None):
+    """Write a preset file, it's written in the binary form if binary is True, or if binary is None and the path ends with ".bkpreset" """
+    if binary is None:
+        binary = path.lower().endswith(BINARY_EXTENSION)
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok = True)
+    with open(path, "wb") as preset_file:
+        preset_file.write(encode_preset(cached_settings, binary))
+
+def load_preset(path):
+    """Read a preset file, the file is only decoded again if it has changed since it was last loaded.
+    The values are validated against the scene's settings when they're loaded into CachedProperties with load_dict().
+    """
+    stat = os.stat(path)
+    file_key = (stat.st_mtime_ns, stat.st_size)
+    loaded_preset = loaded_presets.get(path)
+    if loaded_preset and loaded_preset[0] == file_key:
+        return loaded_preset[1]
+
+    with open(path, "rb") as preset_file:
+        settings = decode_preset(preset_file.read())
+    loaded_presets[path] = (file_key, settings)
+    return settings
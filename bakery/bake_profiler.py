@@ -0,0 +1,127 @@
+import contextlib
+import json
+import os
+import threading
+import time
+
+PROFILE_NAME = "bake_profile" # Written next to the textures, with the bake's name and start time: "bake_profile_Props_20240501-221500.json" and "bake_profile_Props_20240501-221500.trace.json"
+
+def get_memory_usage():
+    """Get the resident memory of the Blender process in bytes, or None if it can't be read on this platform.
+    Blender's own allocations don't go through Python's allocator, so the operating system's count is used instead of tracemalloc.
+    """
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") # Linux: current resident set size
+    except (OSError, ValueError, AttributeError):
+        pass
+    try:
+        import resource
+        import sys
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss # macOS and BSD: the peak resident set size, it never goes down
+        return peak if sys.platform == "darwin" else peak * 1024
+    except (ImportError, OSError):
+        return None # Windows
+
+class ProfiledStage():
+    """A single timed stage of a bake"""
+    def __init__(self, name, category, start, depth, args):
+        self.name          = name     # Example: "bake"
+        self.category      = category # Example: "pass"
+        self.start         = start    # Seconds since the profiler was started
+        self.duration      = 0.0
+        self.depth         = depth    # Number of stages this one is nested in
+        self.args          = args     # Details about the stage. Example: {"pass": "Roughness", "texture_set": "Crate"}
+        self.memory_before = None
+        self.memory_after  = None
+
+    def to_dict(self):
+        return {"name":          self.name,
+                "category":      self.category,
+                "start":         self.start,
+                "duration":      self.duration,
+                "depth":         self.depth,
+                "args":          self.args,
+                "memory_before": self.memory_before,
+                "memory_after":  self.memory_after}
+
+class BakeProfiler():
+    """Records the wall time, and optionally the memory, of each stage of a bake.
+    Stages are recorded with the stage() context manager, they can be nested. A disabled profiler records nothing and costs next to nothing.
+    The stages can be exported as JSON, and as a Chrome trace event file that can be opened in chrome://tracing or https://ui.perfetto.dev
+    """
+    def __init__(self, enabled = True, record_memory = False):
+        self.enabled = enabled
+        self.record_memory = record_memory
+        self.stages = []
+        self.depth = 0
+        self.start_time = time.perf_counter()
+        self.start_date = time.localtime() # Part of the file names, so later bakes don't overwrite the profile
+        self.thread_id = threading.get_ident()
+
+    def stage(self, name, category = "stage", **args):
+        if not self.enabled:
+            return contextlib.nullcontext()
+        return self.record_stage(name, category, args)
+
+    @contextlib.contextmanager
+    def record_stage(self, name, category, args):
+        stage = ProfiledStage(name, category, time.perf_counter() - self.start_time, self.depth, args)
+        self.stages.append(stage)
+        if self.record_memory:
+            stage.memory_before = get_memory_usage()
+        self.depth += 1
+        try:
+            yield stage
+        finally:
+            self.depth -= 1
+            stage.duration = time.perf_counter() - self.start_time - stage.start
+            if self.record_memory:
+                stage.memory_after = get_memory_usage()
+
+    def get_totals(self, category = None):
+        """Get the total time spent in each stage name, optionally only for the stages of one category: {name : seconds}"""
+        totals = {}
+        for stage in self.stages:
+            if category is None or stage.category == category:
+                totals[stage.name] = totals.get(stage.name, 0.0) + stage.duration
+        return totals
+
+    def summary(self, stage_count = 5):
+        """Get a single line with the stages that took the most time, for the operator report.
+        Only the "stage" category is counted, the "job" and "pass" categories group the stages that do the work.
+        """
+        total = sum(stage.duration for stage in self.stages if stage.depth == 0)
+        slowest = sorted(self.get_totals("stage").items(), key = lambda item: item[1], reverse = True)[:stage_count]
+        return "Bake took {t:.2f}s: ".format(t = total) + ", ".join("{n} {d:.2f}s".format(n = name, d = duration) for name, duration in slowest)
+
+    def to_dict(self):
+        return {"stages": [stage.to_dict() for stage in self.stages],
+                "totals": self.get_totals("stage")}
+
+    def to_trace_events(self):
+        """Convert the stages to the Chrome trace event format, times are in microseconds"""
+        process_id = os.getpid()
+        events = []
+        for stage in self.stages:
+            events.append({"name": stage.name, "cat": stage.category, "ph": "X", "pid": process_id, "tid": self.thread_id,
+                           "ts": stage.start * 1e6, "dur": stage.duration * 1e6, "args": stage.args})
+            if stage.memory_before is not None:
+                events.append({"name": "memory", "ph": "C", "pid": process_id, "ts": stage.start * 1e6, "args": {"resident_mb": stage.memory_before / (1024 * 1024)}})
+            if stage.memory_after is not None:
+                events.append({"name": "memory", "ph": "C", "pid": process_id, "ts": (stage.start + stage.duration) * 1e6, "args": {"resident_mb": stage.memory_after / (1024 * 1024)}})
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+    def save(self, directory, name = None):
+        """Write the JSON profile and the Chrome trace to the directory. Returns the paths that were written.
+        The file names include the name and the time the profiler was started, so profiles of different work units and later bakes are kept side by side.
+        """
+        os.makedirs(directory, exist_ok = True)
+        base_name = "_".join(part for part in (PROFILE_NAME, name, time.strftime("%Y%m%d-%H%M%S", self.start_date)) if part)
+        paths = []
+        for file_name, data in ((base_name + ".json", self.to_dict()), (base_name + ".trace.json", self.to_trace_events())):
+            path = os.path.join(directory, file_name)
+            with open(path, "w") as profile_file:
+                json.dump(data, profile_file, indent = 1)
+            paths.append(path)
+        return paths
@@ -0,0 +1,128 @@
+from . import caching_utilities as cache
+
+class BakeRig():
+    """The temporary nodes that route a material's values into a bake.
+    The rig is inserted into a material the first time a pass needs it, and it's retargeted between passes by relinking sockets and swapping the image,
+    so the node tree only gains and loses nodes once per bake job instead of once per pass. Every node is removed, and the original output links restored, by teardown().
+    """
+    def __init__(self, material, is_source = True):
+        self.material = material
+        self.node_tree = material.node_tree
+        self.nodes = []            # Every node added by the rig, so they can all be removed during teardown
+        self.node_image = None     # The image texture node that receives the bake, only used by the material being baked to
+        self.node_emission = None
+        self.node_combine = None
+        self.value_nodes = []      # Value nodes are reused between passes, value_nodes_in_use counts the ones that are hooked up for the current pass
+        self.value_nodes_in_use = 0
+
+        # Cache the original links to the output nodes (Surface, Volume, and Displacement) so they can be recovered later
+        self.node_output = None
+        self.node_shader = None
+        self.original_links = None
+        if is_source:
+            self.node_output = self.node_tree.nodes["Material Output"]
+            self.original_links = cache.NodeTreeSnapshot(self.node_tree, [self.node_output])
+            link = self.node_output.inputs[0].links[0]
+            self.node_shader = link.from_node # The node on the left side that is outputting the link
+            if self.node_shader.bl_idname != 'ShaderNodeBsdfPrincipled':
+                print("This node is not supported") # TODO support more nodes
+
+    def add_node(self, node_type):
+        node = self.node_tree.nodes.new(node_type)
+        self.nodes.append(node)
+        return node
+
+    def link(self, input_socket, output_socket):
+        """Link the sockets, unless they're already linked. Every new link makes Blender recompile the material's shaders."""
+        socket_links = input_socket.links
+        if socket_links and socket_links[0].from_socket == output_socket:
+            return
+        self.node_tree.links.new(input_socket, output_socket)
+
+    def set_target_image(self, image, color_space):
+        """Make the image the one that receives the bake"""
+        if self.node_image is None:
+            self.node_image = self.add_node('ShaderNodeTexImage')
+            self.node_image.location = [0, 0]
+            self.node_image.label = 'BakingTexture'
+            self.node_image.name = 'BakingTexture'
+        self.node_image.image = image
+        self.node_image.image.colorspace_settings.name = color_space
+        self.node_image.select = True # Make the node the active selection so that it will receive the bake.
+        self.node_tree.nodes.active = self.node_image # Make the node the active node so that it will receive the bake.
+
+    def route_through_shader(self):
+        """Hook the original shader back up to the output, for passes that bake the whole shader"""
+        self.original_links.restore()
+
+    def route_through_emission(self, socket_names):
+        """Hook the output up to an Emission node that emits the values of the shader's sockets.
+        A single socket name is emitted directly, three names are packed into the red, green, and blue channels through a Combine Color node.
+        """
+        if self.node_emission is None:
+            self.node_emission = self.add_node('ShaderNodeEmission')
+        self.link(self.node_output.inputs[0], self.node_emission.outputs['Emission']) # Hook up the emission node to the surface output
+        self.value_nodes_in_use = 0
+
+        if len(socket_names) == 1:
+            self.hook_up_socket_value(socket_names[0], self.node_emission.inputs[0])
+            return
+
+        # Route each of the packed channels through a Combine Color node, so all of the channels can be baked into a single image with a single bake
+        if self.node_combine is None:
+            self.node_combine = self.add_node('ShaderNodeCombineColor')
+        self.link(self.node_emission.inputs[0], self.node_combine.outputs['Color'])
+        for socket_name, channel_input in zip(socket_names, self.node_combine.inputs): # The "Red", "Green", and "Blue" inputs
+            self.hook_up_socket_value(socket_name, channel_input)
+
+    def hook_up_socket_value(self, socket_name, input_socket):
+        """Connect the value of one of the shader's input sockets to the given input socket"""
+        # Packed channels that aren't using a shader socket are filled with a constant
+        if socket_name == 'NONE':
+            self.set_socket_value(input_socket, 0.0)
+            return
+        elif socket_name == 'ONE':
+            self.set_socket_value(input_socket, 1.0)
+            return
+
+        # If there are links to the socket, hook them up to the input socket
+        socket = self.node_shader.inputs[socket_name]
+        if len(socket.links):
+            self.link(input_socket, socket.links[0].from_socket)
+        # If there are no links to the socket, assign the socket's default_value to the input socket
+        else:
+            if socket.type == input_socket.type:
+                self.set_socket_value(input_socket, socket.default_value)
+            elif socket.type == 'VALUE':
+                # A single value can't be assigned to a color socket, output it from a Value node instead
+                if self.value_nodes_in_use == len(self.value_nodes):
+                    self.value_nodes.append(self.add_node('ShaderNodeValue'))
+                node_value = self.value_nodes[self.value_nodes_in_use]
+                self.value_nodes_in_use += 1
+                node_value.outputs[0].default_value = socket.default_value
+                self.link(input_socket, node_value.outputs[0])
+            elif socket.type == 'VECTOR':
+                pass # TODO handle other types as well
+            else:
+                pass # TODO handle other types as well
+
+    def set_socket_value(self, input_socket, value):
+        """Assign a constant to an input socket, removing the link that a previous pass hooked up to it"""
+        for link in input_socket.links:
+            self.node_tree.links.remove(link)
+        input_socket.default_value = value
+
+    def teardown(self):
+        """Remove every node the rig added and restore the original links to the outputs.
+        Raises LinkFailedError if any of the original links can't be restored.
+        """
+        for node in self.nodes:
+            self.node_tree.nodes.remove(node)
+        self.nodes = []
+        self.node_image = None
+        self.node_emission = None
+        self.node_combine = None
+        self.value_nodes = []
+
+        if self.original_links:
+            self.original_links.restore() # Hook up the original nodes to the outputs
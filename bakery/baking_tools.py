@@ -1,278 +1,733 @@
 import bpy
+import contextlib
+import numpy
+import os
+from bpy_extras.io_utils import ExportHelper
+from . import bake_presets
 from . import caching_utilities as cache
-
-class OBJECT_OT_BatchBake(bpy.types.Operator):
-    """Batch bake textures"""
-    bl_label = "BatchBake"
-    bl_idname = "object.batch_baker"
-    bl_description = "Batch bakes textures"
-
+from . import memory_planner
+from .bake_manifest import BakeManifest, BakeHasher
+from .bake_profiler import BakeProfiler
+from .bake_rig import BakeRig
+from .image_pool import ImagePool
+from .texture_writeback import TextureWriteback, TiledTextureWriter
+
+def linear_to_srgb(value):
+    """Convert a linear color channel value to the sRGB transfer function"""
+    if value <= 0.0031308:
+        return value * 12.92
+    return 1.055 * (value ** (1.0 / 2.4)) - 0.055
+
+def get_slot_materials(objects):
+    """Get the materials in every material slot of the objects, each material is only listed once even if it's used by more than one slot or object"""
+    materials = []
+    for object in objects:
+        for material_slot in object.material_slots:
+            if material_slot.material and material_slot.material not in materials:
+                materials.append(material_slot.material)
+    return materials
+
+class BakeJob():
+    """The objects and materials that will be baked into a single texture set"""
+    def __init__(self, texture_set_name, object_to_bake_to, materials_to_bake_to, objects_to_bake_from, materials_to_bake_from, texture_size, use_selected_to_active):
+        self.texture_set_name       = texture_set_name       # Name used for the baked texture files. Example: "BakedTexture" -> "BakedTexture_BaseColor.png"
+        self.object_to_bake_to      = object_to_bake_to      # The object that will be active during the bake
+        self.materials_to_bake_to   = materials_to_bake_to   # The materials in every slot of the object to bake to, each one receives the baking image texture node so a single bake covers the whole object
+        self.objects_to_bake_from   = objects_to_bake_from   # The objects that will be selected during the bake, this is empty when an object bakes to itself
+        self.materials_to_bake_from = materials_to_bake_from # The materials that will be rewired to output each baking pass
+        self.texture_size           = texture_size           # Resolution of the baked textures, queued jobs can override the scene's resolution
+        self.use_selected_to_active = use_selected_to_active # Bake from the selected objects to the active object instead of from each object to itself
+
+class BatchBake():
+    """Bakes every enabled baking pass of the scene's baking_passes, using the scene's baking_tools_settings.
+    The batch_baker operator bakes the current selection with it, the headless entry point bakes the objects listed in a job spec.
+    """
     bakeable_types = ('MESH', 'CURVE', 'SURFACE', 'META', 'FONT', 'CURVES', 'POINTCLOUD', 'VOLUME')
     illegal_characters = (' ', '!', '@', '#', '$', '%', '^', '&', '*', '(', ')', '{', '}', ':', '\"', ';', '\'', '[', ']', '<', '>', ',', '.', '\\', '/', '?')
 
-    def execute(self, context):
+    def __init__(self, report = None, restore_state = True, profile_name = None):
+        self.report_callback = report        # The operator's report(), messages are printed if this isn't set
+        self.restore_state   = restore_state # Restore the render settings and the selection after the bake, a headless bake exits right after so it can skip this
+        self.profile_name    = profile_name  # Added to the profile's file names, the texture set name is used if this isn't set. Example: a farm work unit's id
+        self.messages        = []            # Every message that was reported: [(level, message)]
+        self.selection_state = None          # The view layer's selection before the bake, recorded once the bake has been set up
+        self.profiler        = BakeProfiler(enabled = False) # Replaced in setup_bake() once the scene's settings are known
+
+    def report(self, level, message):
+        self.messages.append((next(iter(level)), message))
+        if self.report_callback:
+            self.report_callback(level, message)
+        else:
+            print("{l}: {m}".format(l = next(iter(level)), m = message))
+
+    def execute(self, context, selected_objects, active_object):
+        """Bake the selected objects, the active object is the one baked to for the 'Selected to Active' bake source. Returns {'FINISHED'} or {'CANCELLED'}"""
+        with self.original_state_restored(context):
+            if not self.setup_bake(context, selected_objects, active_object):
+                return {'CANCELLED'}
+
+            try:
+                if self.settings.bake_source == "SELF":
+                    bake_jobs = self.setup_baking_source_self(context)
+                elif self.settings.bake_source == "SELECTED_TO_ACTIVE":
+                    bake_jobs = [self.setup_baking_source_selected_to_active(context)]
+                # elif self.settings.bake_source == "UI_LIST":
+                    # pass
+            except RuntimeError as e:
+                self.report({'WARNING'}, str(e))
+                return {'CANCELLED'}
+
+            status = self.bake_jobs(context, bake_jobs)
+        self.save_profile()
+        return status
+
+    def execute_queue(self, context, bake_queue):
+        """Bake every job in the scene's bake queue.
+        The render settings, cycles settings, and image settings are set up and restored once for the whole queue instead of once for each job.
+        A job that fails is marked as failed in the queue, and the rest of the queue is still baked.
+        """
+        with self.original_state_restored(context):
+            if not self.setup_bake(context, context.selected_objects, context.active_object):
+                return {'CANCELLED'}
+
+            queued_jobs = {} # {bake job : queue job}
+            texture_set_names = set()
+            for queue_job in bake_queue:
+                queue_job.status = 'QUEUED'
+                queue_job.message = ""
+                try:
+                    # The names can be edited in the queue, two jobs with the same name would write the same files
+                    bake_job = self.setup_queued_bake_job(queue_job)
+                    if bake_job.texture_set_name in texture_set_names:
+                        raise RuntimeError("Another queued job already bakes the texture set {n}".format(n = bake_job.texture_set_name))
+                    texture_set_names.add(bake_job.texture_set_name)
+                    queued_jobs[bake_job] = queue_job
+                except RuntimeError as e:
+                    queue_job.status = 'FAILED'
+                    queue_job.message = str(e)
+                    self.report({'WARNING'}, "{n}: {e}".format(n = queue_job.texture_set_name, e = e))
+
+            status = self.bake_jobs(context, list(queued_jobs), isolate_failures = True)
+
+            for bake_job, queue_job in queued_jobs.items():
+                error = self.failed_jobs.get(bake_job)
+                queue_job.status = 'FAILED' if error else 'FINISHED'
+                queue_job.message = error or ""
+            failed_count = sum(queue_job.status == 'FAILED' for queue_job in bake_queue)
+            self.report({'WARNING'} if failed_count else {'INFO'}, "Baked {n} of {t} queued jobs".format(n = len(bake_queue) - failed_count, t = len(bake_queue)))
+        self.save_profile()
+        return status
+
+    def setup_bake(self, context, selected_objects, active_object):
+        """Set up everything that is shared by the bake jobs. Returns False if the bake can't start."""
         self.settings = context.scene.baking_tools_settings
+        self.profiler = BakeProfiler(enabled = self.settings.use_profiling, record_memory = self.settings.use_memory_profiling)
 
         if not self.settings.export_path:
             self.report({'WARNING'}, "Choose a texture output path before baking.")
-            return {'CANCELLED'}
+            return False
 
         delimiter = self.settings.texture_name_delimiter
         for illegal_character in self.illegal_characters:
             if illegal_character in delimiter:
                 self.report({'WARNING'}, "Can't use illegal character \"{c}\" in file name delimiter.".format(c= illegal_character))
-                return {'CANCELLED'}
+                return False
 
-        self.cache_original_render_and_cycles_settings(context) # Cache the original render settings and cycles settings so they can be restored later
-        self.setup_render_and_cycles_settings_for_baking(context) # Set up the settings that we need to perform baking operations in Cycles
+        cache.CachedProperties.clear_enum_items_cache() # The valid enum_items can depend on preferences and the color management configuration, which may have changed since the last bake
+        self.setup_setting_overrides(context) # Record the original value of every setting the bake overrides so they can be restored later
+        try:
+            with self.profiler.stage("setup settings"):
+                self.setup_render_and_cycles_settings_for_baking(context) # Set up the settings that we need to perform baking operations in Cycles
+        except (OSError, ValueError) as e:
+            self.report({'WARNING'}, "Bake preset could not be loaded: {e}".format(e = e))
+            return False
 
         # Set up the image settings that will be used for each baking pass
         try:
             self.image_settings = {} # Keep a dictionary of the image settings for each baking pass since the Baking_Pass class can't retain values for properties that don't inherit from Blender's Property class
-            self.setup_image_settings()
+            with self.profiler.stage("setup image settings"):
+                self.setup_image_settings()
         except KeyError as e:
             print(repr(e))
-            return {'CANCELLED'}
-
-        self.cache_original_selection(context) # Cache the original selection and active object so they can be reselected later
-        # Deselect everything
-        for object in bpy.data.objects:
-            object.select_set(False)
-        context.view_layer.objects.active = None
-
-        try:
-            if self.settings.bake_source == "SELF":
-                self.setup_baking_source_self(context)
-            elif self.settings.bake_source == "SELECTED_TO_ACTIVE":
-                self.setup_baking_source_selected_to_active(context)
-            # elif self.settings.bake_source == "UI_LIST":
-                # pass
-        except RuntimeError as e:
-            self.restore_original_render_and_cycles_settings(context)
-            self.restore_original_selection(context)
-            self.report({'WARNING'}, str(e))
-            return {'CANCELLED'}
-
+            return False
+
+        self.cache_original_selection(context, selected_objects, active_object) # Cache the original selection and active object so they can be reselected later
+        self.selection_state.deselect_all() # Only the objects that are selected are visited, not every object in the file
+        return True
+
+    def bake_jobs(self, context, bake_jobs, isolate_failures = False):
+        """Bake each job. Returns {'FINISHED'} or {'CANCELLED'}.
+        With isolate_failures, a job that fails is recorded in failed_jobs and the next job is still baked, otherwise the first failure cancels the bake.
+        """
+        self.failed_jobs = {} # {bake job : error message}
+        self.output_jobs = {} # The bake job that each texture was saved for, so textures that fail to write can be traced back to their job: {output file : bake job}
+
+        # Images are leased from a pool for each pass, and they're all freed at the end of the bake
+        self.image_pool = ImagePool()
+
+        # Textures can be encoded and written on background threads while the next pass bakes
+        self.texture_writeback = TextureWriteback() if self.settings.use_async_writeback else None
+
+        # Incremental baking: skip textures whose content hash hasn't changed since they were last baked
+        self.bake_manifest = None
+        self.manifest_records = {} # Hashes of the textures saved during this bake, recorded once each texture has been saved or handed to the writeback: {output file : hash}
+        self.unchanged_texture_count = 0
+        if self.settings.use_incremental_bake:
+            self.bake_manifest = BakeManifest(bpy.path.abspath(self.settings.export_path))
+            self.bake_hasher = BakeHasher()
+
+        # Split the passes into batches that stay under the memory budget, the image pool is freed and the texture writes are flushed between batches
+        self.memory_plan = None
+        if self.settings.memory_budget_mb:
+            with self.profiler.stage("plan memory"):
+                self.memory_plan = memory_planner.plan_bake_jobs(self.settings, bake_jobs, context.evaluated_depsgraph_get())
+            print(self.memory_plan.summary())
+            for texture_set_name, pass_name, pass_bytes in self.memory_plan.over_budget:
+                self.report({'WARNING'}, "{t} {p} is estimated to need {m:.0f} MB, more than the memory budget".format(t = texture_set_name, p = pass_name, m = pass_bytes / memory_planner.MB))
+
+        # The render settings, cycles settings, and image settings were set up once in setup_bake(), and they are shared by every bake job
         try:
-            self.perform_bake(context, self.materials_to_bake_from, self.material_to_bake_to)        
+            for bake_job in bake_jobs:
+                with self.profiler.stage("job", "job", texture_set = bake_job.texture_set_name, object = bake_job.object_to_bake_to.name):
+                    self.select_bake_job(context, bake_job)
+                    try:
+                        self.perform_bake(context, bake_job)
+                    except Exception as e:
+                        if not isolate_failures:
+                            raise
+                        self.failed_jobs[bake_job] = str(e)
+                        self.image_pool.release_all() # Images are released once they're saved, the pass that failed still holds its image
+                        self.report({'WARNING'}, "{t} failed: {e}".format(t = bake_job.texture_set_name, e = e))
+                    self.deselect_bake_job(context, bake_job)
         except Exception as e:
-            self.restore_original_render_and_cycles_settings(context)
-            self.restore_original_selection(context)
+            self.finish_texture_writeback()
+            self.image_pool.free()
+            self.save_bake_manifest()
             self.report({'WARNING'}, str(e))
             return {'CANCELLED'}
 
-        self.restore_original_render_and_cycles_settings(context)
-        self.restore_original_selection(context)
+        # Make sure every texture has been written before the settings are restored
+        with self.profiler.stage("finish writeback"):
+            textures_written = self.finish_texture_writeback()
+        self.image_pool.free()
+        self.save_bake_manifest()
+        for filepath in self.failed_filepaths:
+            if self.output_jobs.get(filepath) and self.output_jobs[filepath] not in self.failed_jobs:
+                self.failed_jobs[self.output_jobs[filepath]] = "{f} could not be written".format(f = filepath)
+        if not textures_written:
+            return {'CANCELLED'}
+        if self.unchanged_texture_count:
+            self.report({'INFO'}, "Skipped {n} unchanged textures".format(n = self.unchanged_texture_count))
         return {'FINISHED'}
 
+    def save_profile(self):
+        """Write the profile next to the textures and report a summary of where the time went"""
+        if not self.profiler.enabled:
+            return
+        self.report({'INFO'}, self.profiler.summary())
+        try:
+            paths = self.profiler.save(bpy.path.abspath(self.settings.export_path), bpy.path.clean_name(self.profile_name or self.settings.texture_set_name))
+            print("Bake profile written to {p}".format(p = ", ".join(paths)))
+        except OSError as e:
+            self.report({'WARNING'}, "Bake profile could not be saved: {e}".format(e = e))
+
     def setup_baking_source_self(self, context):
-        '''Set up the selection for the 'Self' bake source'''
-        object_to_bake_to = None # TODO make this work for each object that's selected, not just the final object
+        '''Set up a bake job for each selected object for the 'Self' bake source'''
+        objects_to_bake_to = []
         for object in self.original_selection:
             if object.type not in self.bakeable_types:
                 continue
-            # Select the object and make it active
-            object_to_bake_to = object
-            object_to_bake_to.select_set(True)
-            context.view_layer.objects.active = object_to_bake_to
-        if not object_to_bake_to:
+            try:
+                self.check_object_to_bake_to(object)
+            except RuntimeError as e:
+                self.report({'WARNING'}, "{e}, skipping it.".format(e = e))
+                continue
+            objects_to_bake_to.append(object)
+        if not objects_to_bake_to:
             raise RuntimeError("No objects selected to bake")
 
-        material_to_bake_to = object_to_bake_to.data.materials[0] # TODO make this work for multi-material setups
-
-        # The bake will be performed by baking from and to the same material
-        self.materials_to_bake_from = [material_to_bake_to]
-        self.material_to_bake_to    = material_to_bake_to
+        bake_jobs = []
+        for object_to_bake_to in objects_to_bake_to:
+            texture_set_name = self.settings.texture_set_name
+            if len(objects_to_bake_to) > 1:
+                # Each object gets its own texture set, add the object's name to the texture set name so that the textures don't overwrite each other
+                texture_set_name = self.settings.texture_name_delimiter.join([texture_set_name, bpy.path.clean_name(object_to_bake_to.name)])
+
+            materials_to_bake_to = get_slot_materials([object_to_bake_to])
+
+            # The bake will be performed by baking from and to the same materials
+            bake_jobs.append(BakeJob(texture_set_name       = texture_set_name,
+                                     object_to_bake_to      = object_to_bake_to,
+                                     materials_to_bake_to   = materials_to_bake_to,
+                                     objects_to_bake_from   = [],
+                                     materials_to_bake_from = materials_to_bake_to,
+                                     texture_size           = self.settings.texture_size,
+                                     use_selected_to_active = False))
+        return bake_jobs
 
     def setup_baking_source_selected_to_active(self, context):
-        '''Set up the selection for the 'Selected to Active' bake source'''
+        '''Set up the bake job for the 'Selected to Active' bake source'''
     
         if not self.original_active:
             raise RuntimeError("No Active object")
         if self.original_active.type not in self.bakeable_types:
             raise RuntimeError("Active object is not a bakeable type")
 
+        # Set up the reference to the recipient object and materials
+        object_to_bake_to = self.original_active
+        self.check_object_to_bake_to(object_to_bake_to)
+        materials_to_bake_to = get_slot_materials([object_to_bake_to])
+
         objects_to_bake_from = []
         for object in self.original_selection:
-            if object.type not in self.bakeable_types:
+            if object.type not in self.bakeable_types or object == object_to_bake_to:
                 continue
-            # Select all of the objects to bake from
-            object.select_set(True)
             objects_to_bake_from.append(object)
+        if not objects_to_bake_from:
+            raise RuntimeError("No objects selected to bake from")
 
-        # Set up the reference to the recipient object and material
-        object_to_bake_to = self.original_active
-        context.view_layer.objects.active = object_to_bake_to
-        material_to_bake_to = object_to_bake_to.data.materials[0] # TODO make this work for multi-material setups
-
-        # Set up the references to the source objects and materials
-        materials_to_bake_from = []
+        # Set up the references to the source materials, objects can share a material, each material should only be rewired once
         for object_to_bake_from in objects_to_bake_from:
-            materials_to_bake_from.append(object_to_bake_from.data.materials[0]) # TODO make this work for multi-material setups
+            if not get_slot_materials([object_to_bake_from]):
+                raise RuntimeError("{o} has no material to bake from".format(o = object_to_bake_from.name))
+        materials_to_bake_from = get_slot_materials(objects_to_bake_from)
+
+        # The bake will be performed by baking from the source materials to the active object's materials
+        return BakeJob(texture_set_name       = self.settings.texture_set_name,
+                       object_to_bake_to      = object_to_bake_to,
+                       materials_to_bake_to   = materials_to_bake_to,
+                       objects_to_bake_from   = objects_to_bake_from,
+                       materials_to_bake_from = materials_to_bake_from,
+                       texture_size           = self.settings.texture_size,
+                       use_selected_to_active = True)
+
+    def setup_queued_bake_job(self, queue_job):
+        """Set up the bake job for an entry of the bake queue, it bakes to itself if it has no objects to bake from"""
+        object_to_bake_to = queue_job.object_to_bake_to
+        if not object_to_bake_to:
+            raise RuntimeError("No object to bake to")
+        if object_to_bake_to.type not in self.bakeable_types:
+            raise RuntimeError("{o} is not a bakeable type".format(o = object_to_bake_to.name))
+        self.check_object_to_bake_to(object_to_bake_to)
+        materials_to_bake_to = get_slot_materials([object_to_bake_to])
 
-        # The bake will be performed by baking from the source materials to the active object's material
-        self.materials_to_bake_from = materials_to_bake_from
-        self.material_to_bake_to    = material_to_bake_to
+        objects_to_bake_from = []
+        for source in queue_job.objects_to_bake_from:
+            if source.object and source.object.type in self.bakeable_types and source.object != object_to_bake_to and source.object not in objects_to_bake_from:
+                objects_to_bake_from.append(source.object)
 
-    def perform_bake(self, context, materials_to_bake_from, material_to_bake_to):
-        self.nodes_to_delete_during_cleanup = {material_to_bake_to : []} # Keep track of all of the nodes that should be deleted during cleanup, make a list of nodes for each material
-        self.cached_material_output_links = {} # Keep track of all of the original node connections in a dictionary so they can be restored later
-        
-        for material_to_bake_from in materials_to_bake_from:
-            self.cache_material_output_link(material_to_bake_from)
-            self.nodes_to_delete_during_cleanup[material_to_bake_from] = [] # Add an empty node list to the dictionary associated with this material
+        for object_to_bake_from in objects_to_bake_from:
+            if not get_slot_materials([object_to_bake_from]):
+                raise RuntimeError("{o} has no material to bake from".format(o = object_to_bake_from.name))
+        materials_to_bake_from = get_slot_materials(objects_to_bake_from) # Objects can share a material, each material should only be rewired once
+
+        return BakeJob(texture_set_name       = queue_job.texture_set_name or self.settings.texture_set_name,
+                       object_to_bake_to      = object_to_bake_to,
+                       materials_to_bake_to   = materials_to_bake_to,
+                       objects_to_bake_from   = objects_to_bake_from,
+                       materials_to_bake_from = materials_to_bake_from or materials_to_bake_to,
+                       texture_size           = queue_job.texture_size or self.settings.texture_size,
+                       use_selected_to_active = bool(objects_to_bake_from))
+
+    def check_object_to_bake_to(self, object):
+        """Raise a RuntimeError if the object can't be baked to. Every material slot receives the bake, so none of them can be empty."""
+        if not object.material_slots:
+            raise RuntimeError("{o} has no material to bake".format(o = object.name))
+        for slot_index, material_slot in enumerate(object.material_slots):
+            if not material_slot.material:
+                raise RuntimeError("{o} has no material in slot {i} to bake".format(o = object.name, i = slot_index + 1))
+
+    def select_bake_job(self, context, bake_job):
+        '''Select the objects to bake from and make the object to bake to active'''
+        for object in bake_job.objects_to_bake_from:
+            self.selection_state.select(object)
+        self.selection_state.select(bake_job.object_to_bake_to)
+        self.selection_state.set_active(bake_job.object_to_bake_to)
+
+    def deselect_bake_job(self, context, bake_job):
+        '''Deselect the objects of a bake job so they aren't included in the next one'''
+        for object in bake_job.objects_to_bake_from:
+            self.selection_state.select(object, False)
+        self.selection_state.select(bake_job.object_to_bake_to, False)
+        self.selection_state.set_active(None)
+
+    def perform_bake(self, context, bake_job):
+        materials_to_bake_from = bake_job.materials_to_bake_from
+        materials_to_bake_to   = bake_job.materials_to_bake_to
+
+        # Each material gets a single bake rig for the whole job, it's retargeted for every pass instead of adding and removing nodes each time
+        # The rigs only insert their nodes when the first pass is baked, so the node trees are hashed and checked for constant passes before they're modified
+        self.bake_rigs = {material : BakeRig(material) for material in materials_to_bake_from}
+        for material_to_bake_to in materials_to_bake_to:
+            if material_to_bake_to not in self.bake_rigs:
+                self.bake_rigs[material_to_bake_to] = BakeRig(material_to_bake_to, is_source = False) # Selected to Active only needs an image node in the target materials
+        shader_nodes = [self.bake_rigs[material].node_shader for material in materials_to_bake_from]
 
+        try:
+            self.bake_passes(context, bake_job, shader_nodes)
+        finally:
+            with self.profiler.stage("teardown rig"):
+                self.teardown_bake_rigs()
+
+    def bake_passes(self, context, bake_job, shader_nodes):
         # BAKING TIME!!!
         baking_passes = bpy.context.scene.baking_passes
+        if self.memory_plan:
+            baking_passes = self.memory_plan.order_passes(baking_passes)
         for baking_pass in baking_passes:
             if not baking_pass.enabled:
                 continue
 
-            # Setup the correct output for each source material
-            for material_to_bake_from in materials_to_bake_from:
+            if self.memory_plan and self.memory_plan.starts_batch(bake_job, baking_pass):
+                with self.profiler.stage("flush writeback"):
+                    self.flush_texture_writeback()
+                self.image_pool.free()
 
-                self.initialize_baking_texture(baking_pass)
-                self.create_baking_image_texture_node(material_to_bake_to, baking_pass)
+            with self.profiler.stage(baking_pass.name, "pass", texture_set = bake_job.texture_set_name):
+                if not self.bake_pass(context, bake_job, baking_pass, shader_nodes):
+                    return
 
-                # Most baking passes will be rerouted through a temporary Emission node so that their values can be baked using the Cycles 'Emit' baking mode.
-                # Normal maps and Emission maps are exceptions to this: Normal will use the 'Normal' bake mode and the output connection will be left alone, Emission will use the default connection as well, but it will still use the 'Emit' baking mode # TODO, handle this better
-                if baking_pass.name not in ["Normal", "Emission"]:
-                    self.hook_up_node_for_bake(material_to_bake_from, baking_pass)
+    def bake_pass(self, context, bake_job, baking_pass, shader_nodes):
+        """Bake and save a single pass. Returns False if the bake job can't continue."""
+        materials_to_bake_from = bake_job.materials_to_bake_from
+        materials_to_bake_to   = bake_job.materials_to_bake_to
+
+        pass_type = 'PACKED' if baking_pass.use_channel_packing else baking_pass.name # Packed passes are always baked through the Emission node, regardless of their name
+        output_file = self.get_output_file(bake_job, baking_pass)
+        self.output_jobs[output_file] = bake_job
+
+        # Skip the pass if nothing that goes into the texture has changed since it was last baked
+        content_hash = None
+        if self.bake_manifest:
+            with self.profiler.stage("hash"):
+                content_hash = self.bake_hasher.hash_output(bake_job, baking_pass, self.settings, self.image_settings[baking_pass], [self.render_settings_bake, self.cycles_settings_bake])
+            if content_hash:
+                if self.bake_manifest.is_up_to_date(output_file, content_hash):
+                    self.unchanged_texture_count += 1
+                    return True
+
+        # If every source material outputs the same constant value for this pass, there's nothing for Cycles to bake, fill the texture with the value directly
+        if self.settings.skip_constant_passes:
+            constant_color = self.get_constant_pass_color(shader_nodes, baking_pass, pass_type)
+            if constant_color is not None:
+                texture_size = self.settings.constant_texture_size or bake_job.texture_size
+                tile_count = memory_planner.get_tile_count(self.settings, baking_pass, texture_size)
+                with self.profiler.stage("fill constant"):
+                    self.initialize_baking_texture(baking_pass, texture_size // tile_count, clear = False) # Every pixel is about to be filled
+                    self.fill_baking_texture(baking_pass, constant_color)
+                with self.profiler.stage("apply image settings"):
+                    self.image_settings_overrides.apply(self.image_settings[baking_pass]) # Apply the settings so that the texture output happens with the correct settings
+                self.set_display_device(context, pass_type)
+                if tile_count > 1:
+                    self.save_tiled_texture(baking_pass, output_file, tile_count) # Every tile is a copy of the filled texture
+                else:
+                    self.save_baking_texture(baking_pass, output_file)
+                self.record_content_hash(output_file, content_hash)
+                return True
 
-                self.image_settings[baking_pass].apply_properties_to_object(context.scene.render.bake.image_settings) # Apply the settings so that the bake happens with the correct settings
-                self.image_settings[baking_pass].apply_properties_to_object(context.scene.render.image_settings) # Apply the settings so that the texture output happens with the correct settings
+        # Most baking passes will be rerouted through the rig's Emission node so that their values can be baked using the Cycles 'Emit' baking mode.
+        # Normal maps and Emission maps are exceptions to this: Normal will use the 'Normal' bake mode and the output connection will be left alone, Emission will use the default connection as well, but it will still use the 'Emit' baking mode # TODO, handle this better
+        # Setup the correct output for each source material
+        try:
+            with self.profiler.stage("route nodes"):
+                for material_to_bake_from in materials_to_bake_from:
+                    if pass_type in ["Normal", "Emission"]:
+                        self.bake_rigs[material_to_bake_from].route_through_shader()
+                    elif baking_pass.use_channel_packing:
+                        self.bake_rigs[material_to_bake_from].route_through_emission(Channel_Packing_Info.get_pass_channels(baking_pass))
+                    else:
+                        self.bake_rigs[material_to_bake_from].route_through_emission([baking_pass.name])
+        except cache.LinkFailedError as error:
+            self.report({"WARNING"}, error.message)
+            return False
+
+        with self.profiler.stage("apply image settings"):
+            self.bake_image_settings_overrides.apply(self.image_settings[baking_pass]) # Apply the settings so that the bake happens with the correct settings
+            self.image_settings_overrides.apply(self.image_settings[baking_pass]) # Apply the settings so that the texture output happens with the correct settings
+            self.set_display_device(context, pass_type)
+
+        # Every source material is rewired at the same time, and every material slot of the object to bake to shares the baking texture,
+        # so each pass only needs a single bake and a single save, no matter how many materials are being baked from or to
+        # Very large textures can be baked a tile at a time instead, so only a single tile has to fit in memory
+        tile_count = memory_planner.get_tile_count(self.settings, baking_pass, bake_job.texture_size, bake_job.object_to_bake_to)
+        with self.profiler.stage("setup image"):
+            self.initialize_baking_texture(baking_pass, bake_job.texture_size // tile_count)
+            for material_to_bake_to in materials_to_bake_to:
+                self.bake_rigs[material_to_bake_to].set_target_image(self.settings.baking_texture, baking_pass.texture_node_color_space)
+
+        if tile_count > 1:
+            self.bake_tiles(bake_job, baking_pass, pass_type, output_file, tile_count)
+        else:
+            # Perform the bake
+            self.bake(bake_job, pass_type)
 
-                # Check if the "use_selected_to_active" option should be used based on the type of bake the user selected
-                selected_to_active = self.settings.bake_source in ("SELECTED_TO_ACTIVE", "UI_LIST")
+            # Output the texture
+            self.save_baking_texture(baking_pass, output_file)
+        self.record_content_hash(output_file, content_hash)
+        return True
 
-                # Perform the bake
-                if baking_pass.name == "Normal":
-                    context.scene.display_settings.display_device = 'XYZ'
-                    bpy.ops.object.bake(type = 'NORMAL', margin = 0, use_selected_to_active = selected_to_active, use_clear = False)
-                elif baking_pass.name == "Base Color":
-                    context.scene.display_settings.display_device = 'sRGB'
-                    bpy.ops.object.bake(type = 'EMIT', margin = 0, use_selected_to_active = selected_to_active, use_clear = False)
-                else:
-                    context.scene.display_settings.display_device = 'XYZ'
-                    bpy.ops.object.bake(type = 'EMIT', margin = 0, use_selected_to_active = selected_to_active, use_clear = False)
-
-                # Build the file name for output
-                delimiter = self.settings.texture_name_delimiter # Get the delimiter default to underscore _
-                file_name = delimiter.join([self.settings.texture_set_name, baking_pass.suffix]) # Add the baking pass suffix to the file name, joined using the delimiter
-
-                texture_format = bpy.context.scene.render.bake.image_settings.file_format
-                extension = None
-                # Get the file extension
-                for format in File_Format_Info.get_file_formats():
-                    if texture_format == format[0]:
-                        extension = format[1] # Example: Look up "PNG", return ".png"
-                        break
-                file_name += extension # Add the file extension to the file name
-
-                output_file = bpy.path.abspath(self.settings.export_path) # Get the absolute export path    
-                output_file += file_name # Add the file name to the output path
-
-                # Output the texture
-                self.settings.baking_texture.save_render(filepath= output_file)
-
-                # Clean up
-                for material, node_list in self.nodes_to_delete_during_cleanup.items():
-                    for node in node_list: # Get the list of nodes to delete associated with this material
-                        material.node_tree.nodes.remove(node) # Remove the node
-                for material in self.nodes_to_delete_during_cleanup.keys():
-                    self.nodes_to_delete_during_cleanup[material] = [] # Empty the list of nodes to remove
+    def bake(self, bake_job, pass_type, uv_layer = ""):
+        selected_to_active = bake_job.use_selected_to_active
 
-                try:
-                    self.cached_material_output_links[material_to_bake_from].apply_link_to_node_tree(material_to_bake_from.node_tree) # Hook up the original node to the output
-                except cache.LinkFailedError as error:
-                    self.report({"WARNING"}, error.message)
-                    return
+        with self.profiler.stage("bake"):
+            if pass_type == "Normal":
+                bpy.ops.object.bake(type = 'NORMAL', margin = 0, use_selected_to_active = selected_to_active, use_clear = False, uv_layer = uv_layer)
+            else:
+                bpy.ops.object.bake(type = 'EMIT', margin = 0, use_selected_to_active = selected_to_active, use_clear = False, uv_layer = uv_layer)
+
+    def bake_tiles(self, bake_job, baking_pass, pass_type, output_file, tile_count):
+        """Bake the texture one tile at a time through a temporary UV map, each tile is streamed into the output file and the baking texture is reused for the next one"""
+        mesh = bake_job.object_to_bake_to.data
+        uvs = numpy.empty(len(mesh.uv_layers.active.data) * 2, dtype = numpy.float32)
+        mesh.uv_layers.active.data.foreach_get("uv", uvs)
+        uvs = uvs.reshape(-1, 2)
+
+        # The materials keep reading the original UV map, only the bake uses the tile UV map
+        active_index = mesh.uv_layers.active_index
+        tile_uv_layer = mesh.uv_layers.new(name = "BakeryTile", do_init = False)
+        if tile_uv_layer is None:
+            raise RuntimeError("{m} has too many UV maps to bake in tiles".format(m = mesh.name))
+        tile_uv_layer_name = tile_uv_layer.name
+        mesh.uv_layers.active_index = active_index
+
+        image = self.settings.baking_texture
+        tile_size = image.size[0]
+        def bake_tile(tile_x, tile_y):
+            # Scale and offset the UVs so that the tile fills the 0-1 UV space, the bake only writes to pixels that are inside of it
+            # Pixel centers line up exactly: (tile_x * tile_size + x + 0.5) / texture_size * tile_count - tile_x = (x + 0.5) / tile_size
+            mesh.uv_layers[tile_uv_layer_name].data.foreach_set("uv", (uvs * tile_count - (tile_x, tile_y)).ravel())
+            image.pixels.foreach_set(numpy.zeros(tile_size * tile_size * 4, dtype = numpy.float32)) # Clear what the previous tile left behind
+            self.bake(bake_job, pass_type, uv_layer = tile_uv_layer_name)
 
-    def cache_original_selection(self, context):
-        # Cache the original selection and original active object
-        self.original_selection = context.selected_objects 
-        self.original_active = context.active_object
+        try:
+            self.save_tiled_texture(baking_pass, output_file, tile_count, bake_tile)
+        finally:
+            mesh.uv_layers.remove(mesh.uv_layers[tile_uv_layer_name])
+
+    def save_tiled_texture(self, baking_pass, output_file, tile_count, bake_tile = None):
+        """Stream the baking texture into the output file one tile at a time.
+        bake_tile(tile_x, tile_y) bakes a tile into the baking texture, if it's None every tile is a copy of the baking texture.
+        """
+        image = self.settings.baking_texture
+        tile_size = image.size[0]
+        encode_srgb = image.is_float and image.colorspace_settings.name == 'sRGB' # Float buffers are linear, byte buffers are already stored in the image's color space
+        pixels = numpy.empty(tile_size * tile_size * 4, dtype = numpy.float32)
+        if bake_tile is None:
+            image.pixels.foreach_get(pixels)
+
+        writer = TiledTextureWriter(output_file, baking_pass.file_format, baking_pass.color_depth, tile_size * tile_count, tile_count, encode_srgb = encode_srgb)
+        try:
+            for tile_y in reversed(range(tile_count)): # The file is written from the top of the texture to the bottom
+                for tile_x in range(tile_count):
+                    if bake_tile:
+                        bake_tile(tile_x, tile_y)
+                        image.pixels.foreach_get(pixels)
+                    with self.profiler.stage("save"):
+                        writer.write_tile(pixels, tile_x)
+        finally:
+            writer.close()
+            self.image_pool.release(image)
+
+    def teardown_bake_rigs(self):
+        """Remove the bake rig from every material and restore the original output links"""
+        for material, bake_rig in self.bake_rigs.items():
+            try:
+                bake_rig.teardown()
+            except cache.LinkFailedError as error:
+                self.report({"WARNING"}, error.message) # Keep restoring the links of the other materials
+        self.bake_rigs = {}
+
+    def set_display_device(self, context, pass_type):
+        if pass_type == "Base Color":
+            self.display_overrides.override("display_device", 'sRGB')
+        else:
+            self.display_overrides.override("display_device", 'XYZ')
+
+    def get_output_file(self, bake_job, baking_pass):
+        # Build the file name for output
+        delimiter = self.settings.texture_name_delimiter # Get the delimiter default to underscore _
+        file_name = delimiter.join([bake_job.texture_set_name, baking_pass.suffix]) # Add the baking pass suffix to the file name, joined using the delimiter
+
+        extension = None
+        # Get the file extension
+        for format in File_Format_Info.get_file_formats():
+            if baking_pass.file_format == format[0]:
+                extension = format[1] # Example: Look up "PNG", return ".png"
+                break
+        file_name += extension # Add the file extension to the file name
+
+        output_file = bpy.path.abspath(self.settings.export_path) # Get the absolute export path
+        output_file += file_name # Add the file name to the output path
+        return output_file
+
+    def save_baking_texture(self, baking_pass, output_file):
+        """Save the baking texture, in the background if the file format is supported by the texture writeback"""
+        image = self.settings.baking_texture
+        with self.profiler.stage("save"):
+            if self.texture_writeback and TextureWriteback.can_write(baking_pass.file_format, baking_pass.color_depth):
+                encode_srgb = image.is_float and image.colorspace_settings.name == 'sRGB' # Float buffers are linear, byte buffers are already stored in the image's color space
+                self.texture_writeback.submit(image, output_file, baking_pass.file_format, baking_pass.color_depth, encode_srgb = encode_srgb)
+            else:
+                image.save_render(filepath= output_file)
+        self.image_pool.release(image) # The pixels have been copied or saved, the image can be reused by the next pass
+
+    def record_content_hash(self, output_file, content_hash):
+        """Keep the hash of a texture that has been saved, a pass that stops before its texture is saved must not be recorded against the texture that's already on disk"""
+        if content_hash:
+            self.manifest_records[output_file] = content_hash
+
+    def flush_texture_writeback(self):
+        """Wait for the textures that are still being written, so their pixel copies are freed, and report any that failed"""
+        if not self.texture_writeback:
+            return
+        for error in self.texture_writeback.flush():
+            self.report({'WARNING'}, error)
+
+    def finish_texture_writeback(self):
+        """Wait for the textures that are still being written, report any that failed. Returns True if every texture was written."""
+        self.failed_filepaths = []
+        if not self.texture_writeback:
+            return True
+        errors = self.texture_writeback.shutdown()
+        self.failed_filepaths = self.texture_writeback.failed_filepaths # Includes the textures that failed when the writeback was flushed between batches
+        for filepath in self.failed_filepaths:
+            self.manifest_records.pop(filepath, None) # Textures that failed to write have to be baked again next time
+        self.texture_writeback = None
+        for error in errors:
+            self.report({'WARNING'}, error)
+        return not self.failed_filepaths
+
+    def save_bake_manifest(self):
+        """Record the hashes of the textures that were saved, so they can be skipped next time if nothing changes"""
+        if not self.bake_manifest:
+            return
+        for output_file, content_hash in self.manifest_records.items():
+            if os.path.isfile(output_file):
+                self.bake_manifest.record(output_file, content_hash)
+        try:
+            self.bake_manifest.save()
+        except OSError as e:
+            self.report({'WARNING'}, "Bake manifest could not be saved: {e}".format(e = e))
+
+    def get_constant_pass_color(self, shader_nodes, baking_pass, pass_type):
+        """Get the RGBA color that a pass will bake to if none of the sockets it reads from are linked in any of the materials.
+        Returns None if the pass isn't constant, or if the materials don't all output the same value.
+        """
+        # Normal maps depend on the geometry, and Emission is baked through the whole shader, they always need a bake
+        if pass_type in ["Normal", "Emission"]:
+            return None
+        # There's nothing to read a constant from if there are no source materials
+        if not shader_nodes:
+            return None
+
+        constant_color = None
+        for node_shader in shader_nodes:
+            if node_shader.bl_idname != 'ShaderNodeBsdfPrincipled':
+                return None
+
+            if baking_pass.use_channel_packing:
+                color = []
+                for channel_source in Channel_Packing_Info.get_pass_channels(baking_pass):
+                    if channel_source == 'NONE':
+                        color.append(0.0)
+                    elif channel_source == 'ONE':
+                        color.append(1.0)
+                    else:
+                        channel_value = self.get_constant_socket_color(node_shader.inputs[channel_source])
+                        if channel_value is None:
+                            return None
+                        color.append(channel_value[0])
+                color = tuple(color)
+            else:
+                color = self.get_constant_socket_color(node_shader.inputs[baking_pass.name])
+                if color is None:
+                    return None
 
-    def restore_original_selection(self, context):
-        # Deselect everything
-        for object in bpy.data.objects:
-            object.select_set(False)
+            if constant_color is not None and color != constant_color:
+                return None # The materials disagree, the bake will have to decide which material ends up where
+            constant_color = color
 
-        # Reselect everything from the original selection and set the active object back to the original active object
-        for object in self.original_selection:
-            object.select_set(True)
-        context.view_layer.objects.active = self.original_active
+        return constant_color + (1.0,) # Add an opaque alpha
 
-    def cache_original_render_and_cycles_settings(self, context):
-        self.render_settings_original = cache.CachedProperties(object_to_cache = context.scene.render)
-        self.cycles_settings_original = cache.CachedProperties(object_to_cache = context.scene.cycles)
-        self.display_device_original = context.scene.display_settings.display_device
+    def get_constant_socket_color(self, socket):
+        """Get the RGB value of an unlinked socket, or None if the socket is linked or its type isn't supported"""
+        if len(socket.links):
+            return None
+        if socket.type == 'RGBA':
+            return tuple(socket.default_value[:3])
+        if socket.type == 'VALUE':
+            return (socket.default_value,) * 3
+        return None
+
+    def fill_baking_texture(self, baking_pass, color):
+        """Fill the entire baking texture with a single color in one bulk write"""
+        image = self.settings.baking_texture
+        image.colorspace_settings.name = baking_pass.texture_node_color_space
+
+        if not image.is_float and image.colorspace_settings.name == 'sRGB':
+            # Byte buffers store their pixels in the image's color space, Cycles would have converted the linear emission values to sRGB when writing to the texture
+            color = tuple(linear_to_srgb(channel) for channel in color[:3]) + color[3:]
+
+        pixels = numpy.empty((image.size[0] * image.size[1], 4), dtype= numpy.float32)
+        pixels[:] = color
+        image.pixels.foreach_set(pixels.ravel())
+
+    def cache_original_selection(self, context, selected_objects, active_object):
+        # Cache the objects to bake, and the view layer's selection so only the objects whose selection changes during the bake are restored
+        self.original_selection = list(selected_objects)
+        self.original_active = active_object
+        self.selection_state = cache.SelectionState(context.view_layer)
+
+    @contextlib.contextmanager
+    def original_state_restored(self, context):
+        """Restore the overridden settings and the original selection when the bake exits, even if it exits with an exception"""
+        self.overrides = contextlib.ExitStack() # The settings overrides are entered on it in setup_setting_overrides()
+        self.setting_overrides = []
+        self.selection_state = None
+        try:
+            yield
+        finally:
+            if self.restore_state:
+                with self.profiler.stage("restore settings"):
+                    self.restore_original_render_and_cycles_settings(context)
+                    self.restore_original_selection(context)
+            else:
+                self.overrides.pop_all() # Leave the settings as they are, Blender is about to exit
+
+    def restore_original_selection(self, context):
+        # Reselect the original selection and set the active object back to the original active object, objects that the bake didn't touch are skipped
+        if self.selection_state:
+            self.selection_state.restore()
+
+    def setup_setting_overrides(self, context):
+        # Only the original values of the settings that the bake overrides are recorded, the first time each one is overridden
+        # The per-pass image settings and display device are nested inside the render and cycles settings, the overrides are restored in the reverse order they were set up
+        self.render_overrides              = self.overrides.enter_context(cache.PropertyOverrides(context.scene.render))
+        self.cycles_overrides              = self.overrides.enter_context(cache.PropertyOverrides(context.scene.cycles))
+        self.display_overrides             = self.overrides.enter_context(cache.PropertyOverrides(context.scene.display_settings))
+        self.bake_image_settings_overrides = self.overrides.enter_context(cache.PropertyOverrides(context.scene.render.bake.image_settings))
+        self.image_settings_overrides      = self.overrides.enter_context(cache.PropertyOverrides(context.scene.render.image_settings))
+        self.setting_overrides = [("render", self.render_overrides), ("cycles", self.cycles_overrides), ("display", self.display_overrides),
+                                  ("bake image", self.bake_image_settings_overrides), ("image", self.image_settings_overrides)]
 
     def restore_original_render_and_cycles_settings(self, context):
-        context.scene.display_settings.display_device = self.display_device_original   # Set the display_device back to its original value
-        self.render_settings_original.apply_properties_to_object(context.scene.render) # Set the render setting back to their original values
-        self.cycles_settings_original.apply_properties_to_object(context.scene.cycles) # Set the cycles settings back to their original values
+        # Set the overridden settings back to their original values, only the properties that are still changed need to be written
+        self.overrides.close()
+        for name, overrides in self.setting_overrides:
+            print("Restored {n} settings: {a} properties written, {s} unchanged properties skipped".format(n = name, a = overrides.writes_applied, s = overrides.writes_skipped))
 
     def setup_render_and_cycles_settings_for_baking(self, context):
-        # Set up the render settings and cycles settings for baking
-        render_settings_bake = cache.CachedProperties(cache_to_copy = self.render_settings_original, dont_assign_values=True)
-        render_settings_bake.set_property("engine", 'CYCLES')
-        render_settings_bake.set_property("use_file_extension", True)
-        render_settings_bake.set_property("bake.target", 'IMAGE_TEXTURES')
-
-        cycles_settings_bake = cache.CachedProperties(cache_to_copy = self.cycles_settings_original, dont_assign_values=True)
-        cycles_settings_bake.set_property("device", 'GPU')
-        cycles_settings_bake.set_property("use_adaptive_sampling", False)
-        cycles_settings_bake.set_property("samples", 16) # TODO figure out how many baking samples we need 1? 16? User selectable?
-        cycles_settings_bake.set_property("use_denoising", False)
+        # Set up the render settings and cycles settings for baking, the scene's settings only have to be indexed, their values aren't read
+        render_settings_bake, cycles_settings_bake = get_bake_settings(self.settings, cache.CachedProperties(object_to_cache = context.scene.render, dont_assign_values=True),
+                                                                       cache.CachedProperties(object_to_cache = context.scene.cycles, dont_assign_values=True))
 
         # Apply the render setting and cycles settings for the bake
-        render_settings_bake.apply_properties_to_object(context.scene.render)
-        cycles_settings_bake.apply_properties_to_object(context.scene.cycles)
+        self.render_overrides.apply(render_settings_bake)
+        self.cycles_overrides.apply(cycles_settings_bake)
 
-    def cache_material_output_link(self, material):
-        """Cache the original link to the output node so it can be recovered later"""
-        # TODO make this support all outputs (Surface, Volume, Displacement), not just the Surface output
-        # TODO make sure this handles with there is nothing hooked up to the output node
-
-        node_output = material.node_tree.nodes["Material Output"] # Get the output node
-        original_link = cache.CachedNodeLink(node_output.inputs[0].links[0]) # Cache the details of the link to the output node
-        self.cached_material_output_links[material] = original_link
-
-    def hook_up_node_for_bake(self, material, baking_pass):
-        # material.use_nodes = True # TODO clean this up
-
-        node_output = material.node_tree.nodes["Material Output"] # Get the existing output node
-        connected_node_name = node_output.inputs[0].links[0].from_node.name # Name of the node on the left side that is outputting the link
-        if connected_node_name != "Principled BSDF":
-            print("This node is not supported") # TODO support more nodes
-        node_shader = material.node_tree.nodes[connected_node_name]
-
-        node_emission = material.node_tree.nodes.new('ShaderNodeEmission')
-        self.nodes_to_delete_during_cleanup[material].append(node_emission)
-        material.node_tree.links.new(node_output.inputs[0], node_emission.outputs['Emission']) # Hook up the emission node to the surface output
-
-        # If there are links to the socket, hook them up to the emission node
-        socket = node_shader.inputs[baking_pass.name]
-        if len(socket.links):
-            input_node_name = socket.links[0].from_node.name
-            input_socket_name = socket.links[0].from_socket.name
-            node_input = material.node_tree.nodes[input_node_name]
-            material.node_tree.links.new(node_emission.inputs[0], node_input.outputs[input_socket_name])
-        # If there are no links to the socket, assign the socket's default_value to the emission node
-        else:
-            if socket.type == 'RGBA':
-                node_emission.inputs[0].default_value = socket.default_value
-                return
-            elif socket.type == 'VALUE':
-                node_value = material.node_tree.nodes.new('ShaderNodeValue')
-                self.nodes_to_delete_during_cleanup[material].append(node_value)
-                node_value.outputs[0].default_value = node_shader.inputs[baking_pass.name].default_value
-                material.node_tree.links.new(node_emission.inputs[0], node_value.outputs[0])
-            elif socket.type == 'VECTOR':
-                pass # TODO handle other types as well
-            else:
-                pass # TODO handle other types as well
+        # Keep the overrides, they are part of the content hash for incremental baking
+        self.render_settings_bake = render_settings_bake
+        self.cycles_settings_bake = cycles_settings_bake
 
     def setup_image_settings(self):
         # Create the core image settings that are common for all types of baking
@@ -291,7 +746,12 @@ class OBJECT_OT_BatchBake(bpy.types.Operator):
             image_settings.set_property("file_format", baking_pass.file_format)
             image_settings.set_property("color_depth", baking_pass.color_depth)
 
-            if baking_pass.name == "Base Color":
+            if baking_pass.use_channel_packing:
+                # Each channel holds separate data, they aren't colors
+                image_settings.set_property("linear_colorspace_settings.is_data", True)
+                image_settings.set_property("linear_colorspace_settings.name", 'Raw')
+
+            elif baking_pass.name == "Base Color":
                 image_settings.set_property("linear_colorspace_settings.is_data", False)
                 image_settings.set_property("linear_colorspace_settings.name", 'sRGB')
 
@@ -305,32 +765,141 @@ class OBJECT_OT_BatchBake(bpy.types.Operator):
 
             self.image_settings[baking_pass] = image_settings
 
-    def initialize_baking_texture(self, baking_pass):
-        suffix = baking_pass.suffix
-        delimiter = self.settings.texture_name_delimiter
-        new_texture = delimiter.join([self.settings.texture_set_name, suffix])
-
-        # Remove the texture if it already exists so that it can be reinitialized with the correct resolution and settings
-        image = bpy.data.images.get(new_texture, None)
-        if image: bpy.data.images.remove(image, do_unlink = True)
-
-        # Create the new texture
+    def initialize_baking_texture(self, baking_pass, texture_size, clear = True):
+        # Lease a texture with the correct resolution and settings from the pool instead of reallocating it for every pass
         use_float = baking_pass.color_depth != '8' # We only need full float for color depths higher than 8
-        bpy.data.images.new(name = new_texture, width = self.settings.texture_size, height = self.settings.texture_size, float_buffer = use_float)
 
         # Save the new texture in a variable where we can reference it later
-        self.settings.baking_texture = bpy.data.images.get(new_texture, None)
-
-    def create_baking_image_texture_node(self, material, baking_pass):
-        self.baked_image_node = material.node_tree.nodes.new('ShaderNodeTexImage')
-        self.nodes_to_delete_during_cleanup[material].append(self.baked_image_node)
-        self.baked_image_node.location = [0, 0]
-        self.baked_image_node.label = 'BakingTexture'
-        self.baked_image_node.name = 'BakingTexture'
-        self.baked_image_node.image = self.settings.baking_texture
-        self.baked_image_node.image.colorspace_settings.name = baking_pass.texture_node_color_space
-        self.baked_image_node.select = True # Make the node the active selection so that it will receive the bake.
-        material.node_tree.nodes.active = self.baked_image_node # Make the new node the active node so that it will receive the bake.
+        self.settings.baking_texture = self.image_pool.lease(texture_size, texture_size, use_float, clear = clear)
+
+def get_bake_settings(settings, render_settings, cycles_settings):
+    """Get the render settings and cycles settings that are overridden for a bake: the defaults, with the bake preset loaded on top of them.
+    render_settings and cycles_settings are CachedProperties of the scene's settings, only their schemas are used, the overrides are copies of them with only the overridden values assigned.
+    Raises OSError if the preset can't be read, or ValueError if it isn't valid for the scene's settings.
+    """
+    render_settings_bake = cache.CachedProperties(cache_to_copy = render_settings, dont_assign_values=True)
+    render_settings_bake.set_property("engine", 'CYCLES')
+    render_settings_bake.set_property("use_file_extension", True)
+    render_settings_bake.set_property("bake.target", 'IMAGE_TEXTURES')
+
+    cycles_settings_bake = cache.CachedProperties(cache_to_copy = cycles_settings, dont_assign_values=True)
+    cycles_settings_bake.set_property("device", 'GPU')
+    cycles_settings_bake.set_property("use_adaptive_sampling", False)
+    cycles_settings_bake.set_property("samples", 16) # TODO figure out how many baking samples we need 1? 16? User selectable?
+    cycles_settings_bake.set_property("use_denoising", False)
+
+    if settings.bake_preset_path:
+        preset = bake_presets.load_preset(bpy.path.abspath(settings.bake_preset_path))
+        for name, settings_bake in (("render", render_settings_bake), ("cycles", cycles_settings_bake)):
+            if name in preset:
+                settings_bake.load_dict(preset[name])
+    return render_settings_bake, cycles_settings_bake
+
+class OBJECT_OT_SaveBakePreset(bpy.types.Operator, ExportHelper):
+    """Save the render and cycles settings that are overridden for a bake to a preset file"""
+    bl_label = "Save Bake Preset"
+    bl_idname = "object.save_bake_preset"
+    bl_description = "Save the render and cycles settings that the bake overrides, including the current preset, to a file that can be shared and used as the bake preset"
+
+    filename_ext = ".json"
+    filter_glob : bpy.props.StringProperty(default = "*.json;*" + bake_presets.BINARY_EXTENSION, options = {'HIDDEN'})
+    use_binary : bpy.props.BoolProperty(name = "Compressed", default = False, description = "Save the preset as compressed binary ({e}) instead of JSON".format(e = bake_presets.BINARY_EXTENSION))
+
+    def execute(self, context):
+        settings = context.scene.baking_tools_settings
+        filepath = os.path.splitext(self.filepath)[0] + bake_presets.BINARY_EXTENSION if self.use_binary else self.filepath
+        try:
+            render_settings_bake, cycles_settings_bake = get_bake_settings(settings, cache.CachedProperties(object_to_cache = context.scene.render, dont_assign_values=True),
+                                                                           cache.CachedProperties(object_to_cache = context.scene.cycles, dont_assign_values=True))
+            bake_presets.save_preset(filepath, {"render": render_settings_bake, "cycles": cycles_settings_bake}, binary = self.use_binary)
+        except (OSError, ValueError) as e:
+            self.report({'WARNING'}, "Bake preset could not be saved: {e}".format(e = e))
+            return {'CANCELLED'}
+        settings.bake_preset_path = filepath # Use the preset that was just saved
+        return {'FINISHED'}
+
+class OBJECT_OT_BatchBake(bpy.types.Operator):
+    """Batch bake textures"""
+    bl_label = "BatchBake"
+    bl_idname = "object.batch_baker"
+    bl_description = "Batch bakes textures"
+
+    def execute(self, context):
+        return BatchBake(report = self.report).execute(context, context.selected_objects, context.active_object)
+
+class OBJECT_OT_AddToBakeQueue(bpy.types.Operator):
+    """Add the selection to the bake queue"""
+    bl_label = "Add to Queue"
+    bl_idname = "object.add_to_bake_queue"
+    bl_description = "Queue the selected objects with the current bake source, so they can be baked together with the rest of the queue"
+
+    def execute(self, context):
+        settings = context.scene.baking_tools_settings
+        bake_queue = context.scene.bake_queue
+        selected_objects = [object for object in context.selected_objects if object.type in BatchBake.bakeable_types]
+
+        if settings.bake_source == "SELF":
+            for object in selected_objects:
+                queue_job = bake_queue.add()
+                queue_job.texture_set_name = self.get_unique_texture_set_name(settings, bake_queue, object)
+                queue_job.object_to_bake_to = object
+        elif settings.bake_source == "SELECTED_TO_ACTIVE":
+            if not context.active_object or context.active_object.type not in BatchBake.bakeable_types:
+                self.report({'WARNING'}, "No bakeable active object")
+                return {'CANCELLED'}
+            queue_job = bake_queue.add()
+            queue_job.texture_set_name = self.get_unique_texture_set_name(settings, bake_queue, context.active_object)
+            queue_job.object_to_bake_to = context.active_object
+            for object in selected_objects:
+                if object != context.active_object:
+                    queue_job.objects_to_bake_from.add().object = object
+        return {'FINISHED'}
+
+    def get_unique_texture_set_name(self, settings, bake_queue, object):
+        """Name a queued job's texture set after the object it bakes to, with a number added if another queued job already uses the name, so the jobs don't overwrite each other's textures"""
+        texture_set_name = settings.texture_name_delimiter.join([settings.texture_set_name, bpy.path.clean_name(object.name)])
+        queued_names = set(queue_job.texture_set_name for queue_job in bake_queue)
+        unique_name = texture_set_name
+        index = 1
+        while unique_name in queued_names:
+            index += 1
+            unique_name = settings.texture_name_delimiter.join([texture_set_name, str(index)])
+        return unique_name
+
+class OBJECT_OT_ClearBakeQueue(bpy.types.Operator):
+    """Remove every job from the bake queue"""
+    bl_label = "Clear Queue"
+    bl_idname = "object.clear_bake_queue"
+    bl_description = "Remove every job from the bake queue"
+
+    def execute(self, context):
+        context.scene.bake_queue.clear()
+        return {'FINISHED'}
+
+class OBJECT_OT_BakeQueue(bpy.types.Operator):
+    """Bake every job in the bake queue"""
+    bl_label = "Bake Queue"
+    bl_idname = "object.bake_queue"
+    bl_description = "Bake every job in the bake queue, the bake settings are set up once for the whole queue"
+
+    def execute(self, context):
+        if not len(context.scene.bake_queue):
+            self.report({'WARNING'}, "The bake queue is empty")
+            return {'CANCELLED'}
+        return BatchBake(report = self.report).execute_queue(context, context.scene.bake_queue)
+
+class OBJECT_OT_PlanBakeMemory(bpy.types.Operator):
+    """Estimate the peak memory of a bake of the selection"""
+    bl_label = "Estimate Memory"
+    bl_idname = "object.plan_bake_memory"
+    bl_description = "Estimate the peak memory a bake of the selection needs with the current settings, and how many batches the memory budget splits it into"
+
+    def execute(self, context):
+        # Planning evaluates the modifiers of every selected object, so it's only done when asked for instead of every time the panel is drawn
+        memory_plan = memory_planner.plan_bake(context)
+        context.scene.baking_tools_settings.memory_plan_summary = memory_plan.summary()
+        print(memory_plan.summary())
+        return {'FINISHED'}
 
 class File_Format_Info():
     # https://docs.blender.org/manual/en/2.79/data_system/files/media/image_formats.html
@@ -372,6 +941,29 @@ class File_Format_Info():
             return [('32', '32', "")]
         raise KeyError
 
+class Channel_Packing_Info():
+    """Scalar passes can be packed into the red, green, and blue channels of a single texture. Example: ORM (Occlusion, Roughness, Metallic)"""
+
+    @staticmethod
+    def get_channel_sources():
+        channel_sources = [("NONE",         "Black",        "Fill the channel with 0"),
+                           ("ONE",          "White",        "Fill the channel with 1"),
+                           ("Roughness",    "Roughness",    ""),
+                           ("Metallic",     "Metallic",     ""),
+                           ("Specular",     "Specular",     ""),
+                           ("Alpha",        "Alpha",        ""),
+                           ("Transmission", "Transmission", ""),
+                           ("Clearcoat",    "Clearcoat",    ""),
+                           ("Sheen",        "Sheen",        ""),
+                           ("Subsurface",   "Subsurface",   "")]
+
+        return channel_sources
+
+    @staticmethod
+    def get_pass_channels(baking_pass):
+        # Alpha isn't included, the Emit bake can only output color
+        return [baking_pass.channel_red, baking_pass.channel_green, baking_pass.channel_blue]
+
 # This callback gets called automatically to update the item list
 def update_color_depths(self, context):
     return File_Format_Info.get_color_depths(self.file_format)
@@ -385,6 +977,32 @@ class BakingTools_Props(bpy.types.PropertyGroup):
 
     export_path : bpy.props.StringProperty(name = "Output Path", subtype='DIR_PATH', default = "/tmp\\")
 
+    # Passes that output a constant value don't need to be baked, the texture can be filled directly
+    skip_constant_passes  : bpy.props.BoolProperty(name = "Skip Constant Passes", default = True)
+    constant_texture_size : bpy.props.IntProperty(name = "Constant Resolution", default = 0, min = 0, description = "Resolution of the textures for constant passes, 0 uses the full resolution")
+
+    # Encode and write textures on background threads while the next pass bakes
+    # The textures are encoded by the add-on instead of Blender, so they aren't written with the scene's image settings, only with the ones every bake uses
+    use_async_writeback : bpy.props.BoolProperty(name = "Write Textures in Background", default = False, description = "Encode and write PNG, TIFF, and TARGA textures on background threads while the next pass bakes. The files aren't written by Blender, so their compression and metadata can differ from textures saved by Blender")
+
+    # Skip textures that were already baked from the same materials, meshes, and settings
+    use_incremental_bake : bpy.props.BoolProperty(name = "Skip Unchanged Textures", default = False)
+
+    # Bake very large textures in tiles that are streamed into the output file, so only a single tile has to fit in memory
+    use_tiled_bake : bpy.props.BoolProperty(name = "Bake in Tiles", default = False, description = "Bake textures that are larger than the tile size one tile at a time. Only used for PNG, TIFF, and TARGA textures of meshes")
+    tile_size      : bpy.props.IntProperty(name = "Tile Size", default = 2048, min = 64)
+
+    # Split the bake into batches that are estimated to stay under this much memory, 0 disables the planner
+    memory_budget_mb : bpy.props.IntProperty(name = "Memory Budget (MB)", default = 0, min = 0, description = "Free the pooled images and flush the texture writes between batches of passes so the estimated peak memory stays under the budget. 0 bakes everything in one batch")
+    memory_plan_summary : bpy.props.StringProperty(name = "Memory Plan", default = "") # Summary of the last plan made by the plan_bake_memory operator, the panel only shows it
+
+    # Render and cycles settings that are overridden for the bake, loaded from a preset file that can be shared between machines
+    bake_preset_path : bpy.props.StringProperty(name = "Bake Preset", subtype='FILE_PATH', default = "", description = "Render and cycles settings to override for the bake, saved with Save Bake Preset. The default overrides are used if this is empty")
+
+    # Record how long each stage of the bake takes, the profile is written next to the textures
+    use_profiling        : bpy.props.BoolProperty(name = "Profile Bake", default = False, description = "Write bake_profile.json and a Chrome trace (bake_profile.trace.json) next to the textures, with the time each stage took")
+    use_memory_profiling : bpy.props.BoolProperty(name = "Record Memory", default = False, description = "Also record the memory used by Blender before and after each stage")
+
     bake_source : bpy.props.EnumProperty(name = "Bake from:",
                                     items=[
                                         ("SELF", "Self", "Material sockets will be baked to textures."),
@@ -457,15 +1075,74 @@ class PROPERTIES_PT_BakingTools(bpy.types.Panel):
                     # Display the list of relevant color depth options for this file format
                     column.prop(baking_pass, 'color_depth', text = "")
 
+            # Channel sources for the passes that are packed into a single texture
+            for baking_pass in baking_passes:
+                if not baking_pass.use_channel_packing:
+                    continue
+                row = layout.row()
+                split = row.split(factor= 0.3)
+                split.label(text = "{n} Channels:".format(n = baking_pass.name))
+                split.prop(baking_pass, 'channel_red',   text = "R")
+                split.prop(baking_pass, 'channel_green', text = "G")
+                split.prop(baking_pass, 'channel_blue',  text = "B")
+
             row = layout.row()
             row.prop(settings, 'texture_size')
 
+            row = layout.row()
+            row.prop(settings, 'use_async_writeback')
+
+            row = layout.row()
+            row.prop(settings, 'use_incremental_bake')
+
+            row = layout.row()
+            row.prop(settings, 'use_tiled_bake')
+            if settings.use_tiled_bake:
+                row.prop(settings, 'tile_size')
+
+            row = layout.row()
+            row.prop(settings, 'bake_preset_path')
+            row.operator('object.save_bake_preset', text = "", icon = 'FILE_TICK')
+
+            row = layout.row()
+            row.prop(settings, 'use_profiling')
+            if settings.use_profiling:
+                row.prop(settings, 'use_memory_profiling')
+
+            row = layout.row()
+            row.prop(settings, 'memory_budget_mb')
+            row.operator('object.plan_bake_memory', text = "", icon = 'MEMORY')
+            if settings.memory_plan_summary:
+                row = layout.row()
+                row.label(text = settings.memory_plan_summary)
+
+            row = layout.row()
+            row.prop(settings, 'skip_constant_passes')
+            if settings.skip_constant_passes:
+                row.prop(settings, 'constant_texture_size')
+
             row = layout.row()
             row.label(text = "Bake from:")
             row.prop(settings, 'bake_source', expand=True)
 
             row = layout.row()
             row.operator('object.batch_baker', icon = 'RENDER_STILL')
+
+            # Bake queue
+            bake_queue = context.scene.bake_queue
+            box = layout.box()
+            box.label(text = "Bake Queue: {n} jobs".format(n = len(bake_queue)))
+            for queue_job in bake_queue:
+                row = box.row()
+                row.prop(queue_job, 'texture_set_name', text = "", icon = {'QUEUED': 'TIME', 'FINISHED': 'CHECKMARK', 'FAILED': 'ERROR'}[queue_job.status])
+                row.prop(queue_job, 'object_to_bake_to', text = "")
+                row.prop(queue_job, 'texture_size', text = "")
+                if queue_job.message:
+                    box.label(text = queue_job.message)
+            row = box.row()
+            row.operator('object.add_to_bake_queue', icon = 'ADD')
+            row.operator('object.clear_bake_queue', icon = 'X')
+            row.operator('object.bake_queue', icon = 'RENDER_STILL')
         else:
             # If the baking passes haven't been set up then we can't use the tool, display a button to set up the baking passes instead
             row.operator('object.initialize_baking_tools', icon = 'ANCHOR_LEFT')
@@ -477,26 +1154,34 @@ class OBJECT_OT_INITIALIZEBAKINGTOOLS(bpy.types.Operator):
     bl_description = "Generate the list of baking passes to be used with the baking tools"
 
     def execute(self, context):
-        self.setup_baking_passes(context)
+        setup_baking_passes(context)
         return {'FINISHED'}
 
-    def setup_baking_passes(self, context):
-        self.new_baking_pass(context= context, name= "Base Color", enabled= True, suffix= "BaseColor", file_format= 'PNG',  color_depth= '8',  texture_node_color_space = 'sRGB')
-        self.new_baking_pass(context= context, name= "Roughness",  enabled= True, suffix= "Roughness", file_format= 'PNG',  color_depth= '8',  texture_node_color_space = 'Non-Color')
-        self.new_baking_pass(context= context, name= "Metallic",   enabled= True, suffix= "Metal",     file_format= 'PNG',  color_depth= '8',  texture_node_color_space = 'Non-Color')
-        self.new_baking_pass(context= context, name= "Normal",     enabled= True, suffix= "Normal",    file_format= 'TIFF', color_depth= '16', texture_node_color_space = 'Non-Color')
-        self.new_baking_pass(context= context, name= "Emission",   enabled= True, suffix= "Emit",      file_format= 'PNG',  color_depth= '8',  texture_node_color_space = 'Non-Color')
+def setup_baking_passes(context):
+    """Add the default list of baking passes to the scene"""
+    new_baking_pass(context= context, name= "Base Color", enabled= True, suffix= "BaseColor", file_format= 'PNG',  color_depth= '8',  texture_node_color_space = 'sRGB')
+    new_baking_pass(context= context, name= "Roughness",  enabled= True, suffix= "Roughness", file_format= 'PNG',  color_depth= '8',  texture_node_color_space = 'Non-Color')
+    new_baking_pass(context= context, name= "Metallic",   enabled= True, suffix= "Metal",     file_format= 'PNG',  color_depth= '8',  texture_node_color_space = 'Non-Color')
+    new_baking_pass(context= context, name= "Normal",     enabled= True, suffix= "Normal",    file_format= 'TIFF', color_depth= '16', texture_node_color_space = 'Non-Color')
+    new_baking_pass(context= context, name= "Emission",   enabled= True, suffix= "Emit",      file_format= 'PNG',  color_depth= '8',  texture_node_color_space = 'Non-Color')
+    new_baking_pass(context= context, name= "ORM",        enabled= False, suffix= "ORM",      file_format= 'PNG',  color_depth= '8',  texture_node_color_space = 'Non-Color',
+                    channels= ('ONE', 'Roughness', 'Metallic')) # Ambient occlusion can't be baked from the material, so the occlusion channel is left white
+
+def new_baking_pass(context, name, enabled, suffix, file_format, color_depth, texture_node_color_space, channels = None):
+    baking_pass = context.scene.baking_passes.add()
 
-    def new_baking_pass(self, context, name, enabled, suffix, file_format, color_depth, texture_node_color_space):
-        new_baking_pass = context.scene.baking_passes.add()
+    baking_pass.name        = name
+    baking_pass.enabled     = enabled
+    baking_pass.suffix      = suffix
+    baking_pass.file_format = file_format
+    baking_pass.color_depth = color_depth
 
-        new_baking_pass.name        = name
-        new_baking_pass.enabled     = enabled
-        new_baking_pass.suffix      = suffix
-        new_baking_pass.file_format = file_format
-        new_baking_pass.color_depth = color_depth
+    baking_pass.texture_node_color_space = texture_node_color_space
 
-        new_baking_pass.texture_node_color_space = texture_node_color_space
+    # Pack the given channel sources into the red, green, and blue channels of the texture
+    if channels:
+        baking_pass.use_channel_packing = True
+        baking_pass.channel_red, baking_pass.channel_green, baking_pass.channel_blue = channels
 
 class Baking_Pass(bpy.types.PropertyGroup):
     name        : bpy.props.StringProperty(name= "Name",        default= "")
@@ -505,24 +1190,59 @@ class Baking_Pass(bpy.types.PropertyGroup):
     file_format : bpy.props.EnumProperty(  name= "File format", items= File_Format_Info.get_file_formats(), default= 'PNG')
     color_depth : bpy.props.EnumProperty(  name= "Color depth", items= update_color_depths)
 
+    # Channel packing: bake several scalar sockets into the channels of one texture
+    use_channel_packing : bpy.props.BoolProperty(  name= "Channel Packing", default= False)
+    channel_red         : bpy.props.EnumProperty(  name= "Red",     items= Channel_Packing_Info.get_channel_sources(), default= 'NONE')
+    channel_green       : bpy.props.EnumProperty(  name= "Green",   items= Channel_Packing_Info.get_channel_sources(), default= 'NONE')
+    channel_blue        : bpy.props.EnumProperty(  name= "Blue",    items= Channel_Packing_Info.get_channel_sources(), default= 'NONE')
+
     # Not used in UI, but must be bound to a Property so its values are retained
     texture_node_color_space : bpy.props.StringProperty(name= "Texture Node Color Space", default= "") # 'Filmic Log', 'Filmic sRGB', 'Linear', 'Linear ACES', 'Linear ACEScg', 'Non-Color', 'Raw', 'sRGB', 'XYZ'
     # invert_roughness : bpy.props.BoolProperty(name = "Invert Roughness", default = False) # TODO add this as an extension for roughness and normal...
 
+class Bake_Queue_Source(bpy.types.PropertyGroup):
+    object : bpy.props.PointerProperty(name= "Object", type= bpy.types.Object)
+
+class Bake_Queue_Job(bpy.types.PropertyGroup):
+    texture_set_name     : bpy.props.StringProperty(    name= "Texture Set name", default= "", subtype='FILE_NAME')
+    object_to_bake_to    : bpy.props.PointerProperty(   name= "Bake to", type= bpy.types.Object)
+    objects_to_bake_from : bpy.props.CollectionProperty(type= Bake_Queue_Source) # The job bakes from these objects to the object to bake to, or from the object to itself if this is empty
+    texture_size         : bpy.props.IntProperty(       name= "Resolution", default= 0, min= 0, description= "Resolution of this job's textures, 0 uses the scene's resolution")
+
+    # The outcome of the last time the queue was baked
+    status  : bpy.props.EnumProperty(  name= "Status", items= [('QUEUED', "Queued", ""), ('FINISHED', "Finished", ""), ('FAILED', "Failed", "")], default= 'QUEUED')
+    message : bpy.props.StringProperty(name= "Message", default= "")
+
 # Register the add-on in Blender
-classes = [Baking_Pass, BakingTools_Props, OBJECT_OT_INITIALIZEBAKINGTOOLS, OBJECT_OT_BatchBake, PROPERTIES_PT_BakingTools]
+property_classes = [Baking_Pass, Bake_Queue_Source, Bake_Queue_Job, BakingTools_Props]
+classes = [OBJECT_OT_INITIALIZEBAKINGTOOLS, OBJECT_OT_SaveBakePreset, OBJECT_OT_BatchBake, OBJECT_OT_AddToBakeQueue, OBJECT_OT_ClearBakeQueue, OBJECT_OT_BakeQueue, OBJECT_OT_PlanBakeMemory, PROPERTIES_PT_BakingTools]
 
-def register():
-    # Register the classes
-    for cls in classes:
+def register_properties():
+    """Register only the scene's baking settings and baking passes, this is all a headless bake needs"""
+    for cls in property_classes:
         bpy.utils.register_class(cls)
 
     bpy.types.Scene.baking_passes = bpy.props.CollectionProperty(type = Baking_Pass) # Create a collection of baking passes for the scene 
     bpy.types.Scene.baking_tools_settings = bpy.props.PointerProperty(type = BakingTools_Props)
+    bpy.types.Scene.bake_queue = bpy.props.CollectionProperty(type = Bake_Queue_Job)
+
+def unregister_properties():
+    del bpy.types.Scene.bake_queue
+    del bpy.types.Scene.baking_tools_settings
+    del bpy.types.Scene.baking_passes
+
+    for cls in reversed(property_classes):
+        bpy.utils.unregister_class(cls)
+
+def register():
+    register_properties()
+
+    # Register the UI and the operators
+    for cls in classes:
+        bpy.utils.register_class(cls)
 
 def unregister():
     for cls in classes:
         bpy.utils.unregister_class(cls)
 
-    del bpy.types.Scene.baking_tools_settings
-    del bpy.types.Scene.baking_passes
\ No newline at end of file
+    unregister_properties()
\ No newline at end of file
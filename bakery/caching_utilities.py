@@ -1,7 +1,281 @@
 import bpy
-import functools
+import collections.abc
+import operator
 
 #{ CACHED_RNA_REGION
+class PropertySchemaEntry():
+    """A single leaf property of a PropertySchema.
+    The breadcrumb path to the property is compiled into accessor functions once, so reading or writing the property doesn't have to split and follow the path every time.
+    """
+    def __init__(self, path, rna_property, owner_identifier):
+        self.path = path                                   # Full breadcrumb path to the property. Example: "bake.image_settings.file_format"
+        self.owner_path, _, self.identifier = path.rpartition(".") # Split the path into the path of the struct that owns the property and the property's own identifier. Example: "bake.image_settings" + "file_format"
+        self.owner_identifier = owner_identifier           # The RNA identifier of the struct that owns the property. Example: "ImageFormatSettings"
+        self.rna_property = rna_property                   # The bpy.types.Property that describes the property
+        self.property_type = type(rna_property)            # Example: bpy.types.EnumProperty
+        self.is_readonly = rna_property.is_readonly
+        self.array_dimensions = [dimension for dimension in getattr(rna_property, "array_dimensions", ()) if dimension] # Only Bool, Int and Float properties can be arrays. Example: [4] for a color, [4, 4] for a matrix, [] for a single value
+
+        # Precompile the accessor chains, operator.attrgetter splits the dotted path a single time when it is created
+        self.get_value = operator.attrgetter(path) # Follows the breadcrumbs from the top level object all the way down to the property value
+        if self.owner_path:
+            self.get_owner = operator.attrgetter(self.owner_path) # Follows the breadcrumbs from the top level object down to the struct that owns the property
+        else:
+            self.get_owner = PropertySchemaEntry.get_top_level_object # The property belongs directly to the top level object
+
+    @staticmethod
+    def get_top_level_object(top_level_object):
+        return top_level_object
+
+    def get_owner_or_none(self, top_level_object):
+        """Get the struct that owns the property, or None if one of the pointers on the way to it isn't set"""
+        owner = top_level_object
+        for identifier in self.owner_path.split(".") if self.owner_path else ():
+            owner = getattr(owner, identifier)
+            if owner is None:
+                return None
+        return owner
+
+    def read_value(self, top_level_object):
+        """Get the current value of the property from the given top level object, or None if one of the pointers on the way to it isn't set.
+        Array properties return a bpy_prop_array that still points at the live data, so they are copied into tuples to make a real snapshot of the value.
+        """
+        try:
+            value = self.get_value(top_level_object)
+        except AttributeError:
+            if self.get_owner_or_none(top_level_object) is not None:
+                raise
+            return None
+        if len(self.array_dimensions) == 1:
+            return tuple(value)
+        if len(self.array_dimensions) > 1:
+            return tuple(tuple(row) for row in value) # Example: a 4x4 matrix becomes a tuple of 4 tuples
+        return value
+
+    def validate_value(self, value, dimensions = None):
+        """Check that a value loaded from a preset can be assigned to the property, and convert it from its JSON form back to the form read_value() returns.
+        Raises ValueError if the value can't be assigned.
+        """
+        if dimensions is None:
+            if self.is_readonly:
+                raise ValueError("\"{p}\" is read-only".format(p = self.path))
+            if self.property_type == bpy.types.PointerProperty:
+                raise ValueError("\"{p}\" points to a data-block, it can't be loaded from a preset".format(p = self.path))
+            dimensions = self.array_dimensions
+
+        # Arrays are written as nested lists. Example: a color is [1.0, 1.0, 1.0, 1.0]
+        if dimensions:
+            if not isinstance(value, (list, tuple)) or len(value) != dimensions[0]:
+                raise ValueError("\"{p}\" must be an array of {d}, got {v}".format(p = self.path, d = " x ".join(str(dimension) for dimension in self.array_dimensions), v = value))
+            return tuple(self.validate_value(item, dimensions[1:]) for item in value)
+
+        property_type = self.property_type
+        if property_type == bpy.types.EnumProperty and self.rna_property.is_enum_flag:
+            valid = isinstance(value, (list, tuple, set)) and all(isinstance(item, str) for item in value)
+            value = set(value) if valid else value # Enum flags are sets of identifiers, JSON stores them as lists
+        elif property_type in (bpy.types.EnumProperty, bpy.types.StringProperty):
+            valid = isinstance(value, str) # The valid enum_items can depend on other properties, they're checked when the value is applied
+        elif property_type == bpy.types.BoolProperty:
+            valid = isinstance(value, bool)
+        elif property_type == bpy.types.IntProperty:
+            valid = isinstance(value, int) and not isinstance(value, bool)
+        elif property_type == bpy.types.FloatProperty:
+            valid = isinstance(value, (int, float)) and not isinstance(value, bool)
+            value = float(value) if valid else value
+        else:
+            valid = False
+        if not valid:
+            raise ValueError("\"{p}\" is a {t}, it can't be set to {v}".format(p = self.path, t = property_type.__name__, v = repr(value)))
+
+        # Numbers have to be in the property's hard range, Blender would clamp them
+        hard_min = getattr(self.rna_property, "hard_min", None)
+        hard_max = getattr(self.rna_property, "hard_max", None)
+        if property_type in (bpy.types.IntProperty, bpy.types.FloatProperty) and hard_min is not None and not hard_min <= value <= hard_max:
+            raise ValueError("\"{p}\" must be between {a} and {b}, got {v}".format(p = self.path, a = hard_min, b = hard_max, v = value))
+        return value
+
+class PropertySchema():
+    """A flattened index of every leaf property that CachedProperties will cache for a given bpy_struct type.
+    Walking "bl_rna.properties" and following each nested PointerProperty is expensive, so the walk is only done once per type.
+    Every CachedProperties object of the same type will then reuse the same schema and can capture its values in a single linear pass.
+
+    Use PropertySchema.get_schema() instead of instantiating this class directly so the schemas are shared.
+    """
+    schemas = {} # Keep a single schema per bpy_struct type: {bpy.types.RenderSettings : PropertySchema}
+
+    # Some properties can only be applied after other properties that belong to the same object: {(struct identifier, property identifier) : (identifiers it depends on)}
+    # Example: "color_depth" can't be set to '16' while "file_format" is set to 'TARGA', so "file_format" has to be applied first
+    # The "*" identifier declares dependencies for every property of the struct
+    # The valid enum_items of these EnumProperties are also cached based on the values of the properties they depend on, see CachedProperties.get_valid_enum_options()
+    declared_dependencies = {("RenderSettings",           "*")           : ("engine",),
+                             ("ImageFormatSettings",      "color_depth") : ("file_format",),
+                             ("ImageFormatSettings",      "color_mode")  : ("file_format",),
+                             ("ImageFormatSettings",      "exr_codec")   : ("file_format", "color_depth"),
+                             ("ImageFormatSettings",      "tiff_codec")  : ("file_format",),
+                             ("ColorManagedViewSettings", "look")        : ("view_transform",),
+                             ("ColorManagedViewSettings", "view_transform") : (),
+                             ("ColorManagedInputColorspaceSettings", "name") : ()}
+    basic_property_types = None # Populated the first time a schema is built, see get_basic_property_types()
+
+    @classmethod
+    def get_schema(cls, object_to_index):
+        """Get the schema for the type of the given bpy_struct instance, building it if it doesn't exist yet"""
+        object_type = type(object_to_index)
+        schema = cls.schemas.get(object_type, None)
+        if not schema:
+            schema = cls(object_to_index)
+            cls.schemas[object_type] = schema
+        return schema
+
+    @classmethod
+    def get_basic_property_types(cls):
+        """Get the list of property types that hold a value directly"""
+        if cls.basic_property_types is None:
+            # The bpy.types.Property.__subclasses__() list has two types that are problematic and throw false positives when checking property types of a class.
+            complex_property_types = [bpy.types.PointerProperty, bpy.types.CollectionProperty]
+            # Auto populate this list, in Blender 3.4.1 this list comprises class references for the following bpy.types:
+            # EnumProperty, FloatProperty, IntProperty, BoolProperty, StringProperty
+            cls.basic_property_types = [subclass for subclass in bpy.types.Property.__subclasses__() if subclass not in complex_property_types]
+        return cls.basic_property_types
+
+    def __init__(self, object_to_index):
+        """In order to index the PointerProperties of a bpy_struct, we have to read them from an instance.
+        The PointerProperties of a type will be blank, so we can't get the properties that belong to their subobjects.
+        """
+        self.object_type = type(object_to_index)
+        self.entries = [] # Flat list of PropertySchemaEntry objects for every leaf property, sorted in the order they should be applied
+        self.index_struct(object_to_index)
+        self.entries_by_slot = list(self.entries) # The entries in the order they were found, each entry's slot is its index in this list, CachedProperties stores its values by slot
+        for slot, entry in enumerate(self.entries_by_slot):
+            entry.slot = slot
+        self.entries_by_path = {entry.path : entry for entry in self.entries} # Look up entries by their full breadcrumb path
+        self.entries_by_owner = {} # Group the entries by the struct they belong to so we can find the siblings of a property: {"bake.image_settings" : [PropertySchemaEntry]}
+        for entry in self.entries:
+            self.entries_by_owner.setdefault(entry.owner_path, []).append(entry)
+
+        self.deferred_paths = set() # Properties that were learned to depend on their siblings because they could only be applied on a later pass
+        self.sort_entries_by_dependencies()
+
+    def index_struct(self, struct, breadcrumbs = None):
+        """Add an entry for each property of the given struct, then recursively index the structs that its PointerProperties point to"""
+        basic_property_types = self.get_basic_property_types()
+
+        for property in struct.bl_rna.properties: # Get the list of properties from this bpy_struct
+            if property.identifier == 'rna_type': # exclude the "rna_type" property
+                continue
+
+            property_type = type(property)
+            if breadcrumbs:
+                property_with_breadcrumbs = ".".join([breadcrumbs, property.identifier]) # Create the full path to the property by adding its breadcrumbs. Example: "bake" + "."  + "margin"
+            else:
+                property_with_breadcrumbs = property.identifier
+
+            if property_type in basic_property_types: # Check if the property is a basic type
+                self.entries.append(PropertySchemaEntry(property_with_breadcrumbs, property, struct.bl_rna.identifier))
+
+            elif property_type == bpy.types.CollectionProperty:
+                # TODO do collection property things here... https://docs.blender.org/api/current/bpy.types.bpy_prop_collection.html
+                continue
+
+            # If this is a pointer property, it points to a different bpy_struct object.
+            elif property_type == bpy.types.PointerProperty:
+                subobject = getattr(struct, property.identifier)
+                # Some pointer properties such as "bake.cage_object" or "Node.parent" may not be set, their value will be cached as the reference itself, or None
+                # The schema is shared by every instance of the type, so it can't follow a pointer that's only set on the instance it was built from
+                # Pointers to ID data-blocks (Objects, Images, etc.) are references to other data, not part of this struct, so their value is cached as the reference itself
+                if subobject is None or not property.is_never_none or isinstance(subobject, bpy.types.ID):
+                    self.entries.append(PropertySchemaEntry(property_with_breadcrumbs, property, struct.bl_rna.identifier))
+                else:
+                    self.index_struct(subobject, breadcrumbs = property_with_breadcrumbs)
+
+    def get_dependency_entries(self, entry):
+        """Get the entries that have to be applied before the given entry"""
+        declared = PropertySchema.declared_dependencies
+        identifiers = declared.get((entry.owner_identifier, entry.identifier), ()) + declared.get((entry.owner_identifier, "*"), ())
+        siblings = self.entries_by_owner[entry.owner_path]
+
+        if entry.path in self.deferred_paths:
+            # This property has to be applied after the rest of its siblings
+            return [sibling for sibling in siblings if sibling.path not in self.deferred_paths]
+
+        return [sibling for sibling in siblings if sibling.identifier in identifiers and sibling is not entry]
+
+    def get_apply_rank(self, entry, ranks, visiting = ()):
+        """Get the number of dependencies that have to be applied in sequence before the given entry can be applied"""
+        if entry.path in ranks:
+            return ranks[entry.path]
+        if entry.path in visiting:
+            return 0 # The dependencies form a cycle, the entries will have to be resolved by the recursive fallback in CachedProperties.apply_properties_to_object()
+
+        rank = 0
+        for dependency in self.get_dependency_entries(entry):
+            rank = max(rank, self.get_apply_rank(dependency, ranks, visiting + (entry.path,)) + 1)
+        ranks[entry.path] = rank
+        return rank
+
+    def sort_entries_by_dependencies(self):
+        """Sort the entries in topological order so that every property is applied after the properties it depends on.
+        Entries with no dependencies keep the order they were found in.
+        """
+        ranks = {}
+        for entry in self.entries:
+            entry.apply_rank = self.get_apply_rank(entry, ranks)
+        original_order = {entry.path : index for index, entry in enumerate(self.entries)}
+        self.entries.sort(key = lambda entry: (entry.apply_rank, original_order[entry.path]))
+        for position, entry in enumerate(self.entries):
+            entry.apply_position = position # Sorting by position puts any subset of the entries in the same order as the full list
+
+    def defer(self, path):
+        """Learn that a property could only be applied after its siblings, so it can be applied in the right order next time"""
+        if path in self.deferred_paths:
+            return
+        self.deferred_paths.add(path)
+        self.sort_entries_by_dependencies()
+
+    def order_paths(self, paths):
+        """Sort a collection of property paths into the order they should be applied"""
+        if len(paths) == len(self.entries):
+            return [entry.path for entry in self.entries] # All of the properties are being applied, the entries are already in order
+        entries_by_path = self.entries_by_path
+        return sorted(paths, key = lambda path: entries_by_path[path].apply_position)
+
+    def capture_values(self, top_level_object):
+        """Read the value of every property in the schema from the given object in a single pass, the values are listed by slot"""
+        return [entry.read_value(top_level_object) for entry in self.entries_by_slot]
+
+class CachedPropertiesView(collections.abc.MutableMapping):
+    """A dictionary view of the values of a CachedProperties object, keyed by breadcrumb path: {"bake.margin" : 16}
+    CachedProperties used to store its values in a dictionary, this view keeps that interface working. Reads and writes go straight to the slots.
+    """
+    __slots__ = ("cached_properties",)
+
+    def __init__(self, cached_properties):
+        self.cached_properties = cached_properties
+
+    def __getitem__(self, path):
+        return self.cached_properties.get_property(path)
+
+    def __setitem__(self, path, value):
+        self.cached_properties.set_property(path, value)
+
+    def __delitem__(self, path):
+        raise TypeError("Properties can't be removed from CachedProperties, set them to UNASSIGNED_VALUE instead")
+
+    def __iter__(self):
+        return (entry.path for entry in self.cached_properties.schema.entries_by_slot)
+
+    def __len__(self):
+        return len(self.cached_properties.schema.entries_by_slot)
+
+    def __contains__(self, path):
+        return path in self.cached_properties.schema.entries_by_path
+
+    def items(self):
+        return zip(self, self.cached_properties.get_values())
+
+    def copy(self):
+        return dict(self.items())
+
 class CachedProperties():
     """Blender's built in types (bpy.types) are handled through the "bl_rna" data access system and can't be instantiated manually like regular objects.
     This system has positives in the Blender API, but it prevents us from easily caching data from these objects using a copy constructor.
@@ -15,6 +289,10 @@ class CachedProperties():
     https://docs.blender.org/api/current/bpy.types.RenderSettings.html
     """
     UNASSIGNED_VALUE = "UNASSIGNED_VALUE" # Use this as a flag instead of "None" in case a property makes use of NoneType, empty strings, or other falsy values
+    __slots__ = ("top_level_object", "object_type", "schema", "captured_values", "assigned_values",
+                 "properties_that_failed_to_apply_previous_pass", "writes_applied", "writes_skipped")
+    enum_dependencies = {} # Resolved dependencies for each EnumProperty: {(bpy_struct type, enum identifier) : (identifiers it depends on)}
+    enum_items_cache = {}  # Valid enum_items that have already been probed: {(bpy_struct type, enum identifier, (values it depends on)) : [enum_items]}
 
     def __init__(self, object_to_cache = None, cache_to_copy = None, dont_assign_values = False):
         """This will act like a pseudo copy constructor for the bpy_struct object that is passed in. A deep copy of all property values will be cached into a dictionary.
@@ -24,8 +302,13 @@ class CachedProperties():
         If we copy values from an instance, this is not an issue, since the PointerProperties will be set to point at their appropriate subobjects.
 
         We might only want to keep a list of the properties WITHOUT their values.
-        If dont_assign_values is true, all of the values in the "properties" dictionary will be set to UNASSIGNED_VALUE.
-        The dictionary's keys will be retained, so we'll still have all of the property names that belong to the cached object.
+        If dont_assign_values is true, all of the values will be UNASSIGNED_VALUE until they are set.
+        The schema will be retained, so we'll still have all of the property names that belong to the cached object.
+
+        The values are stored by the slot that the schema gives each property instead of by their breadcrumb paths:
+        captured_values is the list of values that were read from the object, it's never modified so copies can share it.
+        assigned_values is a sparse overlay of the values that were set after the capture: {slot : value}
+        Copying only copies the overlay, and unassigning all of the values only drops the captured list.
 
         Example:
         "bpy.types.RenderSettings" has a PointerProperty called "bake" which is supposed to point at a "bpy.types.BakeSettings" object, but there's no way to know this before the RenderSettings object has been initialized
@@ -45,149 +328,135 @@ class CachedProperties():
             if not issubclass(self.object_type, bpy.types.bpy_struct):
                 raise TypeError("The provided object {o} is a {t} not a bpy_struct, its properties can't be cached in this object.".format(o = object_to_cache, t = self.object_type))
 
-            # Make a dictionary of the top-level properties for the object that this object will cache
-            self.properties = self.build_properties_dictionary(object_to_cache)
-
-            self.still_has_subproperties = True # TODO make this based on number of PointerProperties which won't always be greater than 0 on the first iteration
-            while self.still_has_subproperties:
-                self.get_subproperties()
+            # Get the shared schema for this type, then read the values of all of its properties, including the properties of nested PointerProperties
+            self.schema = PropertySchema.get_schema(object_to_cache)
+            self.captured_values = None if dont_assign_values else self.schema.capture_values(object_to_cache) # Don't read values that would be unassigned right away
+            self.assigned_values = {}
 
         # Initialize with an existing CachedProperties object
         elif cache_to_copy:
             self.top_level_object = cache_to_copy.top_level_object
             self.object_type =      cache_to_copy.object_type
+            self.schema =           cache_to_copy.schema
 
-            properties_deep_copy = {}
-            for key, value in cache_to_copy.properties.items():
-                properties_deep_copy[key] = value
-            self.properties = properties_deep_copy
-
-            self.still_has_subproperties = False
+            # The captured values are shared, the values are immutable so only the overlay has to be copied
+            self.captured_values = cache_to_copy.captured_values
+            self.assigned_values = dict(cache_to_copy.assigned_values)
 
         else:
             raise TypeError("Not enough arguments: Either object_to_cache OR cache_to_copy must be passed in to initialize this object.")
 
         self.properties_that_failed_to_apply_previous_pass = [] # Used for recursively applying properties: Keep track of the properties that couldn't be applied on previous pass
+        self.writes_applied = 0 # Keep count of the properties that were written to an object, and the ones that were skipped because they already had the right value
+        self.writes_skipped = 0
 
         if dont_assign_values:
             self.unassign_values_in_properties_dictionary()
 
-    def unassign_values_in_properties_dictionary(self):
-        """Set all of the values in the properties dictionary to UNASSIGNED_VALUE"""
-
-        for key in self.properties.copy(): # Make a temporary copy so we aren't editing the values of the dictionary while iterating through it
-            self.properties[key] = self.UNASSIGNED_VALUE # Set each of the values to the UNASSIGNED_VALUE
-
-    def get_subproperties(self):
-    # Get the properties from the pointer properties...
-        pointer_property_paths = [] # Keep a list of properties that are of type bpy.types.PointerProperty
-        subproperties = {}
-        unset_pointer_property_paths = [] # Some pointer properties such as "bake.cage_object", "image_settings.view_settings.curve_mapping", and "bake.image_settings.view_settings.curve_mapping" may not be set, the value for these properties should be set to None
-        for property_path, property_value in self.properties.items():
-            if issubclass(type(property_value), bpy.types.bpy_struct):
-                try:
-                    # TODO Find a way to check if the PointerProperty points at a fixed_type or if it is unset and points at NoneType before trying to build the properties dictionary
-                    # .fixed_type points at the actual object instead of the PonterProperty itself
-                    props = self.build_properties_dictionary(property_value.fixed_type, breadcrumbs= property_path)
-                    pointer_property_paths.append(property_path)
-                    subproperties.update(props) # Append this props dictionary to the subproperties dictionary
-                except AttributeError as e:
-                    # if the pointer property points to a UI element that hasn't been set by the user then it will return NoneType, which will be caught by this exception
-                    # print(repr(e))
-                    unset_pointer_property_paths.append(property_path)
-
-        for unset_pointer_property_path in unset_pointer_property_paths:
-            self.properties[unset_pointer_property_path] = None
-
-        if len(pointer_property_paths):
-            # Now that we've gotten the subproperties of the pointer properties, remove the pointer property keys from the dictionary
-            for pointer_property_path in pointer_property_paths:
-                del self.properties[pointer_property_path]
-
-            # Append the new subproperties to the self.properties dictionary
-            self.properties.update(subproperties)
-        else:
-            self.still_has_subproperties = False
+    @property
+    def properties(self):
+        """The values keyed by breadcrumb path, as a dictionary view. Example: {"bake.margin" : 16, "bake.target" : 'IMAGE_TEXTURES'}"""
+        return CachedPropertiesView(self)
 
-    def build_properties_dictionary(self, object_to_copy_from, breadcrumbs = None):
-        """This will return a list of properties for the given bpy_struct object
-            Some of the properties we want are stored inside of readonly subobjects
-            Example: the bpy_struct bpy.types.RenderSettings has a property "bake" which is itself a readonly bpy_struct of type bpy.types.BakeSettings
-            If we want to cache the values for each of these bake settings as well, we will need go through the bpy_struct properties recursively #TODO fix this definition to be more accurate to the implementation
-        """
-
-        # The bpy.types.Property.__subclasses__() list has two types that are problematic and throw false positives when checking property types of a class.
-        complex_property_types = [bpy.types.PointerProperty, bpy.types.CollectionProperty]
-        basic_property_types = [] # Auto populate this list, in Blender 3.4.1 this list comprises class references for the following bpy.types:
-                                  # EnumProperty, PointerProperty, FloatProperty, IntProperty, BoolProperty, StringProperty, CollectionProperty
-        # Make a list of potential property types, excluding the complex types that can trigger false positives
-        for subclass in bpy.types.Property.__subclasses__():
-            if subclass not in complex_property_types: # Exclude the complex types from the list of basic types
-                basic_property_types.append(subclass)
-        # TODO do this ^ once for the CachedProperties class since this doesn't change.
-
-        new_properties = {}
-        for property in object_to_copy_from.bl_rna.properties: # Get the list of properties from this bpy_struct
-            if property.identifier == 'rna_type': # exclude the "rna_type" property
-                continue
-
-            property_type = type(property)
-
-            if property_type in basic_property_types: # Check if the property is a basic type
-                if breadcrumbs:
-                    property_with_breadcrumbs = ".".join([str(breadcrumbs), property.identifier]) # Create the full path to the property by adding its breadcrumbs. Example: "render.bake" + "."  + "margin"
-                    property_value = functools.reduce(getattr, property_with_breadcrumbs.split("."), self.top_level_object) # Follow the breadcrumbs until we arrive at the bottom-most property so we can get its value
-
-                    new_properties[property_with_breadcrumbs] = property_value # Add the property value to the dictionary with its full breadcrumb path and identifier as the key
-                    continue
-                else:
-                    new_properties[property.identifier] = getattr(self.top_level_object, property.identifier) # Add the property value to the dictionary with its identifier as the key
-
-            elif property_type == bpy.types.CollectionProperty:
-                # TODO do collection property things here... https://docs.blender.org/api/current/bpy.types.bpy_prop_collection.html
-                # for i in property.items():
-                #     print(i)
-                # properties_from_struct.append(property.identifier)
-                continue
-
-            # If this is a pointer property, it points to a different bpy_struct object.
-            # For now, well store a reference to this object as a value in the dictionary with its full breadcrumb path as the key
-            # We will come back later to get the values of each of its properties 
-            elif property_type == bpy.types.PointerProperty:
-                if breadcrumbs:
-                    property_with_breadcrumbs = ".".join([str(breadcrumbs), property.identifier])
-                    new_properties[property_with_breadcrumbs] = property
-                else:
-                    new_properties[property.identifier] = property
+    def unassign_values_in_properties_dictionary(self):
+        """Set all of the values to UNASSIGNED_VALUE"""
+        self.captured_values = None
+        self.assigned_values = {}
 
-        return new_properties
+    def get_entry(self, property):
+        entry = self.schema.entries_by_path.get(property)
+        if entry is None:
+            raise KeyError("{s} was initialized to store {i} data, which has no \"{p}\" property".format(s = self, i = self.object_type, p = property))
+        return entry
+
+    def get_slot_value(self, slot):
+        if slot in self.assigned_values:
+            return self.assigned_values[slot]
+        if self.captured_values is None:
+            return self.UNASSIGNED_VALUE
+        return self.captured_values[slot]
+
+    def get_property(self, property):
+        """Get a property value, UNASSIGNED_VALUE if it was never assigned"""
+        return self.get_slot_value(self.get_entry(property).slot)
+
+    def get_values(self):
+        """Get every value, listed by slot"""
+        if self.captured_values is None:
+            values = [self.UNASSIGNED_VALUE] * len(self.schema.entries_by_slot)
+        else:
+            values = list(self.captured_values)
+        for slot, value in self.assigned_values.items():
+            values[slot] = value
+        return values
+
+    def get_assigned_entries(self):
+        """Get the entry and value of every property that has an assigned value, in the order they should be applied: [(PropertySchemaEntry, value)]"""
+        if self.captured_values is None:
+            entries_by_slot = self.schema.entries_by_slot
+            assigned_entries = [(entries_by_slot[slot], value) for slot, value in self.assigned_values.items() if value != self.UNASSIGNED_VALUE]
+            assigned_entries.sort(key = lambda assigned_entry: assigned_entry[0].apply_position)
+            return assigned_entries
+        values = self.get_values() if self.assigned_values else self.captured_values
+        unassigned_value = self.UNASSIGNED_VALUE
+        return [(entry, values[entry.slot]) for entry in self.schema.entries if values[entry.slot] != unassigned_value]
 
     def set_property(self, property, value):
         """Set a property value"""
-        if property not in self.properties.keys():
-            raise KeyError("{s} was initialized to store {i} data, which has no \"{p}\" property".format(s = self, i = self.object_type, p = property))
-
-        # Update the value in the dictionary
-        self.properties[property] = value
+        self.assigned_values[self.get_entry(property).slot] = value
 
     def set_properties(self, **kwargs):
         """Set an arbitrary amount of property values, these will override values set in the pseudo 'copy constructor'"""
         for key, value in kwargs.items():
             self.set_property(key, value)
 
-    def get_valid_enum_options(self, object, property):
-        # Blender's EnumProperties are dynamic, in several cases they are initialized with ['NONE'], then Blender handles adding enum_items later.
-        # Problem: Querying property.enum_items in Python does not return the current list of enum_items, it only returns the items that were available at initialization which is often: ['NONE']
-        # However, an error will be thrown when trying to set the EnumProperty with an incorrect value, the error will contain a current list of enum_items
-        # HACK: Intentionally try to set the property with an incorrect value, then get the list of valid options from the error message.
+    def get_enum_dependencies(self, object, property):
+        """Get the identifiers of the sibling properties that the list of valid enum_items for the given EnumProperty depends on"""
+        key = (type(object), property.identifier)
+        dependencies = self.enum_dependencies.get(key, None)
+        if dependencies is None:
+            dependencies = PropertySchema.declared_dependencies.get((object.bl_rna.identifier, property.identifier), None)
+            if dependencies is None:
+                # The dependencies of this EnumProperty haven't been declared, assume its enum_items could depend on any of the other EnumProperties that belong to the same object
+                dependencies = tuple(sibling.identifier for sibling in object.bl_rna.properties
+                                     if type(sibling) == bpy.types.EnumProperty and sibling.identifier != property.identifier and not sibling.is_enum_flag)
+            self.enum_dependencies[key] = dependencies
+        return dependencies
 
-        # TODO determine if the code ever reaches this
+    def get_valid_enum_options(self, object, property):
+        """Get the current list of valid enum_items for a dynamic EnumProperty.
+        The items are cached by the object's type, the property's identifier, and the current values of the properties the items depend on.
+        When one of those values changes, the key changes too, so the items will be probed again.
+        """
         # HACK check if the dynamic EnumProperty currently has items, it will return an empty string if there are no items
         current_value = getattr(object, property.identifier)
         if current_value == "": # Don't use the more Pythonic "if current_value:" to avoid falsy "0", "None" and ('null') values
             print("Empty Enum")
             raise KeyError("{o}'s {p} enum_items has no valid options".format(o = object, p = property))
 
+        dependency_values = tuple(getattr(object, dependency) for dependency in self.get_enum_dependencies(object, property))
+        key = (type(object), property.identifier, dependency_values)
+        enum_items = self.enum_items_cache.get(key, None)
+        if enum_items is None:
+            enum_items = self.probe_valid_enum_options(object, property)
+            self.enum_items_cache[key] = enum_items
+        return enum_items
+
+    def invalidate_enum_options(self, object, property):
+        """Remove the cached enum_items for the given EnumProperty, they will be probed again the next time they are needed"""
+        for key in [key for key in self.enum_items_cache if key[:2] == (type(object), property.identifier)]:
+            del self.enum_items_cache[key]
+
+    @classmethod
+    def clear_enum_items_cache(cls):
+        """Forget all of the cached enum_items. Some items depend on state outside of the cached object, such as the user preferences or the OpenColorIO configuration"""
+        cls.enum_items_cache.clear()
+
+    def probe_valid_enum_options(self, object, property):
+        # Blender's EnumProperties are dynamic, in several cases they are initialized with ['NONE'], then Blender handles adding enum_items later.
+        # Problem: Querying property.enum_items in Python does not return the current list of enum_items, it only returns the items that were available at initialization which is often: ['NONE']
+        # However, an error will be thrown when trying to set the EnumProperty with an incorrect value, the error will contain a current list of enum_items
+        # HACK: Intentionally try to set the property with an incorrect value, then get the list of valid options from the error message.
         try:
             setattr(object, property.identifier, "INTENTIONALLY_INCORRECT_VALUE")
         except TypeError as e:
@@ -199,51 +468,69 @@ class CachedProperties():
 
         return enum_items
 
-    def apply_properties_to_object(self, top_level_object, properties_to_apply = None):
-        """Apply the properties to the given object"""
-
-        # If no properties were passed in, use the main list of properties
-        if not properties_to_apply:
-            properties_to_apply = self.properties
+    def restore_changed_properties(self, top_level_object):
+        """Snapshot-diff restore: Compare the current values of the given object against this snapshot and only write back the properties that differ.
+        Each RNA write can trigger depsgraph and UI updates, so skipping the properties that still have their cached value makes restoring much cheaper.
+        Returns the number of writes that were skipped.
+        """
+        self.writes_applied = 0
+        self.writes_skipped = 0
+        self.apply_properties_to_object(top_level_object, only_changed = True)
+        return self.writes_skipped
+
+    def apply_properties_to_object(self, top_level_object, properties_to_apply = None, only_changed = False):
+        """Apply the properties to the given object
+        If only_changed is True, properties that already have the cached value on the object will not be written again.
+        """
 
         if not isinstance(top_level_object, self.object_type):
             raise TypeError("{s} was initialized to store {i} data. It can't apply its properties to {o} which is a {t} type".format(s = self, i = self.object_type, o = top_level_object, t = type(top_level_object)))
 
-        # Recursively apply properties:
-        # Some EnumProperties can't be successfully applied in a single pass because the list of valid enum_items for one property may be dependent on another property.
+        # Apply properties in dependency order:
+        # Some EnumProperties can't be successfully applied in any order because the list of valid enum_items for one property may be dependent on another property.
         # Example: bpy.context.scene.render.image_settings.color_depth is dependent on bpy.context.scene.render.image_settings.file_format - "color_depth" can't be set to '16' while "file_format" is set to 'TARGA'
-        # Since we can't guarantee that the CachedProperties class will apply the properties in an order that will avoid these dependencies, we will apply the properties across several passes.
-        # We will keep track of all properties that could not be applied in a given pass, and try to apply them again in subsequent passes.
+        # The schema sorts the properties so that each one is applied after the properties it depends on, so a single pass is enough in the normal case.
+        # Recursively apply properties as a fallback:
+        # Dependencies that the schema doesn't know about yet can still make a property fail, so we will keep track of all properties that could not be applied in a given pass, and try to apply them again in subsequent passes.
+        # The schema learns from these properties, so they'll be applied in the right order next time.
         properties_that_failed_to_apply_current_pass = []
 
-        # Check each of the assigned settings, if they have values in the dictionary, assign them
-        for property, value in properties_to_apply.items():
+        # If no properties were passed in, use every assigned property. The entries hold the precompiled accessors for each property
+        is_fallback_pass = bool(properties_to_apply)
+        if is_fallback_pass:
+            entries_by_path = self.schema.entries_by_path
+            entries_to_apply = [(entries_by_path[path], properties_to_apply[path]) for path in self.schema.order_paths(properties_to_apply)]
+        else:
+            entries_to_apply = self.get_assigned_entries()
+
+        # Check each of the assigned settings, if they have values, assign them
+        for entry, value in entries_to_apply:
+            property = entry.path
             # If the value was never assigned, skip this property
             if value == self.UNASSIGNED_VALUE:
                 continue
 
-            object_to_update = top_level_object
-            property_to_update = property
-
-            # If the property_to_update doesn't directly belong to the top_level_object, we need to drill down to get a reference to the object_to_update that the property does belong to
-            if "." in property:
-                # Set the property on a nested object
-                path, property_to_update = property.rsplit(".", 1) # Split the bread crumb path, store the first element on the right and the name of the property_to_update
-                path = path.split(".") # Split the remainder of the path
-                object_to_update = top_level_object # Start at the top_level_object before we drill down through its nested subobjects
-                # Drill down through the list of objects until we have a reference to the object that the property_to_update belongs to
-                while path:
-                    subobject, path = path[0], path[1:]
-                    object_to_update = getattr(object_to_update, subobject)
-
-            property_to_check = object_to_update.bl_rna.properties[property_to_update] # Get the property by name from the class
-
             # If the property is read-only skip it
-            if property_to_check.is_readonly:
+            if entry.is_readonly:
+                continue
+
+            # If the property_to_update doesn't directly belong to the top_level_object, the entry will drill down to get a reference to the object_to_update that the property does belong to
+            try:
+                object_to_update = entry.get_owner(top_level_object)
+            except AttributeError:
+                object_to_update = entry.get_owner_or_none(top_level_object) # Still raises if the path doesn't exist
+            if object_to_update is None:
+                continue # A pointer on the way to the property isn't set, so there's nothing to write to
+            property_to_update = entry.identifier
+            property_to_check = entry.rna_property
+
+            # Skip the write if the object already has the value we're trying to apply
+            if only_changed and entry.read_value(top_level_object) == value:
+                self.writes_skipped += 1
                 continue
 
             # Check if the value we're trying to apply is valid for the property
-            property_type = type(property_to_check)
+            property_type = entry.property_type
 
             # Check valid options in enums
             if property_type == bpy.types.EnumProperty:
@@ -261,7 +548,20 @@ class CachedProperties():
                 # raise TypeError("The \"{p}\" property can only take values of type {t}. {v} can't be assigned to it".format(p = key, t = property_type, v = value))
 
             # Apply the cached value to the object's property
-            setattr(object_to_update, property_to_update, value)
+            try:
+                setattr(object_to_update, property_to_update, value)
+            except TypeError as e:
+                if property_type != bpy.types.EnumProperty:
+                    raise
+                # The cached enum_items were out of date, they depend on something outside of the object. Probe them again on the next pass
+                print(repr(e))
+                self.invalidate_enum_options(object_to_update, property_to_check)
+                properties_that_failed_to_apply_current_pass.append(property)
+                continue
+            self.writes_applied += 1
+
+            if is_fallback_pass:
+                self.schema.defer(property) # This property only succeeded after an earlier pass, learn to apply it after its siblings
 
         # Compare the properties that failed to apply during the previous pass with the properties that failed to apply during the current pass
         # If they aren't the same, some additional properties must have been successfully applied. Continue to the next recursive pass since some property dependencies may have been resolved during this pass
@@ -276,34 +576,123 @@ class CachedProperties():
                 # Make a dictionary of properties and their values that failed to apply during the pass 
                 failed_properties = {}
                 for property in properties_that_failed_to_apply_current_pass:
-                    failed_properties[property] = self.properties[property] # Get the property value from the full list of properties
+                    failed_properties[property] = self.get_property(property) # Get the property value from the full list of properties
                 longest_key   = max(failed_properties.keys(),   key=len)
                 longest_value = max(failed_properties.values(), key=len)
                 
                 # Print the properties and values that failed to apply
                 print("\nCachedProperties was unable to apply the following properties:")
                 for key, value in failed_properties.items():
-                    properties = object_to_update.bl_rna.properties
-                    if key in properties:
-                        property_to_check = object_to_update.bl_rna.properties[key]
-                        try:
-                            valid_options = self.get_valid_enum_options(object_to_update, property_to_check)
-                        except KeyError as e:
-                            print(repr(e))
-                        print("{k: <{lk}} | The provided value \"{v: <{lv}}\" was not in {i}".format(lk=len(longest_key), lv=len(longest_value), k= key, v= value, i= valid_options))
-                    else:
-                        print("{k: <{lk}} | was not found in {o}".format(lk=len(longest_key), k= key, o= type(object_to_update)))
-
-                self.apply_properties_to_object(top_level_object, failed_properties) # call this function recursively to try to reapply the properties that failed to apply in this pass
+                    entry = self.schema.entries_by_path[key]
+                    object_to_update = entry.get_owner(top_level_object)
+                    valid_options = []
+                    try:
+                        valid_options = self.get_valid_enum_options(object_to_update, entry.rna_property) # The enum_items were cached while applying the property, so this is a lookup
+                    except KeyError as e:
+                        print(repr(e))
+                    print("{k: <{lk}} | The provided value \"{v: <{lv}}\" was not in {i}".format(lk=len(longest_key), lv=len(longest_value), k= key, v= value, i= valid_options))
+                    self.invalidate_enum_options(object_to_update, entry.rna_property) # In case the enum_items depend on something outside of the object, probe them again during the next pass
+
+                self.apply_properties_to_object(top_level_object, failed_properties, only_changed) # call this function recursively to try to reapply the properties that failed to apply in this pass
 
         # When the list of properties that failed to apply stays the same between two iterations, stop the recursion
         self.properties_that_failed_to_apply_previous_pass = {} # Clear the class member list of properties that failed to apply
 
+    def to_dict(self):
+        """Get the assigned values in a form that can be written as JSON, see load_dict().
+        Read-only properties are never applied, and properties that point to data-blocks can't be shared between files, so they're left out.
+        Example: {"type": "CyclesRenderSettings", "properties": {"samples": 16, "use_denoising": false}}
+        """
+        properties = {}
+        for entry, value in self.get_assigned_entries():
+            if entry.is_readonly or entry.property_type == bpy.types.PointerProperty:
+                continue
+            properties[entry.path] = sorted(value) if isinstance(value, set) else value # Tuples are written as lists
+        return {"type": self.top_level_object.bl_rna.identifier, "properties": properties}
+
+    def load_dict(self, data):
+        """Assign the values written by to_dict(), every value is validated against the schema of the cached bl_rna type before any of them are assigned.
+        The properties that aren't in the data keep their current values.
+        Raises ValueError if the data was written for a different type, or if any of its values can't be assigned.
+        """
+        identifier = self.top_level_object.bl_rna.identifier
+        if not isinstance(data, dict) or not isinstance(data.get("properties", {}), dict):
+            raise ValueError("The values for {i} must be an object with a \"properties\" object".format(i = identifier))
+        if data.get("type") != identifier:
+            raise ValueError("The values were saved for {d}, they can't be loaded into {i}".format(d = data.get("type"), i = identifier))
+
+        values = {}
+        errors = []
+        for path, value in data.get("properties", {}).items():
+            entry = self.schema.entries_by_path.get(path)
+            if entry is None:
+                errors.append("{i} has no \"{p}\" property".format(i = identifier, p = path))
+                continue
+            try:
+                values[entry.slot] = entry.validate_value(value)
+            except ValueError as e:
+                errors.append(str(e))
+        if errors:
+            raise ValueError("Invalid {i} values:\n".format(i = identifier) + "\n".join(errors))
+        self.assigned_values.update(values)
+
     def print_cached_properties(self):
-        longest_key = max(self.properties.keys(), key=len)
-        for key, value in self.properties.items():
+        properties = self.properties
+        longest_key = max(properties.keys(), key=len)
+        for key, value in properties.items():
             print("{p: <{l}} | {v}".format(l=len(longest_key), p=key, v=value))
 
+class PropertyOverrides():
+    """Override properties of a bpy_struct for a limited time, then put the original values back.
+    The original value of each property is read the first time the property is overridden, so the cost of capturing and restoring grows with the number of overridden properties instead of with the size of the RNA tree.
+    Use it as a context manager so the original values are restored when the block exits, even if it exits with an exception:
+
+    with PropertyOverrides(scene.cycles) as cycles_overrides:
+        cycles_overrides.override("samples", 16)
+        cycles_overrides.apply(cycles_settings_bake) # Apply every assigned value of a CachedProperties object of the same type
+    """
+    __slots__ = ("top_level_object", "schema", "original_values", "writes_applied", "writes_skipped")
+
+    def __init__(self, top_level_object):
+        self.top_level_object = top_level_object
+        self.schema = PropertySchema.get_schema(top_level_object)
+        self.original_values = {} # The value of each overridden property before it was first overridden: {slot : value}
+        self.writes_applied = 0   # Counts from the last restore()
+        self.writes_skipped = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exception_type, exception, traceback):
+        self.restore()
+        return False # Let the exception continue
+
+    def record_original_value(self, entry):
+        if entry.slot not in self.original_values and not entry.is_readonly:
+            self.original_values[entry.slot] = entry.read_value(self.top_level_object)
+
+    def override(self, property, value):
+        """Set a single property. Example: overrides.override("bake.margin", 0)"""
+        entry = self.schema.entries_by_path.get(property)
+        if entry is None:
+            raise KeyError("{t} has no \"{p}\" property".format(t = self.schema.object_type, p = property))
+        self.record_original_value(entry)
+        setattr(entry.get_owner(self.top_level_object), entry.identifier, value)
+
+    def apply(self, cached_properties):
+        """Apply the assigned values of a CachedProperties object, it must have been created for the same type as the overridden object"""
+        for entry, value in cached_properties.get_assigned_entries():
+            self.record_original_value(entry)
+        cached_properties.apply_properties_to_object(self.top_level_object)
+
+    def restore(self):
+        """Write back the original values of the properties that were overridden, only the properties that still differ from their original values are written"""
+        originals = CachedProperties(object_to_cache = self.top_level_object, dont_assign_values = True)
+        originals.assigned_values.update(self.original_values)
+        self.writes_skipped = originals.restore_changed_properties(self.top_level_object)
+        self.writes_applied = originals.writes_applied
+        self.original_values = {}
+
 #} END CACHED_RNA_REGION
 
 #{ NODE_LINKS_REGION
@@ -325,20 +714,147 @@ class CachedNodeLink():
 
     def apply_link_to_node_tree(self, node_tree):
         # Check for errors in the "from" node
-        if self.from_node_name not in node_tree.nodes.keys():
+        from_node = node_tree.nodes.get(self.from_node_name) # Find the node in the given node tree.
+        if from_node is None:
             raise LinkFailedError(message = "Node link could not be made in {tree} because {node} was not found in the node tree.".format(tree = node_tree, node = self.from_node_name))
-        from_node = node_tree.nodes[self.from_node_name] # Find the node in the given node tree.
         if self.from_socket_name not in from_node.outputs:
             raise LinkFailedError(message = "Node link could not be made in {tree} because {node} does not have the required {socket} output socket.".format(tree = node_tree, node = self.from_node_name, socket = self.from_socket_name))
         from_socket = from_node.outputs[self.from_socket_name] # Find the socket in the given node.
 
         # Check for errors in the "to" node
-        if self.to_node_name not in node_tree.nodes.keys():
+        to_node = node_tree.nodes.get(self.to_node_name) # Find the node in the given node tree.
+        if to_node is None:
             raise LinkFailedError(message = "Node link could not be made in {tree} because {node} was not found in the node tree.".format(tree = node_tree, node = self.to_node_name))
-        to_node = node_tree.nodes[self.to_node_name] # Find the node in the given node tree.
         if self.to_socket_name not in to_node.inputs:
             raise LinkFailedError(message = "Node link could not be made in {tree} because {node} does not have the required {socket} input socket.".format(tree = node_tree, node = self.to_node_name, socket = self.to_socket_name))
         to_socket = to_node.inputs[self.to_socket_name] # Find the socket in the given node.
 
         node_tree.links.new(to_socket, from_socket) # Make the link
-#} END NODE_LINKS_REGION
\ No newline at end of file
+
+class NodeTreeSnapshot():
+    """Caches the links into every input of a node tree's output nodes (Surface, Volume, and Displacement) so they can be restored after the bake has relinked them.
+    The links are kept by name in a single table, and the nodes they connect are indexed by name when the snapshot is taken,
+    so restoring only visits the output sockets no matter how many nodes the material has. Links that are already in place aren't made again.
+    """
+    output_node_types = ('ShaderNodeOutputMaterial',)
+
+    __slots__ = ("node_tree", "nodes_by_name", "links")
+
+    def __init__(self, node_tree, output_nodes = None):
+        """output_nodes are the output nodes to cache the links of, every Material Output node in the node tree is cached if they aren't given"""
+        self.node_tree = node_tree
+        if output_nodes is None:
+            output_nodes = [node for node in node_tree.nodes if node.bl_idname in self.output_node_types]
+        self.nodes_by_name = {} # {node name : node}, only the nodes of the cached links
+        links = [] # [(to node name, to socket index, from node name, from socket name)], the "from" names are None for inputs that weren't linked
+        for node in output_nodes:
+            self.nodes_by_name[node.name] = node
+            for socket_index, socket in enumerate(node.inputs): # Sockets are kept by index, names aren't unique on every node
+                socket_links = socket.links
+                if socket_links:
+                    from_node = socket_links[0].from_node
+                    self.nodes_by_name[from_node.name] = from_node
+                    links.append((node.name, socket_index, from_node.name, socket_links[0].from_socket.name))
+                else:
+                    links.append((node.name, socket_index, None, None))
+        self.links = tuple(links)
+
+    def get_node(self, name):
+        """Find a node by name, or None if it's not in the node tree anymore"""
+        node = self.nodes_by_name.get(name)
+        try:
+            if node is not None and node.name == name:
+                return node
+        except ReferenceError:
+            pass # The node was removed
+        # The node was renamed or removed since the snapshot was taken, look it up in the node tree instead
+        node = self.node_tree.nodes.get(name)
+        if node is not None:
+            self.nodes_by_name[name] = node
+        return node
+
+    def restore(self):
+        """Restore every cached link, and remove links from the output sockets that weren't linked.
+        Raises LinkFailedError once every link that could be restored has been, if any of the nodes or sockets are missing.
+        """
+        errors = []
+        for to_node_name, to_socket_index, from_node_name, from_socket_name in self.links:
+            to_node = self.get_node(to_node_name)
+            if to_node is None:
+                errors.append("{node} was not found in the node tree.".format(node = to_node_name))
+                continue
+            to_socket = to_node.inputs[to_socket_index]
+            socket_links = to_socket.links
+
+            if from_node_name is None:
+                for link in socket_links:
+                    self.node_tree.links.remove(link)
+                continue
+
+            from_node = self.get_node(from_node_name)
+            if from_node is None:
+                errors.append("{node} was not found in the node tree.".format(node = from_node_name))
+                continue
+            if from_socket_name not in from_node.outputs:
+                errors.append("{node} does not have the required {socket} output socket.".format(node = from_node_name, socket = from_socket_name))
+                continue
+            from_socket = from_node.outputs[from_socket_name]
+            if socket_links and socket_links[0].from_socket == from_socket:
+                continue # The link is already in place, relinking it would make Blender recompile the material's shaders
+            self.node_tree.links.new(to_socket, from_socket)
+
+        if errors:
+            raise LinkFailedError(message = "Node links could not be restored in {tree}: {errors}".format(tree = self.node_tree, errors = " ".join(errors)))
+#} END NODE_LINKS_REGION
+
+#{ SELECTION_REGION
+class SelectionState():
+    """Records the selected objects and the active object of a view layer, so the selection can be changed for a bake and put back afterwards.
+    Only the objects that are selected or deselected through this class are tracked, so changing and restoring the selection never walks every object in the file.
+    Example: a file with 100,000 objects, 3 of them selected, only needs 3 writes to clear the selection and 3 writes to restore it.
+    """
+    __slots__ = ("view_layer", "original_selection", "original_active", "selected_objects", "changed_objects")
+
+    def __init__(self, view_layer):
+        self.view_layer = view_layer
+        self.original_selection = set(view_layer.objects.selected) # Blender collects the selected objects of the view layer in C, this doesn't go through Python for every object
+        self.original_active = view_layer.objects.active
+        self.selected_objects = set(self.original_selection) # The objects that are selected now
+        self.changed_objects = set() # The objects whose selection has been changed, they're the only ones that may need to be restored
+
+    def select(self, object, state = True):
+        if (object in self.selected_objects) == state:
+            return
+        object.select_set(state, view_layer = self.view_layer)
+        self.changed_objects.add(object)
+        if state:
+            self.selected_objects.add(object)
+        else:
+            self.selected_objects.discard(object)
+
+    def deselect_all(self):
+        """Deselect the objects that are selected now, and clear the active object"""
+        for object in list(self.selected_objects):
+            self.select(object, False)
+        self.set_active(None)
+
+    def set_active(self, object):
+        if self.view_layer.objects.active != object:
+            self.view_layer.objects.active = object
+
+    def restore(self):
+        """Put back the original selection and active object, only the objects whose selection was changed are written"""
+        for object in self.changed_objects:
+            try:
+                was_selected = object in self.original_selection
+                if object.select_get(view_layer = self.view_layer) != was_selected:
+                    object.select_set(was_selected, view_layer = self.view_layer)
+            except (ReferenceError, RuntimeError):
+                continue # The object was removed, or it isn't in the view layer anymore
+        self.changed_objects = set()
+        self.selected_objects = set(self.original_selection)
+        try:
+            self.set_active(self.original_active)
+        except (ReferenceError, RuntimeError):
+            self.set_active(None)
+#} END SELECTION_REGION
@@ -0,0 +1,268 @@
+"""Split a bake job into independent work units and dispatch them to a pool of background Blender processes.
+
+This module only uses the Python standard library so that it can run outside of Blender, on the machine that drives the farm.
+Each worker is a separate process, by default "blender --background" running farm_worker.py, which performs the bake through headless.py without enabling the add-on.
+The worker command is a template, so any stand-in script that reads a work unit and writes a result can be used in place of Blender.
+
+Example job file:
+{
+    "blend_file":       "/assets/crate.blend",
+    "bake_source":      "SELF",
+    "objects":          ["Crate", "Barrel"],
+    "active_object":    null,
+    "passes":           ["Base Color", "Roughness", "Normal"],
+    "texture_set_name": "Props",
+    "export_path":      "/textures/props/"
+}
+
+The job is checked the same way headless.py checks its specs, "bake_source" defaults to "SELF", and a Selected to Active job without an "active_object" bakes to the last object.
+
+Exit codes:
+0 Every work unit finished
+1 A work unit failed
+2 The job could not be read or is not valid
+
+Usage:
+python farm.py job.json --workers 8 --report report.json
+python farm.py job.json --worker-command "python ../tools/stand_in_worker.py {work_unit} {result} --fail Barrel"
+
+tools/stand_in_worker.py pretends to bake a work unit on plain CPython, and tools/check_farm.py runs the dispatcher through it.
+"""
+import argparse
+import concurrent.futures
+import json
+import os
+import shlex
+import subprocess
+import sys
+import tempfile
+import time
+
+EXIT_INVALID_JOB = 2
+
+WORKER_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "farm_worker.py")
+DEFAULT_WORKER_COMMAND = ["blender", "--background", "{blend_file}", "--python", "{worker_script}", "--", "{work_unit}", "{result}"]
+
+def clean_name(name, replace = "_"):
+    """Match bpy.path.clean_name() so texture set names are the same as the ones the operator would generate"""
+    return "".join(character if character.isascii() and character.isalnum() else replace for character in name)
+
+class WorkUnit():
+    """A part of a bake job that can be baked on its own, in a separate Blender process"""
+    def __init__(self, unit_id, blend_file, bake_source, objects, active_object, passes, settings):
+        self.unit_id       = unit_id       # Unique name for this work unit, used to name its files. Example: "0003"
+        self.blend_file    = blend_file    # The .blend file that the worker will open
+        self.bake_source   = bake_source   # 'SELF' or 'SELECTED_TO_ACTIVE'
+        self.objects       = objects       # Names of the objects that will be selected
+        self.active_object = active_object # Name of the object that will be active, None lets the worker pick the last selected object
+        self.passes        = passes        # Names of the baking passes that will be enabled
+        self.settings      = settings      # Values for the scene's baking_tools_settings. Example: {"texture_set_name": "Props_Crate", "export_path": "/textures/"}
+
+    def to_dict(self):
+        return {"unit_id":       self.unit_id,
+                "blend_file":    self.blend_file,
+                "bake_source":   self.bake_source,
+                "objects":       self.objects,
+                "active_object": self.active_object,
+                "passes":        self.passes,
+                "settings":      self.settings}
+
+def validate_job(job):
+    """Raise ValueError if the job can't be split into work units, matching headless.validate_spec() so a job that's split is one the workers accept"""
+    if not isinstance(job, dict):
+        raise ValueError("The job must be a JSON object")
+    if not job.get("blend_file") or not isinstance(job["blend_file"], str):
+        raise ValueError("The job must give the path of the .blend file to bake")
+    if job.get("bake_source", "SELF") not in ("SELF", "SELECTED_TO_ACTIVE"):
+        raise ValueError("Unknown bake source \"{s}\"".format(s = job["bake_source"]))
+    objects = job.get("objects")
+    if not objects or not isinstance(objects, list) or not all(isinstance(object_name, str) for object_name in objects):
+        raise ValueError("The job must list the names of the objects to bake")
+    if job.get("active_object") is not None and not isinstance(job["active_object"], str):
+        raise ValueError("The active object must be the name of an object")
+    passes = job.get("passes")
+    if not passes or not isinstance(passes, list):
+        raise ValueError("The job must list the baking passes, they're split between the work units")
+    for job_pass in passes:
+        if isinstance(job_pass, dict):
+            if "name" not in job_pass:
+                raise ValueError("Baking pass {p} has no name".format(p = job_pass))
+        elif not isinstance(job_pass, str):
+            raise ValueError("Baking passes must be names or objects, got {p}".format(p = job_pass))
+
+def split_job(job, passes_per_unit = 1):
+    """Partition a bake job into independent work units.
+    'SELF' jobs are split by object and by pass, since every object is baked into its own texture set.
+    'SELECTED_TO_ACTIVE' jobs bake all of the selected objects into one texture set, so they can only be split by pass.
+    Raises ValueError if the job isn't valid.
+    """
+    validate_job(job)
+    if passes_per_unit < 1:
+        raise ValueError("Every work unit needs at least one pass")
+    passes = job["passes"]
+    pass_groups = [passes[index:index + passes_per_unit] for index in range(0, len(passes), passes_per_unit)] # Example: 5 passes, 2 per unit -> [[1, 2], [3, 4], [5]]
+
+    # Any of the scene's baking_tools_settings can be overridden by the job
+    setting_keys = ("texture_set_name", "texture_name_delimiter", "texture_size", "export_path", "skip_constant_passes", "constant_texture_size", "use_async_writeback", "use_incremental_bake", "use_tiled_bake", "tile_size", "memory_budget_mb", "bake_preset_path", "use_profiling", "use_memory_profiling")
+    settings = {key : job[key] for key in setting_keys if key in job}
+    texture_set_name = job.get("texture_set_name", "BakedTexture")
+    delimiter = job.get("texture_name_delimiter", "_")
+
+    work_units = []
+    bake_source = job.get("bake_source", "SELF")
+    if bake_source == "SELF":
+        for object_name in job["objects"]:
+            object_settings = dict(settings)
+            if len(job["objects"]) > 1:
+                # Each worker only sees a single object, so add the object's name to the texture set name the same way the operator would for a multi-object bake
+                object_settings["texture_set_name"] = delimiter.join([texture_set_name, clean_name(object_name)])
+            for pass_group in pass_groups:
+                work_units.append(WorkUnit(unit_id = "{i:04d}".format(i = len(work_units)), blend_file = job["blend_file"], bake_source = "SELF",
+                                           objects = [object_name], active_object = object_name, passes = pass_group, settings = object_settings))
+
+    else:
+        for pass_group in pass_groups:
+            work_units.append(WorkUnit(unit_id = "{i:04d}".format(i = len(work_units)), blend_file = job["blend_file"], bake_source = "SELECTED_TO_ACTIVE",
+                                       objects = job["objects"], active_object = job.get("active_object"), passes = pass_group, settings = settings))
+
+    return work_units
+
+class WorkUnitResult():
+    """The outcome of a single work unit"""
+    def __init__(self, work_unit, succeeded, return_code, duration, messages, output):
+        self.work_unit   = work_unit
+        self.succeeded   = succeeded
+        self.return_code = return_code
+        self.duration    = duration    # Wall time in seconds, including the startup of the worker process
+        self.messages    = messages    # Messages reported by the worker, or the reason it failed
+        self.output      = output      # The tail of the worker's console output, kept for failures so they can be diagnosed
+
+    def to_dict(self):
+        return {"unit_id":     self.work_unit.unit_id,
+                "objects":     self.work_unit.objects,
+                "passes":      self.work_unit.passes,
+                "succeeded":   self.succeeded,
+                "return_code": self.return_code,
+                "duration":    self.duration,
+                "messages":    self.messages,
+                "output":      self.output}
+
+class FarmReport():
+    """Collects the results of every work unit into a single report"""
+    def __init__(self, results, duration):
+        self.results  = sorted(results, key = lambda result: result.work_unit.unit_id)
+        self.duration = duration
+
+    @property
+    def failed(self):
+        return [result for result in self.results if not result.succeeded]
+
+    @property
+    def succeeded(self):
+        return not self.failed
+
+    def summary(self):
+        return "{s} of {t} work units succeeded in {d:.1f}s".format(s = len(self.results) - len(self.failed), t = len(self.results), d = self.duration)
+
+    def to_dict(self):
+        return {"succeeded": self.succeeded,
+                "duration":  self.duration,
+                "summary":   self.summary(),
+                "results":   [result.to_dict() for result in self.results]}
+
+    def save(self, path):
+        with open(path, "w") as report_file:
+            json.dump(self.to_dict(), report_file, indent = 4)
+
+class FarmDispatcher():
+    """Run work units in parallel, each one in its own worker process.
+    The worker command is a list of arguments, "{work_unit}", "{result}", "{blend_file}", and "{worker_script}" will be replaced for each work unit.
+    The worker reads the work unit from the {work_unit} JSON file, and writes {"status": "FINISHED", "messages": [...]} to the {result} JSON file.
+    """
+    OUTPUT_TAIL_LENGTH = 4000 # Number of characters of console output to keep for failed work units
+
+    def __init__(self, worker_command = None, max_workers = None, timeout = None, work_directory = None):
+        self.worker_command = worker_command or DEFAULT_WORKER_COMMAND
+        self.max_workers    = max_workers or os.cpu_count() or 1
+        self.timeout        = timeout        # Seconds before a worker is killed, None waits forever
+        self.work_directory = work_directory # Where the work unit and result files are written, a temporary directory is used if this is None
+
+    def run(self, work_units):
+        """Dispatch all of the work units and wait for them to finish"""
+        start_time = time.perf_counter()
+        with tempfile.TemporaryDirectory(prefix = "bakery_farm_") as temporary_directory:
+            work_directory = self.work_directory or temporary_directory
+            os.makedirs(work_directory, exist_ok = True)
+
+            # Threads are enough to drive the pool, each one just waits for its worker process to exit
+            with concurrent.futures.ThreadPoolExecutor(max_workers = self.max_workers) as executor:
+                futures = [executor.submit(self.run_work_unit, work_unit, work_directory) for work_unit in work_units]
+                results = [future.result() for future in concurrent.futures.as_completed(futures)]
+
+        return FarmReport(results, time.perf_counter() - start_time)
+
+    def run_work_unit(self, work_unit, work_directory):
+        """Run a single work unit in a worker process, failures are recorded in the result instead of being raised"""
+        work_unit_path = os.path.join(work_directory, "work_unit_{i}.json".format(i = work_unit.unit_id))
+        result_path    = os.path.join(work_directory, "result_{i}.json".format(i = work_unit.unit_id))
+        with open(work_unit_path, "w") as work_unit_file:
+            json.dump(work_unit.to_dict(), work_unit_file, indent = 4)
+        if os.path.exists(result_path):
+            os.remove(result_path) # Don't pick up a result from a previous run
+
+        replacements = {"work_unit": work_unit_path, "result": result_path, "blend_file": work_unit.blend_file, "worker_script": WORKER_SCRIPT}
+        command = [argument.format(**replacements) for argument in self.worker_command]
+
+        start_time = time.perf_counter()
+        try:
+            process = subprocess.run(command, stdout = subprocess.PIPE, stderr = subprocess.STDOUT, text = True, timeout = self.timeout)
+        except subprocess.TimeoutExpired as e:
+            output = e.stdout.decode(errors = "replace") if isinstance(e.stdout, bytes) else (e.stdout or "")
+            return WorkUnitResult(work_unit, False, None, time.perf_counter() - start_time, ["Timed out after {t}s".format(t = self.timeout)], output[-self.OUTPUT_TAIL_LENGTH:])
+        except OSError as e:
+            return WorkUnitResult(work_unit, False, None, time.perf_counter() - start_time, ["Worker could not be started: {e}".format(e = e)], "")
+        duration = time.perf_counter() - start_time
+
+        try:
+            with open(result_path) as result_file:
+                result = json.load(result_file)
+        except (OSError, ValueError) as e:
+            result = {"status": None, "messages": ["Worker did not write a valid result: {e}".format(e = e)]}
+
+        succeeded = process.returncode == 0 and result.get("status") == "FINISHED"
+        output = "" if succeeded else process.stdout[-self.OUTPUT_TAIL_LENGTH:]
+        return WorkUnitResult(work_unit, succeeded, process.returncode, duration, result.get("messages", []), output)
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(description = "Split a bake job into work units and bake them in parallel background Blender processes.")
+    parser.add_argument("job", help = "Path to the JSON job file")
+    parser.add_argument("--workers", type = int, default = None, help = "Number of worker processes, defaults to the number of CPUs")
+    parser.add_argument("--passes-per-unit", type = int, default = 1, help = "Number of baking passes in each work unit")
+    parser.add_argument("--timeout", type = float, default = None, help = "Seconds before a worker is killed")
+    parser.add_argument("--worker-command", default = None, help = "Command used to start a worker, defaults to: " + " ".join(DEFAULT_WORKER_COMMAND))
+    parser.add_argument("--work-directory", default = None, help = "Keep the work unit and result files in this directory")
+    parser.add_argument("--report", default = None, help = "Path to write the JSON report to")
+    args = parser.parse_args(argv)
+
+    try:
+        with open(args.job) as job_file:
+            job = json.load(job_file)
+        work_units = split_job(job, passes_per_unit = args.passes_per_unit)
+    except (OSError, ValueError) as e: # json.JSONDecodeError is a ValueError
+        print("Could not split the job {p}: {e}".format(p = args.job, e = e))
+        return EXIT_INVALID_JOB
+
+    worker_command = shlex.split(args.worker_command) if args.worker_command else None
+    dispatcher = FarmDispatcher(worker_command = worker_command, max_workers = args.workers, timeout = args.timeout, work_directory = args.work_directory)
+    report = dispatcher.run(work_units)
+
+    print(report.summary())
+    for result in report.failed:
+        print("Work unit {i} failed: objects {o}, passes {p}: {m}".format(i = result.work_unit.unit_id, o = result.work_unit.objects, p = result.work_unit.passes, m = "; ".join(result.messages)))
+    if args.report:
+        report.save(args.report)
+
+    return 0 if report.succeeded else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,40 @@
+"""Bake a single work unit from farm.py inside a background Blender process.
+
+The work unit is baked through headless.py, so the add-on doesn't need to be enabled on the farm machine and its UI is never registered.
+
+Usage:
+blender --background file.blend --python farm_worker.py -- work_unit.json result.json
+"""
+import importlib
+import json
+import os
+import sys
+
+# Import the add-on as a package from the directory this file is in
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+headless = importlib.import_module(os.path.basename(os.path.dirname(os.path.abspath(__file__))) + ".headless")
+
+def get_spec(work_unit):
+    """Convert a work unit into a job spec for headless.py"""
+    return {"bake_source":   work_unit["bake_source"],
+            "objects":       work_unit["objects"],
+            "active_object": work_unit["active_object"],
+            "passes":        work_unit["passes"],
+            "settings":      work_unit["settings"],
+            "profile_name":  "{t}_{u}".format(t = work_unit["settings"].get("texture_set_name", "BakedTexture"), u = work_unit["unit_id"])} # Every work unit keeps its own profile
+
+def main(argv):
+    work_unit_path, result_path = argv[argv.index("--") + 1:][:2] # Blender ignores the arguments after "--"
+    with open(work_unit_path) as work_unit_file:
+        work_unit = json.load(work_unit_file)
+
+    exit_code, messages = headless.bake_spec(get_spec(work_unit))
+    result = {"unit_id": work_unit["unit_id"], "status": "FINISHED" if exit_code == headless.EXIT_FINISHED else "CANCELLED", "exit_code": exit_code, "messages": messages}
+
+    with open(result_path, "w") as result_file:
+        json.dump(result, result_file, indent = 4)
+
+    return exit_code
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
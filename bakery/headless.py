@@ -0,0 +1,181 @@
+"""Bake from the command line, driven by a JSON or TOML job spec, without enabling the add-on.
+
+Only the scene's baking settings and baking passes are registered, the panel and the operators are skipped, and the render settings and selection aren't restored after the bake since Blender exits right after it.
+The spec lists the objects to bake and any of the scene's baking_tools_settings, passes can be given by name or with the settings to override for them.
+TOML specs need Python 3.11 or newer, for tomllib.
+
+Example spec:
+{
+    "bake_source":   "SELECTED_TO_ACTIVE",
+    "objects":       ["Crate_High", "Crate_Low"],
+    "active_object": "Crate_Low",
+    "passes":        ["Base Color", "Roughness", {"name": "Normal", "file_format": "OPEN_EXR", "color_depth": "16"}],
+    "texture_size":  2048,
+    "export_path":   "/textures/crate/"
+}
+The settings can also be grouped under a "settings" key, the same way farm.py writes its work units.
+"profile_name" is added to the file names of the bake profile when profiling is enabled, farm workers set it to the work unit's id.
+
+Exit codes:
+0 The bake finished
+1 The bake was cancelled or failed
+2 The spec could not be read or is not valid
+3 An object or baking pass in the spec is not in the .blend file
+
+Usage:
+blender --background file.blend --python headless.py -- spec.json [result.json]
+blender --background file.blend --python-expr "import sys, bakery.headless; sys.exit(bakery.headless.main(sys.argv))" -- spec.toml
+"""
+import importlib
+import json
+import os
+import sys
+
+import bpy
+
+if __package__:
+    from . import baking_tools
+else:
+    # Run as a script, import the add-on as a package from the directory this file is in
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    baking_tools = importlib.import_module(os.path.basename(os.path.dirname(os.path.abspath(__file__))) + ".baking_tools")
+
+EXIT_FINISHED = 0
+EXIT_CANCELLED = 1
+EXIT_INVALID_SPEC = 2
+EXIT_MISSING_DATA = 3
+
+SPEC_KEYS = ("bake_source", "objects", "active_object", "passes", "settings", "profile_name")
+PASS_KEYS = ("name", "enabled", "suffix", "file_format", "color_depth", "use_channel_packing", "channel_red", "channel_green", "channel_blue", "texture_node_color_space")
+
+class SpecError(Exception):
+    """The job spec can't be baked, the exit code tells the caller why"""
+    def __init__(self, message, exit_code = EXIT_INVALID_SPEC):
+        super().__init__(message)
+        self.exit_code = exit_code
+
+def load_spec(path):
+    """Read a job spec from a .json or .toml file"""
+    try:
+        if os.path.splitext(path)[1].lower() == ".toml":
+            try:
+                import tomllib
+            except ImportError:
+                raise SpecError("TOML specs need Python 3.11 or newer, use a JSON spec instead")
+            with open(path, "rb") as spec_file:
+                return tomllib.load(spec_file)
+        with open(path) as spec_file:
+            return json.load(spec_file)
+    except SpecError:
+        raise
+    except (OSError, ValueError) as e: # tomllib.TOMLDecodeError and json.JSONDecodeError are both ValueErrors
+        raise SpecError("Could not read the spec {p}: {e}".format(p = path, e = e))
+
+def get_spec_settings(spec):
+    """Get the values for the scene's baking_tools_settings, from the top level of the spec and from its "settings" table"""
+    settings = {key : value for key, value in spec.items() if key not in SPEC_KEYS}
+    settings.update(spec.get("settings", {}))
+    return settings
+
+def validate_spec(spec):
+    if not isinstance(spec, dict):
+        raise SpecError("The spec must be a JSON object or a TOML table")
+    if spec.get("bake_source", "SELF") not in ("SELF", "SELECTED_TO_ACTIVE"):
+        raise SpecError("Unknown bake source \"{s}\"".format(s = spec["bake_source"]))
+    objects = spec.get("objects")
+    if not objects or not isinstance(objects, list) or not all(isinstance(object_name, str) for object_name in objects):
+        raise SpecError("The spec must list the names of the objects to bake")
+    if not isinstance(spec.get("profile_name", ""), str):
+        raise SpecError("The profile name must be a string")
+    for spec_pass in spec.get("passes", []):
+        if isinstance(spec_pass, dict):
+            if "name" not in spec_pass:
+                raise SpecError("Baking pass {p} has no name".format(p = spec_pass))
+            unknown_keys = set(spec_pass) - set(PASS_KEYS)
+            if unknown_keys:
+                raise SpecError("Unknown settings {k} for baking pass \"{p}\"".format(k = sorted(unknown_keys), p = spec_pass["name"]))
+        elif not isinstance(spec_pass, str):
+            raise SpecError("Baking passes must be names or tables, got {p}".format(p = spec_pass))
+
+def setup_scene(context, spec):
+    """Set up the scene's baking settings and baking passes from the spec. Returns the objects to bake and the active object."""
+    scene = context.scene
+    settings = scene.baking_tools_settings
+    settings.bake_source = spec.get("bake_source", "SELF")
+    for key, value in get_spec_settings(spec).items():
+        if key not in settings.bl_rna.properties or key in ("rna_type", "bake_source"):
+            raise SpecError("Unknown setting \"{k}\"".format(k = key))
+        try:
+            setattr(settings, key, value)
+        except (TypeError, ValueError) as e:
+            raise SpecError("Invalid value for setting \"{k}\": {e}".format(k = key, e = e))
+
+    if not len(scene.baking_passes):
+        baking_tools.setup_baking_passes(context) # Use the default list of baking passes
+
+    # Only enable the passes that are in the spec, all of the scene's enabled passes are baked if the spec doesn't list any
+    if "passes" in spec:
+        spec_passes = {spec_pass["name"] if isinstance(spec_pass, dict) else spec_pass : spec_pass for spec_pass in spec["passes"]}
+        missing_passes = set(spec_passes) - set(baking_pass.name for baking_pass in scene.baking_passes)
+        if missing_passes:
+            raise SpecError("Baking passes {p} were not found".format(p = sorted(missing_passes)), EXIT_MISSING_DATA)
+        for baking_pass in scene.baking_passes:
+            spec_pass = spec_passes.get(baking_pass.name)
+            baking_pass.enabled = spec_pass is not None
+            if isinstance(spec_pass, dict):
+                # The valid color depths depend on the file format, so the file format is set first
+                for key in sorted(spec_pass, key = lambda key: key != "file_format"):
+                    if key == "name":
+                        continue
+                    try:
+                        setattr(baking_pass, key, spec_pass[key])
+                    except (TypeError, ValueError) as e:
+                        raise SpecError("Invalid value for \"{k}\" of baking pass \"{p}\": {e}".format(k = key, p = baking_pass.name, e = e))
+
+    missing_objects = [object_name for object_name in spec["objects"] + [spec.get("active_object") or spec["objects"][-1]] if object_name not in bpy.data.objects]
+    if missing_objects:
+        raise SpecError("Objects {o} were not found".format(o = sorted(set(missing_objects))), EXIT_MISSING_DATA)
+    objects = [bpy.data.objects[object_name] for object_name in spec["objects"]]
+    active_object = bpy.data.objects[spec.get("active_object") or spec["objects"][-1]]
+    return objects, active_object
+
+def bake_spec(spec, context = None):
+    """Bake a job spec in the current .blend file. Returns the exit code and the messages that were reported."""
+    context = context or bpy.context
+    try:
+        validate_spec(spec)
+        if not hasattr(bpy.types.Scene, "baking_tools_settings"):
+            baking_tools.register_properties()
+        objects, active_object = setup_scene(context, spec)
+    except SpecError as e:
+        return e.exit_code, [str(e)]
+
+    batch_bake = baking_tools.BatchBake(restore_state = False, profile_name = spec.get("profile_name"))
+    try:
+        status = batch_bake.execute(context, objects, active_object)
+    except Exception as e:
+        return EXIT_CANCELLED, [message for level, message in batch_bake.messages] + [repr(e)]
+    return EXIT_FINISHED if 'FINISHED' in status else EXIT_CANCELLED, [message for level, message in batch_bake.messages]
+
+def main(argv):
+    arguments = argv[argv.index("--") + 1:] if "--" in argv else [] # Blender ignores the arguments after "--"
+    if not arguments:
+        print(__doc__)
+        return EXIT_INVALID_SPEC
+
+    try:
+        spec = load_spec(arguments[0])
+    except SpecError as e:
+        exit_code, messages = e.exit_code, [str(e)]
+    else:
+        exit_code, messages = bake_spec(spec)
+
+    for message in messages:
+        print(message)
+    if len(arguments) > 1:
+        with open(arguments[1], "w") as result_file:
+            json.dump({"status": "FINISHED" if exit_code == EXIT_FINISHED else "CANCELLED", "exit_code": exit_code, "messages": messages}, result_file, indent = 4)
+    return exit_code
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
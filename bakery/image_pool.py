@@ -0,0 +1,56 @@
+import bpy
+import numpy
+
+class ImagePool():
+    """Lease bake images from a pool instead of removing and recreating an image for every pass.
+    Images are pooled by (width, height, float_buffer), so a full resolution buffer is only allocated once per key for the whole bake.
+    Leased images are cleared in a single bulk write, and every pooled image is removed from bpy.data when the pool is freed.
+    """
+    NAME_PREFIX = "BakingTexture" # Example: "BakingTexture_1024x1024_float_0"
+
+    def __init__(self):
+        self.free_images = {}   # Images that are ready to be leased: {(width, height, float_buffer) : [Image]}
+        self.leased_images = {} # Images that are in use: {image name : (width, height, float_buffer)}
+        self.image_count = 0    # Used to give each pooled image a unique name
+
+    def lease(self, width, height, float_buffer, clear = True):
+        """Get an image with the given size and buffer type.
+        The previous contents of a reused image are cleared, unless clear is False because the caller is about to overwrite every pixel anyway.
+        """
+        key = (width, height, float_buffer)
+        free_images = self.free_images.get(key, [])
+        if free_images:
+            image = free_images.pop()
+            if clear:
+                # The bake only writes the pixels that are covered by UVs, clear what the previous pass left behind
+                # numpy.zeros() maps zeroed pages lazily, so the buffer that's written doesn't need to be filled first
+                image.pixels.foreach_set(numpy.zeros(width * height * 4, dtype = numpy.float32))
+        else:
+            name = "{p}_{w}x{h}_{t}_{i}".format(p = self.NAME_PREFIX, w = width, h = height, t = "float" if float_buffer else "byte", i = self.image_count)
+            image = bpy.data.images.new(name = name, width = width, height = height, float_buffer = float_buffer)
+            self.image_count += 1
+
+        self.leased_images[image.name] = key
+        return image
+
+    def release(self, image):
+        """Return an image to the pool so it can be leased again. The image's pixels must have been read or saved before it's released."""
+        key = self.leased_images.pop(image.name)
+        self.free_images.setdefault(key, []).append(image)
+
+    def release_all(self):
+        """Return every leased image to the pool, when the pass that leased it stopped before the image was saved"""
+        for name in list(self.leased_images):
+            if name in bpy.data.images:
+                self.release(bpy.data.images[name])
+            else:
+                del self.leased_images[name] # The image was removed by someone else, there's nothing to reuse
+
+    def free(self):
+        """Remove every pooled image from bpy.data"""
+        images = [image for images in self.free_images.values() for image in images]
+        images += [bpy.data.images[name] for name in self.leased_images if name in bpy.data.images]
+        for image in images:
+            bpy.data.images.remove(image, do_unlink = True)
+        self.free_images = {}
+        self.leased_images = {}
@@ -0,0 +1,177 @@
+import bpy
+
+from .texture_writeback import TextureWriteback
+
+# The estimates are approximations of the largest allocations made while baking, they're meant for packing jobs onto machines, not for exact accounting
+MB = 1024 * 1024
+BYTES_PER_PIXEL = {True: 16, False: 4} # Float buffers are RGBA float32, byte buffers are RGBA uint8
+BAKE_BYTES_PER_PIXEL = 52              # Cycles keeps a BakePixel (36 bytes) and an RGBA float result (16 bytes) for every pixel of the bake
+BYTES_PER_VERTEX = 48                  # Cycles geometry: position, normal, and attributes
+BYTES_PER_TRIANGLE = 96                # Cycles geometry and BVH
+WRITEBACK_PENDING = 2                  # Matches the default max_pending of TextureWriteback, the number of full float copies that can wait to be written
+BAKEABLE_TYPES = ('MESH', 'CURVE', 'SURFACE', 'META', 'FONT', 'CURVES', 'POINTCLOUD', 'VOLUME') # Matches BatchBake.bakeable_types
+MAX_TILE_COUNT = 32                    # Tiles along each side of a texture, every tile is a separate bake
+
+def get_tile_count(settings, baking_pass, texture_size, object_to_bake_to = None):
+    """Get the number of tiles along each side of the texture for a tiled bake, 1 means the texture is baked in one piece.
+    Tiles are only used when the texture is bigger than the tile size, and it can be streamed into a file format that the texture writers support.
+    """
+    if not settings.use_tiled_bake or texture_size <= settings.tile_size:
+        return 1
+    if not TextureWriteback.can_write(baking_pass.file_format, baking_pass.color_depth):
+        return 1 # Blender can only save a whole image at once, fall back to a regular bake
+    if object_to_bake_to and (object_to_bake_to.type != 'MESH' or not object_to_bake_to.data.uv_layers.active):
+        return 1 # Tiles are baked by offsetting the UVs of a mesh
+
+    # Every tile has to be the same size, and the tiles have to cover the whole texture exactly
+    # Tiles down to half of the tile size are accepted, if none of those fit the texture exactly it's baked in one piece instead of in thousands of tiny tiles
+    minimum_tile_count = -(-texture_size // settings.tile_size)
+    for tile_count in range(minimum_tile_count, min(2 * minimum_tile_count, MAX_TILE_COUNT) + 1):
+        if texture_size % tile_count == 0:
+            return tile_count
+    return 1
+
+def estimate_mesh_bytes(object, depsgraph = None):
+    """Estimate the memory Cycles needs for an object's geometry. The modifiers are included if a depsgraph is given, other object types are counted as 0."""
+    if object.type != 'MESH':
+        return 0
+    if depsgraph is None:
+        mesh = object.data
+        return len(mesh.vertices) * BYTES_PER_VERTEX + (len(mesh.loops) - 2 * len(mesh.polygons)) * BYTES_PER_TRIANGLE
+
+    object_evaluated = object.evaluated_get(depsgraph)
+    mesh = object_evaluated.to_mesh()
+    try:
+        return len(mesh.vertices) * BYTES_PER_VERTEX + (len(mesh.loops) - 2 * len(mesh.polygons)) * BYTES_PER_TRIANGLE # A polygon with n loops has n - 2 triangles
+    finally:
+        object_evaluated.to_mesh_clear()
+
+class PassEstimate():
+    """The memory used while baking a single pass"""
+    def __init__(self, pass_name, image_key, image_bytes, transient_bytes):
+        self.pass_name       = pass_name
+        self.image_key       = image_key       # The key the baking texture is pooled under: (width, height, float_buffer)
+        self.image_bytes     = image_bytes     # The baking texture, it stays in the image pool until the pool is freed
+        self.transient_bytes = transient_bytes # Cycles' bake buffers and the copies made to write the texture, they're only held during the pass
+
+def estimate_pass(settings, baking_pass, object_to_bake_to = None, texture_size = None):
+    texture_size = texture_size or settings.texture_size
+    tile_count = get_tile_count(settings, baking_pass, texture_size, object_to_bake_to)
+    tile_size = texture_size // tile_count
+    use_float = baking_pass.color_depth != '8'
+    image_bytes = tile_size * tile_size * BYTES_PER_PIXEL[use_float]
+
+    transient_bytes = tile_size * tile_size * BAKE_BYTES_PER_PIXEL
+    if tile_count > 1:
+        transient_bytes += tile_size * tile_size * 16 + texture_size * tile_size * 3 * (2 if use_float else 1) # The tile's pixels, and one band of quantized rows
+    elif settings.use_async_writeback and TextureWriteback.can_write(baking_pass.file_format, baking_pass.color_depth):
+        transient_bytes += WRITEBACK_PENDING * texture_size * texture_size * 16 # Float copies of the textures that are waiting to be written
+    else:
+        transient_bytes += image_bytes # Blender copies the image buffer while saving it
+
+    return PassEstimate(baking_pass.name, (tile_size, tile_size, use_float), image_bytes, transient_bytes)
+
+class JobEstimate():
+    """The memory used by each pass of a bake job, and by the geometry of its objects"""
+    def __init__(self, texture_set_name, mesh_bytes, passes):
+        self.texture_set_name = texture_set_name
+        self.mesh_bytes       = mesh_bytes
+        self.passes           = passes
+
+def estimate_job(settings, texture_set_name, object_to_bake_to, objects, depsgraph = None, texture_size = None):
+    baking_passes = [baking_pass for baking_pass in bpy.context.scene.baking_passes if baking_pass.enabled]
+    mesh_bytes = sum(estimate_mesh_bytes(object, depsgraph) for object in set(objects) | {object_to_bake_to})
+    return JobEstimate(texture_set_name, mesh_bytes, [estimate_pass(settings, baking_pass, object_to_bake_to, texture_size) for baking_pass in baking_passes])
+
+class MemoryPlan():
+    """Splits the passes of every bake job into batches that stay under a memory budget.
+    Baking textures are pooled for the whole bake, so the pool grows by one image for every new (size, buffer type) that a pass uses.
+    A new batch starts when the pool would push a pass over the budget, the pool is freed and the pending texture writes are flushed before it.
+    Passes that use the same pooled image are ordered next to each other, so each job needs as few batches as possible.
+    """
+    def __init__(self, job_estimates, budget_bytes = 0):
+        self.job_estimates = job_estimates
+        self.budget_bytes  = budget_bytes # 0 means there is no budget, everything is baked in a single batch
+        self.batch_starts  = set()        # The passes that start a new batch: {(texture set name, pass name)}
+        self.batch_count   = 1
+        self.peak_bytes    = 0
+        self.over_budget   = []           # Passes that don't fit in the budget, even on their own: [(texture set name, pass name, bytes)]
+        self.pass_order    = {}           # Position of each pass in the baking order: {pass name : index}
+
+        if job_estimates:
+            first_passes = job_estimates[0].passes # Every job bakes the same passes
+            image_keys = []
+            for pass_estimate in first_passes:
+                if pass_estimate.image_key not in image_keys:
+                    image_keys.append(pass_estimate.image_key)
+            ordered_passes = sorted(first_passes, key = lambda pass_estimate: image_keys.index(pass_estimate.image_key)) if budget_bytes else first_passes
+            self.pass_order = {pass_estimate.pass_name : index for index, pass_estimate in enumerate(ordered_passes)}
+
+        pooled_images = {} # {image key : bytes}
+        for job_estimate in job_estimates:
+            for pass_estimate in sorted(job_estimate.passes, key = lambda pass_estimate: self.pass_order[pass_estimate.pass_name]):
+                pooled_bytes = sum(image_bytes for key, image_bytes in pooled_images.items() if key != pass_estimate.image_key) + pass_estimate.image_bytes
+                pass_bytes = pooled_bytes + pass_estimate.transient_bytes + job_estimate.mesh_bytes
+                if budget_bytes and pass_bytes > budget_bytes and set(pooled_images) - {pass_estimate.image_key}:
+                    # Free the images the earlier passes left in the pool
+                    self.batch_starts.add((job_estimate.texture_set_name, pass_estimate.pass_name))
+                    self.batch_count += 1
+                    pooled_images = {}
+                    pass_bytes = pass_estimate.image_bytes + pass_estimate.transient_bytes + job_estimate.mesh_bytes
+                if budget_bytes and pass_bytes > budget_bytes:
+                    self.over_budget.append((job_estimate.texture_set_name, pass_estimate.pass_name, pass_bytes))
+
+                pooled_images[pass_estimate.image_key] = pass_estimate.image_bytes
+                self.peak_bytes = max(self.peak_bytes, pass_bytes)
+
+    def starts_batch(self, bake_job, baking_pass):
+        return (bake_job.texture_set_name, baking_pass.name) in self.batch_starts
+
+    def order_passes(self, baking_passes):
+        """Sort the baking passes into the planned order, passes that weren't planned go last"""
+        return sorted(baking_passes, key = lambda baking_pass: self.pass_order.get(baking_pass.name, len(self.pass_order)))
+
+    def summary(self):
+        summary = "Estimated peak memory: {p:.0f} MB".format(p = self.peak_bytes / MB)
+        if self.budget_bytes:
+            summary += " of {b:.0f} MB in {n} batches".format(b = self.budget_bytes / MB, n = self.batch_count)
+        return summary
+
+    def to_dict(self):
+        return {"peak_mb":     self.peak_bytes / MB,
+                "budget_mb":   self.budget_bytes / MB,
+                "batch_count": self.batch_count,
+                "over_budget": [{"texture_set_name": name, "pass": pass_name, "mb": pass_bytes / MB} for name, pass_name, pass_bytes in self.over_budget],
+                "jobs":        [{"texture_set_name": job_estimate.texture_set_name,
+                                 "mesh_mb":          job_estimate.mesh_bytes / MB,
+                                 "passes":           [{"pass":         pass_estimate.pass_name,
+                                                       "image_mb":     pass_estimate.image_bytes / MB,
+                                                       "transient_mb": pass_estimate.transient_bytes / MB} for pass_estimate in job_estimate.passes]}
+                                for job_estimate in self.job_estimates]}
+
+def plan_bake_jobs(settings, bake_jobs, depsgraph = None):
+    """Plan the bake jobs that BatchBake set up"""
+    job_estimates = [estimate_job(settings, bake_job.texture_set_name, bake_job.object_to_bake_to, bake_job.objects_to_bake_from, depsgraph, bake_job.texture_size) for bake_job in bake_jobs]
+    return MemoryPlan(job_estimates, settings.memory_budget_mb * MB)
+
+def plan_bake(context, evaluate_modifiers = True):
+    """Dry run: plan a bake of the current selection with the current settings, without baking anything.
+    The jobs are split the same way the batch_baker operator splits them, without checking the materials.
+    Example: print(bakery.memory_planner.plan_bake(bpy.context).summary())
+    """
+    settings = context.scene.baking_tools_settings
+    depsgraph = context.evaluated_depsgraph_get() if evaluate_modifiers else None
+
+    job_estimates = []
+    if settings.bake_source == "SELF":
+        objects_to_bake_to = [object for object in context.selected_objects if object.type in BAKEABLE_TYPES]
+        for object_to_bake_to in objects_to_bake_to:
+            texture_set_name = settings.texture_set_name
+            if len(objects_to_bake_to) > 1:
+                texture_set_name = settings.texture_name_delimiter.join([texture_set_name, bpy.path.clean_name(object_to_bake_to.name)])
+            job_estimates.append(estimate_job(settings, texture_set_name, object_to_bake_to, [], depsgraph))
+    elif settings.bake_source == "SELECTED_TO_ACTIVE" and context.active_object:
+        objects_to_bake_from = [object for object in context.selected_objects if object != context.active_object]
+        job_estimates.append(estimate_job(settings, settings.texture_set_name, context.active_object, objects_to_bake_from, depsgraph))
+
+    return MemoryPlan(job_estimates, settings.memory_budget_mb * MB)
@@ -0,0 +1,245 @@
+import concurrent.futures
+import os
+import struct
+import threading
+import zlib
+
+import numpy
+
+#{ TEXTURE_WRITERS_REGION
+# Blender's image saving functions have to be called from the main thread, so they block the next bake while a texture is encoded and written to disk.
+# These writers encode textures with NumPy and zlib instead, both of which release the GIL, so the encoding can happen on a background thread.
+# The pixels are written exactly as they are stored in the image buffer, this matches how the bake textures are saved with the "Raw" view transform.
+# Only the formats and color depths listed in SUPPORTED_FORMATS are handled, everything else falls back to Image.save_render().
+# The image settings of the scene are ignored, so the writeback is opt-in. tools/check_texture_writeback.py compares the files against Image.save_render() in Blender.
+
+SUPPORTED_FORMATS = {("PNG", '8'), ("PNG", '16'), ("TIFF", '8'), ("TIFF", '16'), ("TARGA", '8')}
+
+class PNGWriter():
+    """Streams rows of RGB pixels into a PNG file. Rows are written from the top of the image to the bottom."""
+    def __init__(self, filepath, width, height, bit_depth):
+        self.file = open(filepath, "wb")
+        self.width = width
+        self.bit_depth = bit_depth
+        self.compressor = zlib.compressobj(6)
+
+        self.file.write(b"\x89PNG\r\n\x1a\n") # PNG signature
+        self.write_chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, bit_depth, 2, 0, 0, 0)) # Color type 2: RGB, no interlacing
+
+    def write_chunk(self, chunk_type, data):
+        self.file.write(struct.pack(">I", len(data)))
+        self.file.write(chunk_type)
+        self.file.write(data)
+        self.file.write(struct.pack(">I", zlib.crc32(chunk_type + data) & 0xffffffff))
+
+    def write_rows(self, rows):
+        """rows: Array of shape (row count, width, 3) of uint8 or uint16 values"""
+        rows = rows.astype(">u2" if self.bit_depth == 16 else "u1", copy = False) # PNG stores 16 bit samples as big-endian
+        scanlines = numpy.zeros((rows.shape[0], 1 + rows.shape[1] * 3 * rows.itemsize), dtype = "u1") # Each scanline starts with a filter type byte, 0 means no filter
+        scanlines[:, 1:] = rows.reshape(rows.shape[0], -1).view("u1")
+        data = self.compressor.compress(scanlines.tobytes())
+        if data:
+            self.write_chunk(b"IDAT", data)
+
+    def close(self):
+        self.write_chunk(b"IDAT", self.compressor.flush())
+        self.write_chunk(b"IEND", b"")
+        self.file.close()
+
+class TIFFWriter():
+    """Streams rows of RGB pixels into a Deflate compressed TIFF file. Rows are written from the top of the image to the bottom."""
+    ROWS_PER_STRIP = 16
+
+    def __init__(self, filepath, width, height, bit_depth):
+        self.file = open(filepath, "wb")
+        self.width = width
+        self.height = height
+        self.bit_depth = bit_depth
+        self.strip_offsets = []
+        self.strip_byte_counts = []
+        self.pending_rows = None # Rows that haven't filled up a whole strip yet
+
+        self.file.write(b"II*\x00") # Little-endian TIFF
+        self.file.write(struct.pack("<I", 0)) # Placeholder for the offset of the image file directory, it's written at the end
+
+    def write_strip(self, rows):
+        data = zlib.compress(rows.astype("<u2" if self.bit_depth == 16 else "u1", copy = False).tobytes(), 6)
+        self.strip_offsets.append(self.file.tell())
+        self.strip_byte_counts.append(len(data))
+        self.file.write(data)
+
+    def write_rows(self, rows):
+        """rows: Array of shape (row count, width, 3) of uint8 or uint16 values"""
+        if self.pending_rows is not None:
+            rows = numpy.concatenate((self.pending_rows, rows))
+            self.pending_rows = None
+        full_strips = rows.shape[0] // self.ROWS_PER_STRIP * self.ROWS_PER_STRIP
+        for index in range(0, full_strips, self.ROWS_PER_STRIP):
+            self.write_strip(rows[index:index + self.ROWS_PER_STRIP])
+        if full_strips < rows.shape[0]:
+            self.pending_rows = rows[full_strips:]
+
+    def close(self):
+        if self.pending_rows is not None:
+            self.write_strip(self.pending_rows) # The last strip can be shorter than the others
+
+        # Values that don't fit in the 4 bytes of a directory entry are written before the directory, and the entry points at them
+        def align_to_word():
+            if self.file.tell() % 2:
+                self.file.write(b"\x00") # Offsets in a TIFF file should be on a word boundary
+        def write_values(format, values):
+            align_to_word()
+            offset = self.file.tell()
+            self.file.write(struct.pack("<{n}{f}".format(n = len(values), f = format), *values))
+            return offset
+        bits_per_sample_offset = write_values("H", [self.bit_depth] * 3)
+        strip_offsets_offset = write_values("I", self.strip_offsets) if len(self.strip_offsets) > 1 else self.strip_offsets[0]
+        strip_byte_counts_offset = write_values("I", self.strip_byte_counts) if len(self.strip_byte_counts) > 1 else self.strip_byte_counts[0]
+        resolution_offset = write_values("I", [72, 1])
+
+        SHORT, LONG, RATIONAL = 3, 4, 5
+        entries = [(256, LONG,     1,                        self.width),               # ImageWidth
+                   (257, LONG,     1,                        self.height),              # ImageLength
+                   (258, SHORT,    3,                        bits_per_sample_offset),   # BitsPerSample
+                   (259, SHORT,    1,                        8),                        # Compression: Deflate
+                   (262, SHORT,    1,                        2),                        # PhotometricInterpretation: RGB
+                   (273, LONG,     len(self.strip_offsets),  strip_offsets_offset),     # StripOffsets
+                   (277, SHORT,    1,                        3),                        # SamplesPerPixel
+                   (278, LONG,     1,                        self.ROWS_PER_STRIP),      # RowsPerStrip
+                   (279, LONG,     len(self.strip_offsets),  strip_byte_counts_offset), # StripByteCounts
+                   (282, RATIONAL, 1,                        resolution_offset),        # XResolution
+                   (283, RATIONAL, 1,                        resolution_offset),        # YResolution
+                   (284, SHORT,    1,                        1),                        # PlanarConfiguration: RGBRGB...
+                   (296, SHORT,    1,                        2)]                        # ResolutionUnit: Inch
+
+        align_to_word()
+        directory_offset = self.file.tell()
+        self.file.write(struct.pack("<H", len(entries)))
+        for tag, value_type, count, value in entries:
+            if value_type == SHORT and count == 1:
+                self.file.write(struct.pack("<HHIH2x", tag, value_type, count, value)) # A single SHORT is stored in the first 2 bytes of the value field
+            else:
+                self.file.write(struct.pack("<HHII", tag, value_type, count, value))
+        self.file.write(struct.pack("<I", 0)) # There's only one image in the file
+
+        self.file.seek(4)
+        self.file.write(struct.pack("<I", directory_offset))
+        self.file.close()
+
+class TGAWriter():
+    """Streams rows of RGB pixels into an uncompressed TGA file. Rows are written from the top of the image to the bottom."""
+    def __init__(self, filepath, width, height, bit_depth):
+        self.file = open(filepath, "wb")
+        # Image type 2: uncompressed true color, 24 bits per pixel, image descriptor 0x20: the first row is the top of the image
+        self.file.write(struct.pack("<BBBHHBHHHHBB", 0, 0, 2, 0, 0, 0, 0, 0, width, height, 24, 0x20))
+
+    def write_rows(self, rows):
+        self.file.write(rows[:, :, ::-1].astype("u1", copy = False).tobytes()) # TGA stores pixels as BGR
+
+    def close(self):
+        self.file.close()
+
+def open_texture_writer(filepath, file_format, width, height, color_depth):
+    directory = os.path.dirname(filepath)
+    if directory:
+        os.makedirs(directory, exist_ok = True)
+    writers = {"PNG": PNGWriter, "TIFF": TIFFWriter, "TARGA": TGAWriter}
+    return writers[file_format](filepath, width, height, int(color_depth))
+
+def quantize_rows(rows, bit_depth, encode_srgb):
+    """Convert rows of RGBA float pixels into RGB integers with the given bit depth"""
+    rgb = rows[:, :, :3] # The textures are saved with the "RGB" color mode, drop the alpha channel
+    if encode_srgb:
+        # Float buffers store linear values, color textures are saved with the sRGB transfer function
+        rgb = numpy.where(rgb <= 0.0031308, rgb * 12.92, 1.055 * numpy.power(numpy.maximum(rgb, 0.0031308), 1.0 / 2.4) - 0.055)
+    maximum = (1 << bit_depth) - 1
+    return numpy.rint(numpy.clip(rgb, 0.0, 1.0) * maximum).astype(numpy.uint16 if bit_depth > 8 else numpy.uint8)
+
+def write_texture(pixels, width, height, filepath, file_format, color_depth, encode_srgb = False, band_height = 256):
+    """Encode a flat buffer of RGBA float pixels, in Blender's bottom to top row order, and write it to a file.
+    The image is converted in bands of rows so the temporary buffers stay small.
+    """
+    pixels = pixels.reshape(height, width, 4)
+    writer = open_texture_writer(filepath, file_format, width, height, color_depth)
+    try:
+        for top in range(height, 0, -band_height): # Blender's first row is the bottom of the image, start from the top
+            bottom = max(top - band_height, 0)
+            band = pixels[bottom:top][::-1] # Flip the band so its first row is the top one
+            writer.write_rows(quantize_rows(band, int(color_depth), encode_srgb))
+    finally:
+        writer.close()
+
+class TiledTextureWriter():
+    """Assembles square tiles of RGBA float pixels into a texture file, without ever holding the whole texture in memory.
+    Each tile is quantized into a band of rows as soon as it arrives, and the band is streamed to the file once its row of tiles is complete.
+    Tiles have to be written a row of tiles at a time, starting from the top row of the texture.
+    """
+    def __init__(self, filepath, file_format, color_depth, texture_size, tile_count, encode_srgb = False):
+        self.tile_size = texture_size // tile_count
+        self.tile_count = tile_count
+        self.bit_depth = int(color_depth)
+        self.encode_srgb = encode_srgb
+        self.band = numpy.empty((self.tile_size, texture_size, 3), dtype = numpy.uint16 if self.bit_depth > 8 else numpy.uint8)
+        self.tiles_in_band = 0
+        self.writer = open_texture_writer(filepath, file_format, texture_size, texture_size, color_depth)
+
+    def write_tile(self, pixels, tile_x):
+        """pixels: Flat buffer of RGBA float pixels in Blender's bottom to top row order, tile_x: Column of the tile, 0 is on the left"""
+        tile = pixels.reshape(self.tile_size, self.tile_size, 4)[::-1] # Flip the tile so its first row is the top one
+        left = tile_x * self.tile_size
+        self.band[:, left:left + self.tile_size] = quantize_rows(tile, self.bit_depth, self.encode_srgb)
+        self.tiles_in_band += 1
+        if self.tiles_in_band == self.tile_count:
+            self.writer.write_rows(self.band)
+            self.tiles_in_band = 0
+
+    def close(self):
+        self.writer.close()
+#} END TEXTURE_WRITERS_REGION
+
+#{ WRITEBACK_REGION
+class TextureWriteback():
+    """Encode and write baked textures on a bounded pool of background threads while the next pass bakes.
+    The pixels are copied out of the image with a single bulk foreach_get, so the image can be reused or removed as soon as submit() returns.
+    At most max_pending textures are held in memory at once, submit() waits for a slot before copying the next one.
+    """
+    def __init__(self, max_workers = 2, max_pending = 2):
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers = max_workers, thread_name_prefix = "bakery_writeback")
+        self.slots = threading.BoundedSemaphore(max_pending)
+        self.futures = {} # {future : filepath}
+        self.failed_filepaths = [] # Files that couldn't be written
+
+    @staticmethod
+    def can_write(file_format, color_depth):
+        return (file_format, color_depth) in SUPPORTED_FORMATS
+
+    def submit(self, image, filepath, file_format, color_depth, encode_srgb = False):
+        """Copy the pixels out of the image and queue them to be written to the filepath"""
+        width, height = image.size
+        self.slots.acquire() # Wait until there's room for another texture in memory
+        try:
+            pixels = numpy.empty(width * height * 4, dtype = numpy.float32)
+            image.pixels.foreach_get(pixels)
+            future = self.executor.submit(write_texture, pixels, width, height, filepath, file_format, color_depth, encode_srgb)
+        except Exception:
+            self.slots.release()
+            raise
+        future.add_done_callback(lambda future: self.slots.release())
+        self.futures[future] = filepath
+
+    def flush(self):
+        """Wait until every queued texture has been written. Returns a list of error messages for the textures that failed to write."""
+        errors = []
+        for future in concurrent.futures.as_completed(list(self.futures)):
+            exception = future.exception()
+            if exception:
+                self.failed_filepaths.append(self.futures[future])
+                errors.append("Failed to write {f}: {e}".format(f = self.futures[future], e = exception))
+        self.futures = {}
+        return errors
+
+    def shutdown(self):
+        errors = self.flush()
+        self.executor.shutdown()
+        return errors
+#} END WRITEBACK_REGION
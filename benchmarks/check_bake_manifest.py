@@ -0,0 +1,113 @@
+"""Check the content hashes of bake_manifest.py on plain CPython, using fake_bpy in place of Blender.
+
+The exit code is 1 if any check fails.
+
+Usage:
+python check_bake_manifest.py
+"""
+import importlib
+import os
+import sys
+import types
+
+import fake_bpy
+
+BAKERY_DIRECTORY = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "bakery")
+
+def load_bakery_modules():
+    """Import the bakery modules against fake_bpy, without running the package's __init__"""
+    fake_bpy.install()
+    package = types.ModuleType("bakery")
+    package.__path__ = [BAKERY_DIRECTORY]
+    sys.modules["bakery"] = package
+    return importlib.import_module("bakery.caching_utilities"), importlib.import_module("bakery.bake_manifest")
+
+class Checks():
+    def __init__(self):
+        self.failures = []
+
+    def check(self, condition, message):
+        if not condition:
+            self.failures.append(message)
+            print("FAILED: " + message)
+
+def make_framed_material(name, frame_first):
+    """Create a material with two Math nodes, one of them in a Frame.
+    The schema of a node type is built from the first node of that type, so frame_first decides whether it's built from the framed node.
+    """
+    material = fake_bpy.make_material(name)
+    nodes = material.node_tree.nodes
+    node_frame = nodes.new("NodeFrame")
+    node_framed = nodes.new("ShaderNodeMath")
+    node_unframed = nodes.new("ShaderNodeMath")
+    if not frame_first:
+        node_framed, node_unframed = node_unframed, node_framed
+    node_framed.parent = node_frame
+    return material, node_framed, node_unframed
+
+def check_nullable_pointers(checks, cache, bake_manifest):
+    for frame_first in (True, False):
+        cache.PropertySchema.schemas.clear()
+        material, node_framed, node_unframed = make_framed_material("Framed", frame_first)
+        order = "framed node first" if frame_first else "unframed node first"
+        try:
+            content_hash = bake_manifest.BakeHasher().hash_node_tree(material.node_tree)
+        except AttributeError as error:
+            checks.check(False, "A node tree with a framed and an unframed node of the same type can be hashed ({o}), got {e!r}".format(o = order, e = error))
+            continue
+        checks.check(content_hash is not None, "A node tree with a framed and an unframed node of the same type can be hashed ({o})".format(o = order))
+
+        schema = cache.PropertySchema.get_schema(node_framed)
+        checks.check(not any(entry.path.startswith("parent.") for entry in schema.entries), "The node schema doesn't follow the parent pointer ({o})".format(o = order))
+        parent_entry = next((entry for entry in schema.entries if entry.path == "parent"), None)
+        checks.check(parent_entry is not None and parent_entry.read_value(node_unframed) is None, "The parent of an unframed node is read as None ({o})".format(o = order))
+        checks.check(parent_entry is not None and parent_entry.read_value(node_framed) is node_framed.parent, "The parent of a framed node is read as the reference itself ({o})".format(o = order))
+
+    # Moving a node into a frame doesn't change what gets baked
+    cache.PropertySchema.schemas.clear()
+    material, node_framed, _ = make_framed_material("Framed", frame_first = True)
+    framed_hash = bake_manifest.BakeHasher().hash_node_tree(material.node_tree)
+    node_framed.parent = None
+    checks.check(bake_manifest.BakeHasher().hash_node_tree(material.node_tree) == framed_hash, "Moving a node out of a frame doesn't change the hash")
+
+def check_unset_intermediate_pointers(checks, cache):
+    """read_value() returns None when a pointer on the way to the property isn't set, and still raises for properties that don't exist"""
+    cache.PropertySchema.schemas.clear()
+    struct = fake_bpy.make_struct_type("Settings", depth = 2, property_count = 4)()
+    schema = cache.PropertySchema.get_schema(struct)
+    nested_entry = next(entry for entry in schema.entries if entry.owner_path)
+    owner_identifier = nested_entry.owner_path.split(".")[0]
+
+    unset_struct = fake_bpy.make_struct_type("Settings", depth = 2, property_count = 4)()
+    object.__setattr__(unset_struct, owner_identifier, None)
+    try:
+        checks.check(nested_entry.read_value(unset_struct) is None, "A property behind an unset pointer is read as None")
+    except AttributeError as error:
+        checks.check(False, "A property behind an unset pointer is read as None, got {e!r}".format(e = error))
+
+    missing_entry = cache.PropertySchemaEntry(nested_entry.owner_path + ".missing_property", fake_bpy.IntProperty("missing_property"), nested_entry.owner_identifier)
+    try:
+        missing_entry.read_value(struct)
+        checks.check(False, "A property that doesn't exist raises AttributeError")
+    except AttributeError:
+        pass
+
+def main():
+    try:
+        import numpy # bake_manifest.py reads the mesh data with numpy, which Blender ships with
+    except ImportError:
+        print("Skipped the bake manifest checks, numpy isn't installed")
+        return 0
+
+    cache, bake_manifest = load_bakery_modules()
+    checks = Checks()
+    check_nullable_pointers(checks, cache, bake_manifest)
+    check_unset_intermediate_pointers(checks, cache)
+    if checks.failures:
+        print("{n} bake manifest checks failed".format(n = len(checks.failures)))
+        return 1
+    print("All bake manifest checks passed")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
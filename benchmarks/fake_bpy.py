@@ -0,0 +1,419 @@
+"""A lightweight stand-in for the parts of Blender's bpy module that caching_utilities.py and bake_rig.py use, so they can be benchmarked on plain CPython.
+
+It models:
+- bpy.types.Property subclasses, and bl_rna.properties on every struct, including the "rna_type" property
+- Nested structs behind PointerProperties, and pointers to ID data-blocks
+- Dynamic EnumProperties whose valid items depend on a sibling property, with Blender's TypeError message when an invalid item is set
+- Material node trees with named nodes and sockets, links that replace the existing link of an input, and a count of topology updates
+- bpy.data.objects and a view layer with a selection and an active object, and a count of selection writes
+
+install() puts the module in sys.modules as "bpy". It has to be called before any bakery module is imported.
+"""
+import sys
+import types as python_types
+
+#{ RNA_REGION
+class bpy_struct():
+    pass
+
+class ID(bpy_struct):
+    def __init__(self, name):
+        self.name = name
+        self.name_full = name
+
+class Property():
+    def __init__(self, identifier, is_readonly = False, array_length = 0):
+        self.identifier = identifier
+        self.is_readonly = is_readonly
+        self.array_dimensions = (array_length, 0, 0) # Only used by Bool, Int and Float properties
+
+class BoolProperty(Property):
+    pass
+
+class IntProperty(Property):
+    pass
+
+class FloatProperty(Property):
+    pass
+
+class StringProperty(Property):
+    pass
+
+class EnumProperty(Property):
+    def __init__(self, identifier, get_items, is_readonly = False):
+        super().__init__(identifier, is_readonly)
+        self.get_items = get_items # Function that returns the valid items for a struct instance, so the items can depend on other properties
+        self.is_enum_flag = False
+        self.enum_items = () # Like Blender, the static items don't reflect the dynamic ones
+
+class PointerProperty(Property):
+    def __init__(self, identifier, is_readonly = False, is_never_none = False):
+        super().__init__(identifier, is_readonly)
+        self.is_never_none = is_never_none # Pointers to nested structs like "render.bake" are never None, pointers like "Node.parent" can be
+
+class CollectionProperty(Property):
+    pass
+
+class BlenderRNA():
+    def __init__(self, identifier, properties):
+        self.identifier = identifier
+        self.properties = [PointerProperty("rna_type", is_readonly = True)] + properties
+        self.properties_by_identifier = {property.identifier : property for property in self.properties}
+
+class Struct(bpy_struct):
+    """Base class for the generated struct types. Writes are validated the same way Blender validates them."""
+    bl_rna = BlenderRNA("Struct", [])
+
+    def __setattr__(self, name, value):
+        property = self.bl_rna.properties_by_identifier.get(name)
+        if property is not None and self.__dict__.get("_initialized"):
+            if property.is_readonly:
+                raise AttributeError("bpy_struct: attribute \"{p}\" from \"{s}\" is read-only".format(p = name, s = self.bl_rna.identifier))
+            if type(property) == EnumProperty:
+                items = property.get_items(self)
+                if value not in items:
+                    raise TypeError("bpy_struct: item.attr = val: enum \"{v}\" not found in ({i})".format(v = value, i = ", ".join("'{i}'".format(i = item) for item in items)))
+        object.__setattr__(self, name, value)
+
+def make_struct_type(identifier, depth, property_count, branching = 1):
+    """Create a struct type with property_count leaf properties, and branching nested structs for each of the depth levels below it.
+    Every struct has a pair of EnumProperties where the valid items of "color_depth" depend on the value of "file_format", like ImageFormatSettings.
+    """
+    properties = []
+    for index in range(property_count):
+        kind = index % 6
+        if kind == 0:
+            properties.append(BoolProperty("use_option_{i}".format(i = index)))
+        elif kind == 1:
+            properties.append(IntProperty("count_{i}".format(i = index)))
+        elif kind == 2:
+            properties.append(FloatProperty("factor_{i}".format(i = index)))
+        elif kind == 3:
+            properties.append(FloatProperty("color_{i}".format(i = index), array_length = 4))
+        elif kind == 4:
+            properties.append(StringProperty("label_{i}".format(i = index)))
+        else:
+            properties.append(IntProperty("version_{i}".format(i = index), is_readonly = True))
+    properties.append(EnumProperty("file_format", lambda struct: ("PNG", "TIFF", "TARGA")))
+    properties.append(EnumProperty("color_depth", lambda struct: ("8",) if struct.file_format == "TARGA" else ("8", "16")))
+    properties.append(PointerProperty("image")) # Points at an ID data-block, it's cached as a reference
+    properties.append(CollectionProperty("items")) # Collections are skipped
+
+    children = []
+    if depth > 0:
+        for index in range(branching):
+            child_type = make_struct_type("{s}_{i}".format(s = identifier, i = index), depth - 1, property_count, branching)
+            children.append(("child_{i}".format(i = index), child_type))
+            properties.append(PointerProperty("child_{i}".format(i = index), is_never_none = True))
+
+    def __init__(self, variant = 0):
+        # variant 0 and 1 give every writable property a different value, so applying one onto the other writes every property
+        object.__setattr__(self, "_initialized", False)
+        for property in properties:
+            property_type = type(property)
+            if property_type == BoolProperty:
+                setattr(self, property.identifier, bool(variant))
+            elif property_type in (IntProperty, FloatProperty):
+                value = variant + 0.5 if property_type == FloatProperty else variant
+                setattr(self, property.identifier, (value,) * property.array_dimensions[0] if property.array_dimensions[0] else value)
+            elif property_type == StringProperty:
+                setattr(self, property.identifier, "value {v}".format(v = variant))
+        self.file_format = ("PNG", "TARGA")[variant]
+        self.color_depth = ("16", "8")[variant]
+        self.image = None
+        self.items = []
+        for child_identifier, child_type in children:
+            setattr(self, child_identifier, child_type(variant))
+        object.__setattr__(self, "_initialized", True)
+
+    return type(identifier, (Struct,), {"bl_rna": BlenderRNA(identifier, properties), "__init__": __init__})
+#} END RNA_REGION
+
+#{ NODES_REGION
+# Socket definitions for the node types used while baking: {bl_idname : (default name, [(input name, type)], [(output name, type)])}
+NODE_TYPES = {"ShaderNodeOutputMaterial": ("Material Output",  [("Surface", 'SHADER'), ("Volume", 'SHADER'), ("Displacement", 'VECTOR')], []),
+              "ShaderNodeBsdfPrincipled": ("Principled BSDF",  [("Base Color", 'RGBA'), ("Metallic", 'VALUE'), ("Roughness", 'VALUE'), ("Normal", 'VECTOR'), ("Emission", 'RGBA'), ("Alpha", 'VALUE')], [("BSDF", 'SHADER')]),
+              "ShaderNodeEmission":       ("Emission",         [("Color", 'RGBA'), ("Strength", 'VALUE')], [("Emission", 'SHADER')]),
+              "ShaderNodeCombineColor":   ("Combine Color",    [("Red", 'VALUE'), ("Green", 'VALUE'), ("Blue", 'VALUE')], [("Color", 'RGBA')]),
+              "ShaderNodeValue":          ("Value",            [], [("Value", 'VALUE')]),
+              "ShaderNodeTexImage":       ("Image Texture",    [("Vector", 'VECTOR')], [("Color", 'RGBA'), ("Alpha", 'VALUE')]),
+              "ShaderNodeMath":           ("Math",             [("Value", 'VALUE'), ("Value_001", 'VALUE')], [("Value", 'VALUE')]),
+              "NodeFrame":                ("Frame",            [], [])}
+# RNA properties of every node, and the extra properties of some node types. Nodes are grouped into frames with their "parent" pointer, which is None for nodes that aren't in a frame
+NODE_PROPERTIES = [StringProperty("label"), FloatProperty("location", array_length = 2), BoolProperty("select"), PointerProperty("parent")]
+NODE_TYPE_PROPERTIES = {"NodeFrame": [IntProperty("label_size"), BoolProperty("shrink")]}
+DEFAULT_VALUES = {'RGBA': (0.8, 0.8, 0.8, 1.0), 'VALUE': 0.5, 'VECTOR': (0.0, 0.0, 0.0), 'SHADER': None}
+
+class NodeSocket():
+    def __init__(self, node, name, type, is_output):
+        self.node = node
+        self.name = name
+        self.identifier = name
+        self.type = type
+        self.is_output = is_output
+        if DEFAULT_VALUES[type] is not None: # Like Blender, shader sockets have no default_value
+            self.default_value = DEFAULT_VALUES[type]
+        self.link_list = []
+
+    @property
+    def links(self):
+        return tuple(self.link_list) # Like Blender, a new tuple is made every time the links are read
+
+class SocketCollection():
+    """Sockets can be found by index or by name"""
+    def __init__(self, sockets):
+        self.sockets = sockets
+        self.sockets_by_name = {}
+        for socket in sockets:
+            self.sockets_by_name.setdefault(socket.name, socket)
+
+    def __getitem__(self, key):
+        if isinstance(key, int):
+            return self.sockets[key]
+        return self.sockets_by_name[key]
+
+    def __contains__(self, name):
+        return name in self.sockets_by_name
+
+    def __iter__(self):
+        return iter(self.sockets)
+
+    def __len__(self):
+        return len(self.sockets)
+
+class Node(bpy_struct):
+    def __init__(self, bl_idname, name, nodes):
+        self.bl_idname = bl_idname
+        self.nodes = nodes
+        self.node_name = name
+        self.label = ""
+        self.location = (0.0, 0.0)
+        self.select = False
+        self.parent = None
+        self.image = None
+        self.is_removed = False
+        self.label_size = 20 # Only part of the RNA of Frame nodes
+        self.shrink = True
+        _, inputs, outputs = NODE_TYPES[bl_idname]
+        self.inputs = SocketCollection([NodeSocket(self, socket_name, socket_type, False) for socket_name, socket_type in inputs])
+        self.outputs = SocketCollection([NodeSocket(self, socket_name, socket_type, True) for socket_name, socket_type in outputs])
+
+    @property
+    def name(self):
+        if self.is_removed:
+            raise ReferenceError("StructRNA of type ShaderNode has been removed") # Like Blender, a removed node can't be used anymore
+        return self.node_name
+
+    @name.setter
+    def name(self, name):
+        # Renaming a node keeps the names unique, the same way Blender does
+        del self.nodes.nodes_by_name[self.node_name]
+        self.node_name = self.nodes.get_unique_name(name)
+        self.nodes.nodes_by_name[self.node_name] = self
+
+node_classes = {} # Like Blender, every node type has its own class: {bl_idname : class}
+
+def get_node_class(bl_idname):
+    if bl_idname not in node_classes:
+        node_classes[bl_idname] = type(bl_idname, (Node,), {"bl_rna": BlenderRNA(bl_idname, NODE_PROPERTIES + NODE_TYPE_PROPERTIES.get(bl_idname, []))})
+    return node_classes[bl_idname]
+
+class NodeLink():
+    def __init__(self, from_socket, to_socket):
+        self.from_socket = from_socket
+        self.to_socket = to_socket
+        self.from_node = from_socket.node
+        self.to_node = to_socket.node
+        self.is_muted = False
+
+class Nodes():
+    def __init__(self, node_tree):
+        self.node_tree = node_tree
+        self.nodes_by_name = {}
+        self.active = None
+
+    def get_unique_name(self, base_name):
+        name = base_name
+        index = 0
+        while name in self.nodes_by_name: # Blender gives new nodes a unique name: "Value", "Value.001", ...
+            index += 1
+            name = "{n}.{i:03d}".format(n = base_name, i = index)
+        return name
+
+    def new(self, type):
+        name = self.get_unique_name(NODE_TYPES[type][0])
+        node = get_node_class(type)(type, name, self)
+        self.nodes_by_name[name] = node
+        self.node_tree.topology_updates += 1
+        return node
+
+    def remove(self, node):
+        for socket in list(node.inputs) + list(node.outputs):
+            for link in socket.links:
+                self.node_tree.links.remove(link)
+        del self.nodes_by_name[node.name]
+        node.is_removed = True
+        if self.active is node:
+            self.active = None
+        self.node_tree.topology_updates += 1
+
+    def __getitem__(self, name):
+        return self.nodes_by_name[name]
+
+    def get(self, name, default = None):
+        return self.nodes_by_name.get(name, default)
+
+    def keys(self):
+        return list(self.nodes_by_name.keys())
+
+    def __contains__(self, name):
+        return name in self.nodes_by_name
+
+    def __iter__(self):
+        return iter(list(self.nodes_by_name.values()))
+
+    def __len__(self):
+        return len(self.nodes_by_name)
+
+class Links():
+    def __init__(self, node_tree):
+        self.node_tree = node_tree
+        self.links_by_id = {} # Blender keeps the links in a linked list, so removing one doesn't depend on how many there are
+
+    def new(self, input, output):
+        if input.is_output:
+            input, output = output, input # Blender accepts the sockets in either order
+        for link in input.links:
+            self.remove(link) # An input socket only takes a single link
+        link = NodeLink(output, input)
+        output.link_list.append(link)
+        input.link_list.append(link)
+        self.links_by_id[id(link)] = link
+        self.node_tree.topology_updates += 1
+        return link
+
+    def remove(self, link):
+        link.from_socket.link_list.remove(link)
+        link.to_socket.link_list.remove(link)
+        del self.links_by_id[id(link)]
+        self.node_tree.topology_updates += 1
+
+    def __iter__(self):
+        return iter(list(self.links_by_id.values()))
+
+    def __len__(self):
+        return len(self.links_by_id)
+
+class NodeTree(ID):
+    def __init__(self, name):
+        super().__init__(name)
+        self.topology_updates = 0 # Every node or link that's added or removed makes Blender recompile the material's shaders
+        self.nodes = Nodes(self)
+        self.links = Links(self)
+
+class Material(ID):
+    def __init__(self, name):
+        super().__init__(name)
+        self.node_tree = NodeTree(name)
+
+class ColorspaceSettings():
+    def __init__(self):
+        self.name = 'sRGB'
+
+class Image(ID):
+    def __init__(self, name, width = 1024, height = 1024, float_buffer = False):
+        super().__init__(name)
+        self.size = (width, height)
+        self.is_float = float_buffer
+        self.colorspace_settings = ColorspaceSettings()
+
+def make_material(name, node_count = 0):
+    """Create a material with a Principled BSDF connected to the Material Output.
+    node_count extra nodes are added in a chain of Math nodes that feeds the Roughness input, and the Base Color is read from an Image Texture node.
+    """
+    material = Material(name)
+    node_tree = material.node_tree
+    node_output = node_tree.nodes.new("ShaderNodeOutputMaterial")
+    node_shader = node_tree.nodes.new("ShaderNodeBsdfPrincipled")
+    node_tree.links.new(node_output.inputs["Surface"], node_shader.outputs["BSDF"])
+
+    node_texture = node_tree.nodes.new("ShaderNodeTexImage")
+    node_texture.image = Image("Albedo")
+    node_tree.links.new(node_shader.inputs["Base Color"], node_texture.outputs["Color"])
+
+    previous_node = None
+    for _ in range(node_count):
+        node_math = node_tree.nodes.new("ShaderNodeMath")
+        if previous_node:
+            node_tree.links.new(node_math.inputs[0], previous_node.outputs[0])
+        previous_node = node_math
+    if previous_node:
+        node_tree.links.new(node_shader.inputs["Roughness"], previous_node.outputs[0])
+
+    node_tree.topology_updates = 0 # Only count the updates made after the material was built
+    return material
+#} END NODES_REGION
+
+#{ OBJECTS_REGION
+class Object(ID):
+    def __init__(self, name, object_type = "MESH"):
+        super().__init__(name)
+        self.type = object_type
+        self.view_layer = None # The view layer the object is linked to, the stand-in only has one
+
+    def select_get(self, view_layer = None):
+        return self in (view_layer or self.view_layer).objects.selected_set
+
+    def select_set(self, state, view_layer = None):
+        layer_objects = (view_layer or self.view_layer).objects
+        layer_objects.selection_writes += 1
+        if state:
+            layer_objects.selected_set.add(self)
+        else:
+            layer_objects.selected_set.discard(self)
+
+class LayerObjects():
+    def __init__(self):
+        self.objects = []
+        self.selected_set = set() # Blender keeps the selection flag on each object's base, the set stands in for collecting them in C
+        self.active = None
+        self.selection_writes = 0 # Number of select_set() calls, to check how many objects a bake touched
+
+    @property
+    def selected(self):
+        return list(self.selected_set)
+
+    def __iter__(self):
+        return iter(self.objects)
+
+    def __len__(self):
+        return len(self.objects)
+
+class ViewLayer(bpy_struct):
+    def __init__(self):
+        self.objects = LayerObjects()
+
+def make_scene(object_count, selected_count = 0):
+    """Fill bpy.data.objects with object_count objects linked to a new view layer, the first selected_count objects are selected and the last of them is active. Returns the view layer."""
+    view_layer = ViewLayer()
+    data.objects = []
+    for index in range(object_count):
+        object = Object("Object.{i:06d}".format(i = index))
+        object.view_layer = view_layer
+        data.objects.append(object)
+    view_layer.objects.objects = data.objects
+    view_layer.objects.selected_set = set(data.objects[:selected_count])
+    view_layer.objects.active = data.objects[selected_count - 1] if selected_count else None
+    return view_layer
+
+data = python_types.SimpleNamespace(objects = []) # bpy.data
+#} END OBJECTS_REGION
+
+def install():
+    """Make "import bpy" return this module"""
+    module = sys.modules[__name__]
+    module.types = python_types.SimpleNamespace(bpy_struct = bpy_struct, ID = ID, NodeTree = NodeTree, Image = Image, Material = Material, Object = Object, ViewLayer = ViewLayer,
+                                                Property = Property, BoolProperty = BoolProperty, IntProperty = IntProperty, FloatProperty = FloatProperty,
+                                                StringProperty = StringProperty, EnumProperty = EnumProperty, PointerProperty = PointerProperty, CollectionProperty = CollectionProperty)
+    sys.modules["bpy"] = module
+    return module
@@ -0,0 +1,242 @@
+"""Benchmark the hot paths of caching_utilities.py and bake_rig.py on plain CPython, using fake_bpy in place of Blender.
+
+Benchmarks:
+schema_build        Index a struct type into a PropertySchema
+capture             CachedProperties(object_to_cache = ...)
+copy                CachedProperties(cache_to_copy = ...)
+apply_all           apply_properties_to_object() where every property has changed
+apply_only_changed  restore_changed_properties() where nothing has changed
+override_scope      Override a few properties with PropertyOverrides and restore them, the way a bake overrides the render settings
+node_link_apply     CachedNodeLink.apply_link_to_node_tree()
+node_tree_restore   Relink the Surface output to an Emission node and restore every output link with NodeTreeSnapshot.restore(), the way a bake rig switches between passes
+bake_rig            Insert a BakeRig, retarget it for every pass, and tear it down, the node setup and cleanup of perform_bake() for one material
+selection_full_walk Deselect every object in bpy.data.objects, select a bake job, and restore the selection by walking every object again, the way bakes used to
+selection_delta     The same selection changes through SelectionState, which only touches the objects whose selection changes
+
+The results are written as JSON, timings are per call in microseconds.
+Compare against a previous run with --baseline, the exit code is 1 if any median is slower than the baseline by more than the threshold.
+
+Usage:
+python run_benchmarks.py --depth 3 --properties 40 --nodes 50 --output results.json
+python run_benchmarks.py --baseline results.json --threshold 1.25
+python run_benchmarks.py --objects 100000 --selected 3
+"""
+import argparse
+import importlib
+import json
+import os
+import statistics
+import sys
+import time
+import types
+
+import fake_bpy
+
+BAKERY_DIRECTORY = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "bakery")
+
+# Passes that the bake rig is retargeted for, in the same form perform_bake() routes them: (pass type, socket names)
+RIG_PASSES = [("Base Color", ["Base Color"]),
+              ("Metallic",   ["Metallic"]),
+              ("Roughness",  ["Roughness"]),
+              ("Normal",     None), # Routed through the original shader
+              ("PACKED",     ["ONE", "Roughness", "Metallic"])]
+
+def load_bakery_modules():
+    """Import the bakery modules against fake_bpy.
+    The package's __init__ registers the add-on's UI, which needs much more of bpy, so the package is set up by path without running it.
+    """
+    fake_bpy.install()
+    package = types.ModuleType("bakery")
+    package.__path__ = [BAKERY_DIRECTORY]
+    sys.modules["bakery"] = package
+    return importlib.import_module("bakery.caching_utilities"), importlib.import_module("bakery.bake_rig")
+
+def get_struct_identifiers(struct):
+    """Get the RNA identifiers of a struct and every struct nested below it"""
+    identifiers = [struct.bl_rna.identifier]
+    for property in struct.bl_rna.properties:
+        if type(property) == fake_bpy.PointerProperty and property.identifier != "rna_type":
+            subobject = getattr(struct, property.identifier)
+            if isinstance(subobject, fake_bpy.Struct):
+                identifiers += get_struct_identifiers(subobject)
+    return identifiers
+
+def measure(function, repeat, number):
+    """Time a function, returns the duration of each repeat divided by the number of calls in it, in microseconds"""
+    durations = []
+    for _ in range(repeat):
+        start_time = time.perf_counter()
+        for _ in range(number):
+            function()
+        durations.append((time.perf_counter() - start_time) / number * 1e6)
+    return {"repeat":    repeat,
+            "number":    number,
+            "min_us":    min(durations),
+            "median_us": statistics.median(durations),
+            "mean_us":   statistics.mean(durations)}
+
+def run_benchmarks(args):
+    cache, bake_rig = load_bakery_modules()
+    results = {}
+
+    # Cached properties
+    struct_type = fake_bpy.make_struct_type("BenchmarkSettings", args.depth, args.properties, args.branching)
+    settings = struct_type(variant = 0)
+    settings_changed = struct_type(variant = 1)
+    for identifier in get_struct_identifiers(settings):
+        cache.PropertySchema.declared_dependencies[(identifier, "color_depth")] = ("file_format",) # Declared the same way as ImageFormatSettings.color_depth
+
+    def build_schema():
+        cache.PropertySchema.schemas.clear()
+        cache.PropertySchema.get_schema(settings)
+    results["schema_build"] = measure(build_schema, args.repeat, 1)
+    results["schema_build"]["entries"] = len(cache.PropertySchema.get_schema(settings).entries)
+
+    results["capture"] = measure(lambda: cache.CachedProperties(object_to_cache = settings), args.repeat, args.number)
+
+    original_settings = cache.CachedProperties(object_to_cache = settings)
+    changed_settings = cache.CachedProperties(object_to_cache = settings_changed)
+    results["copy"] = measure(lambda: cache.CachedProperties(cache_to_copy = original_settings), args.repeat, args.number)
+
+    # Alternate between the two snapshots so that every call writes every property
+    snapshots = [changed_settings, original_settings]
+    def apply_all():
+        snapshots.reverse()
+        snapshots[0].apply_properties_to_object(settings)
+    results["apply_all"] = measure(apply_all, args.repeat, args.number * 2)
+    results["apply_only_changed"] = measure(lambda: original_settings.restore_changed_properties(settings), args.repeat, args.number)
+
+    # Only the overridden properties are read and written back, no matter how big the struct is
+    overrides = cache.CachedProperties(cache_to_copy = changed_settings, dont_assign_values = True)
+    writable_entries = [entry for entry in cache.PropertySchema.get_schema(settings).entries_by_slot if not entry.is_readonly and entry.property_type != fake_bpy.PointerProperty]
+    for entry in writable_entries[:args.overrides]:
+        overrides.set_property(entry.path, changed_settings.get_property(entry.path))
+    def override_scope():
+        with cache.PropertyOverrides(settings) as property_overrides:
+            property_overrides.apply(overrides)
+    results["override_scope"] = measure(override_scope, args.repeat, args.number)
+
+    # Node links
+    material = fake_bpy.make_material("BenchmarkMaterial", args.nodes)
+    node_tree = material.node_tree
+    cached_link = cache.CachedNodeLink(node_tree.nodes["Material Output"].inputs[0].links[0])
+    results["node_link_apply"] = measure(lambda: cached_link.apply_link_to_node_tree(node_tree), args.repeat, args.number * 10)
+
+    snapshot = cache.NodeTreeSnapshot(node_tree)
+    node_output = node_tree.nodes["Material Output"]
+    node_emission = node_tree.nodes.new("ShaderNodeEmission")
+    def node_tree_restore():
+        node_tree.links.new(node_output.inputs["Surface"], node_emission.outputs["Emission"])
+        snapshot.restore()
+    results["node_tree_restore"] = measure(node_tree_restore, args.repeat, args.number * 10)
+    node_tree.nodes.remove(node_emission)
+
+    # Bake rig lifecycle
+    image = fake_bpy.Image("BakingTexture")
+    def bake_rig_lifecycle():
+        rig = bake_rig.BakeRig(material)
+        for _ in range(args.passes_per_material // len(RIG_PASSES) + 1):
+            for pass_type, socket_names in RIG_PASSES:
+                rig.set_target_image(image, 'sRGB' if pass_type == "Base Color" else 'Non-Color')
+                if socket_names:
+                    rig.route_through_emission(socket_names)
+                else:
+                    rig.route_through_shader()
+        rig.teardown()
+    node_tree.topology_updates = 0
+    results["bake_rig"] = measure(bake_rig_lifecycle, args.repeat, args.number)
+    results["bake_rig"]["topology_updates_per_call"] = node_tree.topology_updates / (args.repeat * args.number)
+
+    # Selection, a bake job selects one object to bake from and makes the object to bake to active
+    view_layer = fake_bpy.make_scene(args.objects, args.selected)
+    original_selection = view_layer.objects.selected
+    original_active = view_layer.objects.active
+    bake_job_objects = fake_bpy.data.objects[-2:]
+    def selection_full_walk():
+        for object in fake_bpy.data.objects:
+            object.select_set(False)
+        view_layer.objects.active = None
+        for object in bake_job_objects:
+            object.select_set(True)
+        view_layer.objects.active = bake_job_objects[-1]
+        for object in bake_job_objects:
+            object.select_set(False)
+        view_layer.objects.active = None
+        for object in fake_bpy.data.objects:
+            object.select_set(False)
+        for object in original_selection:
+            object.select_set(True)
+        view_layer.objects.active = original_active
+    def selection_delta():
+        selection_state = cache.SelectionState(view_layer)
+        selection_state.deselect_all()
+        for object in bake_job_objects:
+            selection_state.select(object)
+        selection_state.set_active(bake_job_objects[-1])
+        for object in bake_job_objects:
+            selection_state.select(object, False)
+        selection_state.set_active(None)
+        selection_state.restore()
+    for name, function in (("selection_full_walk", selection_full_walk), ("selection_delta", selection_delta)):
+        view_layer.objects.selection_writes = 0
+        results[name] = measure(function, args.repeat, 1)
+        results[name]["selection_writes_per_call"] = view_layer.objects.selection_writes / args.repeat
+
+    return {"python":     sys.version.split()[0],
+            "parameters": {"depth":               args.depth,
+                           "properties":          args.properties,
+                           "branching":           args.branching,
+                           "overrides":           args.overrides,
+                           "nodes":               args.nodes,
+                           "passes_per_material": args.passes_per_material,
+                           "objects":             args.objects,
+                           "selected":            args.selected,
+                           "repeat":              args.repeat,
+                           "number":              args.number},
+            "results":    results}
+
+def compare_to_baseline(report, baseline, threshold):
+    """Get a message for every benchmark whose median is slower than the baseline by more than the threshold"""
+    regressions = []
+    for name, result in report["results"].items():
+        baseline_result = baseline["results"].get(name)
+        if baseline_result and result["median_us"] > baseline_result["median_us"] * threshold:
+            regressions.append("{n}: {m:.1f}us, baseline {b:.1f}us ({r:.2f}x)".format(n = name, m = result["median_us"], b = baseline_result["median_us"], r = result["median_us"] / baseline_result["median_us"]))
+    if baseline.get("parameters") != report["parameters"]:
+        regressions.insert(0, "Warning: the baseline was run with different parameters {p}".format(p = baseline.get("parameters")))
+    return regressions
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(description = "Benchmark CachedProperties and the bake rig without launching Blender.")
+    parser.add_argument("--depth", type = int, default = 2, help = "Number of levels of nested PointerProperty structs")
+    parser.add_argument("--properties", type = int, default = 30, help = "Number of leaf properties in each struct")
+    parser.add_argument("--branching", type = int, default = 2, help = "Number of nested structs in each struct")
+    parser.add_argument("--overrides", type = int, default = 8, help = "Number of properties overridden in the override_scope benchmark")
+    parser.add_argument("--nodes", type = int, default = 20, help = "Number of extra nodes in the benchmark material")
+    parser.add_argument("--passes-per-material", type = int, default = 5, help = "Number of passes the bake rig is retargeted for")
+    parser.add_argument("--objects", type = int, default = 10000, help = "Number of objects in the scene for the selection benchmarks")
+    parser.add_argument("--selected", type = int, default = 3, help = "Number of objects that are selected before the selection benchmarks")
+    parser.add_argument("--repeat", type = int, default = 7, help = "Number of timed repeats, the median is compared to the baseline")
+    parser.add_argument("--number", type = int, default = 50, help = "Number of calls in each repeat")
+    parser.add_argument("--output", default = None, help = "Path to write the JSON results to, they're printed if this isn't set")
+    parser.add_argument("--baseline", default = None, help = "Path to the JSON results of a previous run to compare against")
+    parser.add_argument("--threshold", type = float, default = 1.25, help = "Slowdown ratio against the baseline that counts as a regression")
+    args = parser.parse_args(argv)
+
+    report = run_benchmarks(args)
+    if args.output:
+        with open(args.output, "w") as output_file:
+            json.dump(report, output_file, indent = 4)
+    else:
+        print(json.dumps(report, indent = 4))
+
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            regressions = compare_to_baseline(report, json.load(baseline_file), args.threshold)
+        for regression in regressions:
+            print(regression, file = sys.stderr)
+        return 1 if any(not regression.startswith("Warning") for regression in regressions) else 0
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,145 @@
+"""Check farm.py on plain CPython: split jobs into work units, dispatch them to stand_in_worker.py, and report the failures.
+
+The exit code is 1 if any check fails.
+
+Usage:
+python check_farm.py
+"""
+import importlib.util
+import json
+import os
+import sys
+import tempfile
+
+TOOLS_DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+BAKERY_DIRECTORY = os.path.join(os.path.dirname(TOOLS_DIRECTORY), "bakery")
+STAND_IN_WORKER = os.path.join(TOOLS_DIRECTORY, "stand_in_worker.py")
+
+def load_farm():
+    """Import farm.py by path, the package's __init__ registers the add-on's UI and needs bpy"""
+    spec = importlib.util.spec_from_file_location("farm", os.path.join(BAKERY_DIRECTORY, "farm.py"))
+    farm = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(farm)
+    return farm
+
+def get_worker_command(*arguments):
+    return [sys.executable, STAND_IN_WORKER, "{work_unit}", "{result}"] + list(arguments)
+
+class Checks():
+    def __init__(self):
+        self.failures = []
+
+    def check(self, condition, message):
+        if not condition:
+            self.failures.append(message)
+            print("FAILED: " + message)
+
+def check_split_job(checks, farm):
+    job = {"blend_file": "props.blend", "bake_source": "SELF", "objects": ["Crate", "Barrel"], "active_object": None,
+           "passes": ["Base Color", "Roughness", "Normal"], "texture_set_name": "Props", "export_path": "/textures/", "use_profiling": True}
+    work_units = farm.split_job(job, passes_per_unit = 2)
+    checks.check(len(work_units) == 4, "A Self job with 2 objects and 3 passes, 2 per unit, is split into 4 work units, got {n}".format(n = len(work_units)))
+    checks.check(len(set(work_unit.unit_id for work_unit in work_units)) == len(work_units), "Work unit ids are unique")
+    checks.check([work_unit.passes for work_unit in work_units[:2]] == [["Base Color", "Roughness"], ["Normal"]], "Passes are grouped in order")
+    checks.check(set(work_unit.settings["texture_set_name"] for work_unit in work_units) == {"Props_Crate", "Props_Barrel"}, "Each object of a Self job gets its own texture set")
+    checks.check(all(work_unit.settings.get("use_profiling") for work_unit in work_units), "Settings are forwarded to the work units")
+
+    job.update(bake_source = "SELECTED_TO_ACTIVE", active_object = "Crate")
+    work_units = farm.split_job(job, passes_per_unit = 1)
+    checks.check(len(work_units) == 3, "A Selected to Active job is only split by pass, got {n} work units".format(n = len(work_units)))
+    checks.check(all(work_unit.objects == ["Crate", "Barrel"] and work_unit.active_object == "Crate" for work_unit in work_units), "Every Selected to Active work unit bakes all of the objects")
+
+    work_units = farm.split_job(dict(job, active_object = None))
+    checks.check(all(work_unit.active_object is None for work_unit in work_units), "A Selected to Active job without an active object leaves it to the worker")
+
+    job = {"blend_file": "props.blend", "objects": ["Crate"], "passes": ["Base Color"]}
+    work_units = farm.split_job(job)
+    checks.check(len(work_units) == 1 and work_units[0].bake_source == "SELF", "The bake source defaults to Self, like in headless specs")
+
+    invalid_jobs = [("An unknown bake source",                   dict(job, bake_source = "UI_LIST")),
+                    ("A job that isn't an object",               ["Crate"]),
+                    ("A job without a .blend file",              {key : value for key, value in job.items() if key != "blend_file"}),
+                    ("A job without objects",                    dict(job, objects = [])),
+                    ("Objects that aren't names",                dict(job, objects = "Crate")),
+                    ("An active object that isn't a name",       dict(job, bake_source = "SELECTED_TO_ACTIVE", active_object = 3)),
+                    ("A job without passes",                     {key : value for key, value in job.items() if key != "passes"}),
+                    ("A pass without a name",                    dict(job, passes = [{"file_format": "PNG"}]))]
+    for description, invalid_job in invalid_jobs:
+        try:
+            farm.split_job(invalid_job)
+            checks.check(False, description + " raises ValueError")
+        except ValueError:
+            pass
+
+def check_dispatcher(checks, farm):
+    job = {"blend_file": "props.blend", "bake_source": "SELF", "objects": ["Crate", "Barrel", "Lamp"], "active_object": None,
+           "passes": ["Base Color", "Roughness"], "texture_set_name": "Props"}
+    work_units = farm.split_job(job)
+    dispatcher = farm.FarmDispatcher(worker_command = get_worker_command("--fail", "Barrel", "--crash", "Lamp"), max_workers = 4, timeout = 60)
+    report = dispatcher.run(work_units)
+
+    checks.check(len(report.results) == len(work_units), "Every work unit has a result")
+    checks.check(not report.succeeded, "The report fails if any work unit fails")
+    results = {result.work_unit.objects[0] : [] for result in report.results}
+    for result in report.results:
+        results[result.work_unit.objects[0]].append(result)
+
+    checks.check(all(result.succeeded and result.return_code == 0 for result in results["Crate"]), "Work units that bake succeed")
+    checks.check(any("Baked Props_Crate_BaseColor" in result.messages for result in results["Crate"]), "The worker's messages are kept, got {m}".format(m = [result.messages for result in results["Crate"]]))
+    checks.check(all(result.output == "" for result in results["Crate"]), "The output of work units that succeed isn't kept")
+
+    checks.check(all(not result.succeeded and result.return_code == 1 for result in results["Barrel"]), "Cancelled work units fail with the worker's exit code")
+    checks.check(all(result.messages == ["Bake failed for ['Barrel']"] for result in results["Barrel"]), "Cancelled work units report the worker's messages")
+    checks.check(all("Baking work unit" in result.output for result in results["Barrel"]), "The output of failed work units is kept")
+
+    checks.check(all(not result.succeeded and result.return_code == 3 for result in results["Lamp"]), "Crashed work units fail")
+    checks.check(all(result.messages and result.messages[0].startswith("Worker did not write a valid result") for result in results["Lamp"]), "Crashed work units report the missing result")
+
+    report_dictionary = report.to_dict()
+    checks.check(report_dictionary["summary"].startswith("2 of 6 work units succeeded"), "The summary counts the work units that succeeded, got \"{s}\"".format(s = report_dictionary["summary"]))
+    checks.check([result["unit_id"] for result in report_dictionary["results"]] == sorted(work_unit.unit_id for work_unit in work_units), "The report is sorted by work unit id")
+
+    # A worker that can't be started is reported instead of raised
+    report = farm.FarmDispatcher(worker_command = [os.path.join(TOOLS_DIRECTORY, "missing_worker"), "{work_unit}", "{result}"]).run(work_units[:1])
+    checks.check(report.results[0].messages[0].startswith("Worker could not be started"), "A worker that can't be started is reported")
+
+    # Workers that run for too long are killed
+    report = farm.FarmDispatcher(worker_command = get_worker_command("--duration", "5"), timeout = 0.5).run(work_units[:1])
+    checks.check(report.results[0].messages == ["Timed out after 0.5s"], "A worker that times out is reported, got {m}".format(m = report.results[0].messages))
+
+def check_main(checks, farm):
+    with tempfile.TemporaryDirectory() as directory:
+        job_path = os.path.join(directory, "job.json")
+        report_path = os.path.join(directory, "report.json")
+        with open(job_path, "w") as job_file:
+            json.dump({"blend_file": "props.blend", "bake_source": "SELF", "objects": ["Crate", "Barrel"], "active_object": None, "passes": ["Base Color"]}, job_file)
+
+        worker_command = " ".join('"{a}"'.format(a = argument) for argument in get_worker_command())
+        exit_code = farm.main([job_path, "--workers", "2", "--worker-command", worker_command, "--report", report_path])
+        checks.check(exit_code == 0, "main() returns 0 when every work unit succeeds, got {c}".format(c = exit_code))
+
+        exit_code = farm.main([job_path, "--worker-command", worker_command + " --fail Barrel", "--report", report_path])
+        checks.check(exit_code == 1, "main() returns 1 when a work unit fails, got {c}".format(c = exit_code))
+        with open(report_path) as report_file:
+            report = json.load(report_file)
+        checks.check([result["objects"] for result in report["results"] if not result["succeeded"]] == [["Barrel"]], "The report file lists the failed work units")
+
+        with open(job_path, "w") as job_file:
+            json.dump({"blend_file": "props.blend", "bake_source": "SELECTED_TO_ACTIVE", "objects": ["Crate"], "active_object": ["Crate"], "passes": ["Base Color"]}, job_file)
+        exit_code = farm.main([job_path, "--worker-command", worker_command])
+        checks.check(exit_code == 2, "main() returns 2 when the job isn't valid, got {c}".format(c = exit_code))
+
+def main():
+    farm = load_farm()
+    checks = Checks()
+    check_split_job(checks, farm)
+    check_dispatcher(checks, farm)
+    check_main(checks, farm)
+    if checks.failures:
+        print("{n} farm checks failed".format(n = len(checks.failures)))
+        return 1
+    print("All farm checks passed")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
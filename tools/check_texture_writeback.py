@@ -0,0 +1,100 @@
+"""Check that the texture writeback writes the same pixels as Image.save_render() with the image settings of a bake.
+
+Every file format and color depth that the writeback supports is written both ways, for color textures and for data textures,
+then both files are loaded back into Blender and their pixels are compared. The exit code is 1 if any of them differ by more than a step of the color depth.
+This has to run inside of Blender, the writeback is only used for the textures that it writes the same way Blender does.
+
+Usage:
+blender --background --factory-startup --python check_texture_writeback.py
+"""
+import importlib.util
+import os
+import sys
+import tempfile
+
+import bpy
+import numpy
+
+BAKERY_DIRECTORY = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "bakery")
+TEXTURE_SIZE = 64
+EXTENSIONS = {"PNG": ".png", "TIFF": ".tif", "TARGA": ".tga"}
+
+def load_texture_writeback():
+    """Import texture_writeback.py by path, it doesn't need the rest of the add-on"""
+    spec = importlib.util.spec_from_file_location("texture_writeback", os.path.join(BAKERY_DIRECTORY, "texture_writeback.py"))
+    texture_writeback = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(texture_writeback)
+    return texture_writeback
+
+def apply_image_settings(scene, file_format, color_depth, is_color):
+    """Set up the output image settings the same way setup_image_settings() and set_display_device() do for a bake"""
+    image_settings = scene.render.image_settings
+    image_settings.file_format = file_format
+    image_settings.color_mode = 'RGB'
+    image_settings.color_depth = color_depth
+    if file_format == "TIFF":
+        image_settings.tiff_codec = 'DEFLATE'
+    image_settings.color_management = 'OVERRIDE'
+    image_settings.view_settings.view_transform = 'Raw'
+    image_settings.view_settings.look = 'None'
+    image_settings.view_settings.use_curve_mapping = False
+    image_settings.linear_colorspace_settings.name = 'sRGB' if is_color else 'Non-Color'
+    scene.display_settings.display_device = 'sRGB' if is_color else 'XYZ'
+
+def make_baked_image(color_depth, is_color):
+    """Create an image like the bake leases: a float buffer for color depths above 8, with values that reach past 0 and 1 like a bake can"""
+    image = bpy.data.images.new("CheckWriteback", TEXTURE_SIZE, TEXTURE_SIZE, float_buffer = color_depth != '8')
+    image.colorspace_settings.name = 'sRGB' if is_color else 'Non-Color'
+    ramp = numpy.linspace(-0.1, 1.1, TEXTURE_SIZE * TEXTURE_SIZE, dtype = numpy.float32)
+    pixels = numpy.stack((ramp, ramp[::-1], (ramp * 7.0) % 1.0, numpy.ones_like(ramp)), axis = -1)
+    image.pixels.foreach_set(pixels.ravel())
+    return image
+
+def read_pixels(filepath):
+    image = bpy.data.images.load(filepath)
+    pixels = numpy.empty(image.size[0] * image.size[1] * 4, dtype = numpy.float32)
+    image.pixels.foreach_get(pixels)
+    size = tuple(image.size)
+    bpy.data.images.remove(image)
+    return size, pixels
+
+def main():
+    texture_writeback = load_texture_writeback()
+    scene = bpy.context.scene
+    failures = []
+    with tempfile.TemporaryDirectory() as directory:
+        for file_format, color_depth in sorted(texture_writeback.SUPPORTED_FORMATS):
+            for is_color in (True, False):
+                name = "{f} {d} bit {c}".format(f = file_format, d = color_depth, c = "color" if is_color else "data")
+                apply_image_settings(scene, file_format, color_depth, is_color)
+                image = make_baked_image(color_depth, is_color)
+
+                expected_path = os.path.join(directory, "save_render" + EXTENSIONS[file_format])
+                image.save_render(filepath = expected_path, scene = scene)
+
+                written_path = os.path.join(directory, "writeback" + EXTENSIONS[file_format])
+                encode_srgb = image.is_float and image.colorspace_settings.name == 'sRGB' # The same test as save_baking_texture()
+                pixels = numpy.empty(TEXTURE_SIZE * TEXTURE_SIZE * 4, dtype = numpy.float32)
+                image.pixels.foreach_get(pixels)
+                texture_writeback.write_texture(pixels, TEXTURE_SIZE, TEXTURE_SIZE, written_path, file_format, color_depth, encode_srgb = encode_srgb)
+                bpy.data.images.remove(image)
+
+                expected_size, expected = read_pixels(expected_path)
+                written_size, written = read_pixels(written_path)
+                if expected_size != written_size:
+                    failures.append("{n}: the writeback wrote a {w} texture, save_render() wrote {e}".format(n = name, w = written_size, e = expected_size))
+                    continue
+                difference = numpy.abs(expected - written).max()
+                if difference > 1.0 / ((1 << int(color_depth)) - 1) + 1e-6:
+                    failures.append("{n}: the pixels differ from save_render() by up to {d:.5f}".format(n = name, d = difference))
+
+    for failure in failures:
+        print("FAILED: " + failure)
+    if failures:
+        print("{n} texture writeback checks failed".format(n = len(failures)))
+        return 1
+    print("All texture writeback checks passed")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
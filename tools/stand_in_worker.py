@@ -0,0 +1,54 @@
+"""A stand-in for farm_worker.py that runs on plain CPython, so farm.py can be tried out without Blender.
+
+It reads a work unit, pretends to bake it, and writes a result the same way farm_worker.py does.
+Work units can be made to fail, to check how the dispatcher reports failures:
+--fail OBJECT   The bake of any work unit with this object is cancelled, like a failed bake in Blender (exit code 1, with a result)
+--crash OBJECT  The worker exits without writing a result, like Blender crashing (exit code 3)
+
+Usage:
+python farm.py job.json --worker-command "python stand_in_worker.py {work_unit} {result} --fail Barrel"
+"""
+import argparse
+import json
+import sys
+import time
+
+EXIT_FINISHED = 0
+EXIT_CANCELLED = 1
+EXIT_CRASHED = 3
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(description = "Pretend to bake a farm work unit.")
+    parser.add_argument("work_unit", help = "Path to the work unit JSON file")
+    parser.add_argument("result", help = "Path to write the result JSON file to")
+    parser.add_argument("--fail", action = "append", default = [], help = "Cancel the bake of work units with this object")
+    parser.add_argument("--crash", action = "append", default = [], help = "Exit without a result for work units with this object")
+    parser.add_argument("--duration", type = float, default = 0.0, help = "Seconds to spend on each pass")
+    args = parser.parse_args(argv)
+
+    with open(args.work_unit) as work_unit_file:
+        work_unit = json.load(work_unit_file)
+    print("Baking work unit {i}: objects {o}, passes {p}".format(i = work_unit["unit_id"], o = work_unit["objects"], p = work_unit["passes"]))
+
+    if set(work_unit["objects"]) & set(args.crash):
+        print("Crashed")
+        return EXIT_CRASHED
+
+    if set(work_unit["objects"]) & set(args.fail):
+        exit_code, messages = EXIT_CANCELLED, ["Bake failed for {o}".format(o = sorted(set(work_unit["objects"]) & set(args.fail)))]
+    else:
+        texture_set_name = work_unit["settings"].get("texture_set_name", "BakedTexture")
+        delimiter = work_unit["settings"].get("texture_name_delimiter", "_")
+        messages = []
+        for pass_name in work_unit["passes"]:
+            time.sleep(args.duration)
+            messages.append("Baked {t}".format(t = delimiter.join([texture_set_name, pass_name.replace(" ", "")])))
+        exit_code = EXIT_FINISHED
+
+    result = {"unit_id": work_unit["unit_id"], "status": "FINISHED" if exit_code == EXIT_FINISHED else "CANCELLED", "exit_code": exit_code, "messages": messages}
+    with open(args.result, "w") as result_file:
+        json.dump(result, result_file, indent = 4)
+    return exit_code
+
+if __name__ == "__main__":
+    sys.exit(main())